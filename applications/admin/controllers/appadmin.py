@@ -455,6 +455,9 @@ def ccache():
                 ram['oldest'] = value[0]
             ram['keys'].append((key, GetInHMS(time.time() - value[0])))
 
+        # add the hits and misses counted in memory by this process
+        if hasattr(cache.disk, 'flush_stats'):
+            cache.disk.flush_stats()
         for key in cache.disk.storage:
             value = cache.disk.storage[key]
             if key == 'web2py_cache_statistics' and isinstance(value[1], dict):
@@ -16,7 +16,7 @@ import importlib
 
 from gluon.admin import *
 from gluon.admin import check_app_path, is_within_root, join_app_path
-from gluon.fileutils import abspath, read_file, write_file
+from gluon.fileutils import abspath, app_registry, read_file, write_file
 from gluon.http import content_disposition_header
 from gluon.restricted import safe_load, safe_loads, TicketStorage
 from gluon.utils import web2py_uuid
@@ -591,10 +591,12 @@ def enable():
         return SPAN(T('Not supported'), _style='color:yellow')
     elif os.path.exists(filename):
         os.unlink(filename)
+        app_registry.invalidate(apath(app, r=request))
         return SPAN(T('Disable'), _style='color:green')
     else:
         str_ = 'disabled: True\ntime-disabled: %s' % request.now
         safe_open(filename, 'wb').write(str_.encode('utf-8'))
+        app_registry.invalidate(apath(app, r=request))
         return SPAN(T('Enable'), _style='color:red')
 
 
@@ -75,6 +75,7 @@ response.form_label_separator = ""
 # -------------------------------------------------------------------------
 # response.optimize_css = "concat,minify,inline"
 # response.optimize_js = "concat,minify,inline"
+# without inline, add "precompress" to also write the .gz/.br/.zst files
 
 # -------------------------------------------------------------------------
 # (optional) static assets folder versioning
@@ -21,6 +21,7 @@ from shutil import copyfileobj, rmtree
 from gluon.cache import CacheOnDisk
 from gluon.fileutils import (
     abspath,
+    app_registry,
     create_app,
     fix_newlines,
     parse_version,
@@ -238,6 +239,7 @@ def app_create(app, request, force=False, key=None, info=False):
             return False
     try:
         create_app(path)
+        app_registry.invalidate(path)
         if info:
             return True, None
         else:
@@ -289,6 +291,7 @@ def app_install(app, fobj, request, filename, overwrite=None):
         if extension != "tar":
             os.unlink(upname)
         fix_newlines(path)
+        app_registry.invalidate(path)
         return upname
     except Exception:
         if did_mkdir:
@@ -311,6 +314,7 @@ def app_uninstall(app, request):
         # Hey App, this is your end...
         path = apath(app, request)
         rmtree(path)
+        app_registry.invalidate(path)
         return True
     except Exception:
         return False
@@ -364,6 +368,7 @@ def plugin_install(app, fobj, request, filename):
         path = apath(app, request)
         w2p_unpack_plugin(upname, path)
         fix_newlines(path)
+        app_registry.invalidate(path)
         return upname
     except Exception:
         if upname and os.path.exists(upname):
@@ -12,6 +12,8 @@ Basic caching classes and methods
 - Cache - The generic caching object interfacing with the others
 - CacheInRam - providing caching in ram
 - CacheOnDisk - provides caches on disk
+- CacheOnSQLite - provides caches on disk, in a single SQLite file
+- CacheTiered - provides caches in ram in front of a shared cache
 
 Memcache is also available via a different module (see gluon.contrib.memcache)
 
@@ -29,12 +31,16 @@ import os
 import pickle
 import random
 import re
+import sqlite3
 import sys
 import tempfile
+import threading
 import time
 from collections import OrderedDict, defaultdict
+from itertools import islice
 
 from gluon import recfile
+from gluon.storage import Storage
 
 try:
     from gluon import settings
@@ -82,6 +88,34 @@ def remove_oldest_entries(storage, percentage=90):
         old_mem = new_mem
 
 
+def approximate_size(value, depth=4, sample=100):
+    """
+    Estimates the memory used by `value` following up to `depth` levels of
+    containers and object attributes. Large containers are estimated from
+    their first `sample` items.
+    """
+    size = sys.getsizeof(value)
+    if depth <= 0 or isinstance(value, (str, bytes, int, float)):
+        return size
+    if isinstance(value, dict):
+        items = islice(value.items(), sample)
+        estimate = lambda item: (
+            approximate_size(item[0], depth - 1, sample)
+            + approximate_size(item[1], depth - 1, sample)
+        )
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = islice(value, sample)
+        estimate = lambda item: approximate_size(item, depth - 1, sample)
+    elif hasattr(value, "__dict__"):
+        return size + approximate_size(value.__dict__, depth - 1, sample)
+    else:
+        return size
+    sizes = [estimate(item) for item in items]
+    if sizes:
+        size += sum(sizes) * len(value) // len(sizes)
+    return size
+
+
 logger = logging.getLogger("web2py.cache")
 
 __all__ = ["Cache", "lazy_cache"]
@@ -111,7 +145,12 @@ class CacheAbstract(object):
     """
 
     cache_stats_name = "web2py_cache_statistics"
+    # prefix of the keys that CacheOnDisk uses to store the keys of a tag
+    tag_prefix = "web2py_cache_tag:"
     max_ram_utilization = None  # percent
+    # seconds past its expiration during which a value is still returned
+    # while another caller recomputes it (None to wait for the new value)
+    stale_while_revalidate = None
 
     def __init__(self, request=None):
         """Initializes the object
@@ -164,6 +203,49 @@ class CacheAbstract(object):
         """
         raise NotImplementedError
 
+    def tag(self, key, *tags):
+        """
+        Records that the entry of `key` depends on `tags` (e.g. the names of
+        the tables its value was selected from), so that invalidating any of
+        them deletes it
+
+        Args:
+            key(str): key of the entry
+            tags(str): the tags of the entry
+        """
+        raise NotImplementedError
+
+    def invalidate(self, *tags):
+        """
+        Deletes the entries tagged with any of `tags`. Unlike `clear`, it
+        looks up only the keys of those tags instead of matching every key.
+        Returns the list of the deleted keys.
+
+        Args:
+            tags(str): the tags to invalidate
+        """
+        raise NotImplementedError
+
+    def _single_flight(self, dt):
+        """
+        True if concurrent misses of a key should wait for a single call of
+        the function instead of calling it each, i.e. unless the refresh is
+        forced by `time_expire` <= 0
+        """
+        return dt is None or dt > 0
+
+    def _stale(self, item, dt, now):
+        """
+        True if the expired `item` can be returned while it is recomputed
+        """
+        stale = self.stale_while_revalidate
+        return (
+            item is not None
+            and stale is not None
+            and dt is not None
+            and item[0] > now - dt - stale
+        )
+
     def _clear(self, storage, regex):
         """
         Auxiliary function called by `clear` to search and clear cache entries
@@ -182,16 +264,49 @@ class CacheInRam(CacheAbstract):
     This is implemented as global (per process, shared by all threads)
     dictionary.
     A mutex-lock mechanism avoid conflicts.
+
+    When a key is missing or expired only one thread calls the function, the
+    others wait for its value (or get the expired value if
+    `stale_while_revalidate` allows it).
+
+    Each application keeps at most `max_entries` entries whose values take
+    at most about `max_bytes`, the least recently used are evicted first.
+    If `max_age` is set, every `reap_interval` seconds a background thread
+    deletes the entries stored more than `max_age` seconds ago. The
+    `time_expire` of each call is not a deadline: it only decides whether
+    that call may reuse the stored value (`cache.ram(key, f, 0)` stores a
+    value that later calls with a longer `time_expire` still return).
     """
 
     locker = thread.allocate_lock()
     meta_storage = {}
     stats = {}
+    # events of the values being computed, by (app, key)
+    flights = {}
+    # seconds a thread waits for the value computed by another one before
+    # computing it itself
+    flight_timeout = 60
+    # approximate sizes of the entries, by app and key
+    meta_index = {}
+    # sets of the tagged keys, by app and tag
+    meta_tags = {}
+    # sets of the tags of the keys, by app and key
+    meta_key_tags = {}
+    max_entries = None
+    max_bytes = None
+    max_age = None
+    reap_interval = 60
+    reaper = None
+    # pid of the process that started the reaper (threads do not survive fork)
+    reaper_pid = None
 
     def __init__(self, request=None):
         self.initialized = False
         self.request = request
-        self.storage = OrderedDict() if HAVE_PSUTIL else {}
+        self.storage = OrderedDict()
+        self.index = {}
+        self.tags = {}
+        self.key_tags = {}
         self.app = request.application if request else ""
 
     def initialize(self):
@@ -201,25 +316,47 @@ class CacheInRam(CacheAbstract):
             self.initialized = True
         self.locker.acquire()
         if self.app not in self.meta_storage:
-            self.storage = self.meta_storage[self.app] = (
-                OrderedDict() if HAVE_PSUTIL else {}
-            )
-            self.stats[self.app] = {"hit_total": 0, "misses": 0}
+            self.storage = self.meta_storage[self.app] = OrderedDict()
+            self.index = self.meta_index[self.app] = {}
+            self.tags = self.meta_tags[self.app] = {}
+            self.key_tags = self.meta_key_tags[self.app] = {}
+            self.stats[self.app] = self._new_stats()
         else:
             self.storage = self.meta_storage[self.app]
+            self.index = self.meta_index[self.app]
+            self.tags = self.meta_tags[self.app]
+            self.key_tags = self.meta_key_tags[self.app]
+        if (
+            self.reap_interval
+            and self.max_age is not None
+            and (CacheInRam.reaper is None or CacheInRam.reaper_pid != os.getpid())
+        ):
+            CacheInRam.reaper = threading.Thread(
+                target=self._reaper, name="web2py-cache-reaper"
+            )
+            CacheInRam.reaper.daemon = True
+            CacheInRam.reaper_pid = os.getpid()
+            CacheInRam.reaper.start()
         self.locker.release()
 
+    @staticmethod
+    def _new_stats():
+        return {"hit_total": 0, "misses": 0, "evictions": 0, "expired": 0, "bytes": 0}
+
     def clear(self, regex=None):
         self.initialize()
         self.locker.acquire()
         storage = self.storage
         if regex is None:
             storage.clear()
+            self.tags.clear()
+            self.key_tags.clear()
         else:
             self._clear(storage, regex)
 
         if self.app not in self.stats:
-            self.stats[self.app] = {"hit_total": 0, "misses": 0}
+            self.stats[self.app] = self._new_stats()
+        self._sync_index()
 
         self.locker.release()
 
@@ -245,9 +382,11 @@ class CacheInRam(CacheAbstract):
         self.locker.acquire()
         item = self.storage.get(key, None)
         if item and f is None:
-            del self.storage[key]
+            self._remove(key)
             if destroyer:
                 destroyer(item[1])
+        elif item:
+            self.storage.move_to_end(key)
         self.stats[self.app]["hit_total"] += 1
         self.locker.release()
 
@@ -255,21 +394,166 @@ class CacheInRam(CacheAbstract):
             return None
         if item and (dt is None or item[0] > now - dt):
             return item[1]
+        if self._single_flight(dt):
+            return self._call_once(key, f, dt, now, destroyer)
         elif item and (item[0] < now - dt) and destroyer:
             destroyer(item[1])
         value = f()
+        self._store(key, now, value)
+        return value
 
+    def tag(self, key, *tags):
+        self.initialize()
         self.locker.acquire()
+        if key in self.storage:
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            self.key_tags.setdefault(key, set()).update(tags)
+        self.locker.release()
+
+    def invalidate(self, *tags):
+        self.initialize()
+        self.locker.acquire()
+        keys = set()
+        for tag in tags:
+            keys.update(self.tags.pop(tag, ()))
+        for key in keys:
+            self._remove(key)
+        self.locker.release()
+        return list(keys)
+
+    def _call_once(self, key, f, dt, now, destroyer):
+        """
+        Calls `f` unless another thread is already computing `key`, in which
+        case waits for its value (for at most `flight_timeout` seconds, then
+        calls `f` too)
+        """
+        flight = (self.app, key)
+        while True:
+            self.locker.acquire()
+            item = self.storage.get(key, None)
+            if item and (dt is None or item[0] > now - dt):
+                # computed by another thread meanwhile
+                self.locker.release()
+                return item[1]
+            event = self.flights.get(flight)
+            if event is None:
+                event = self.flights[flight] = threading.Event()
+                self.locker.release()
+                break
+            self.locker.release()
+            if self._stale(item, dt, now):
+                return item[1]
+            if not event.wait(self.flight_timeout):
+                # the other thread is stuck, do not wait for it any longer
+                value = f()
+                self._store(key, now, value)
+                return value
+        try:
+            if item and destroyer:
+                destroyer(item[1])
+            value = f()
+            self._store(key, now, value)
+        finally:
+            self.locker.acquire()
+            if self.flights.get(flight) is event:
+                del self.flights[flight]
+            self.locker.release()
+            event.set()
+        return value
+
+    def _store(self, key, now, value, miss=True):
+        size = approximate_size(value) if self.max_bytes is not None else 0
+        self.locker.acquire()
+        stats = self.stats[self.app]
+        # a refreshed value keeps the tags of the key
+        self._remove(key, untag=False)
         self.storage[key] = (now, value)
-        self.stats[self.app]["misses"] += 1
+        self.index[key] = size
+        stats["bytes"] += size
+        if miss:
+            stats["misses"] += 1
+        while len(self.storage) > 1 and (
+            (self.max_entries is not None and len(self.storage) > self.max_entries)
+            or (self.max_bytes is not None and stats["bytes"] > self.max_bytes)
+        ):
+            self._remove(next(iter(self.storage)))
+            stats["evictions"] += 1
         if (
             HAVE_PSUTIL
             and self.max_ram_utilization is not None
             and random.random() < 0.10
         ):
             remove_oldest_entries(self.storage, percentage=self.max_ram_utilization)
+            self._sync_index()
         self.locker.release()
-        return value
+
+    def _remove(self, key, untag=True):
+        """
+        Deletes `key` if present (must be called holding the locker)
+        """
+        if self.storage.pop(key, None) is not None:
+            self.stats[self.app]["bytes"] -= self.index.pop(key, 0)
+            if untag:
+                self._untag(self.tags, self.key_tags, key)
+
+    @staticmethod
+    def _untag(tags, key_tags, key):
+        """
+        Discards the deleted `key` from the sets of its tags (must be called
+        holding the locker)
+        """
+        for tag in key_tags.pop(key, ()):
+            keys = tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del tags[tag]
+
+    def _sync_index(self):
+        """
+        Forgets the entries deleted from the storage directly (must be called
+        holding the locker)
+        """
+        for key in [key for key in self.index if key not in self.storage]:
+            self.stats[self.app]["bytes"] -= self.index.pop(key)
+            self._untag(self.tags, self.key_tags, key)
+
+    @classmethod
+    def reap(cls, now=None):
+        """
+        Deletes the entries of all the applications stored more than
+        `max_age` seconds ago. Returns the number of deleted entries.
+        """
+        if cls.max_age is None:
+            return 0
+        oldest = (now or time.time()) - cls.max_age
+        reaped = 0
+        for app in list(cls.meta_index):
+            cls.locker.acquire()
+            try:
+                storage, index = cls.meta_storage[app], cls.meta_index[app]
+                stats = cls.stats[app]
+                expired = [key for key, item in storage.items() if item[0] < oldest]
+                for key in expired:
+                    del storage[key]
+                    stats["bytes"] -= index.pop(key, 0)
+                    cls._untag(cls.meta_tags[app], cls.meta_key_tags[app], key)
+                stats["expired"] += len(expired)
+                reaped += len(expired)
+            finally:
+                cls.locker.release()
+        return reaped
+
+    @classmethod
+    def _reaper(cls):
+        while cls.reap_interval and cls.max_age is not None:
+            time.sleep(cls.reap_interval)
+            try:
+                cls.reap()
+            except Exception:
+                logger.exception("cache.ram reaper failed")
+        cls.reaper = None
 
     def increment(self, key, value=1):
         self.initialize()
@@ -277,11 +561,11 @@ class CacheInRam(CacheAbstract):
         try:
             if key in self.storage:
                 value = self.storage[key][1] + value
-            self.storage[key] = (time.time(), value)
         except BaseException as e:
             self.locker.release()
             raise e
         self.locker.release()
+        self._store(key, time.time(), value, miss=False)
         return value
 
 
@@ -296,8 +580,22 @@ class CacheOnDisk(CacheAbstract):
     slower than `CacheInRam`
 
     Values stored in disk cache must be pickable.
+
+    When a key is missing or expired only one thread or process calls the
+    function, the others wait for its value (or get the expired value if
+    `stale_while_revalidate` allows it). Processes synchronize through a lock
+    file per key in the `locks` sub-folder.
+
+    Hits and misses are counted in memory by each process and added to the
+    statistics file at most every `stats_interval` seconds (or by
+    `flush_stats`), so that processes do not serialize on that file.
     """
 
+    stats_interval = 10
+    stats_locker = thread.allocate_lock()
+    # hits and misses not flushed yet, by cache folder
+    pending_stats = {}
+
     class PersistentStorage(object):
         """
         Implements a key based thread/process-safe safe storage in disk.
@@ -349,6 +647,45 @@ class CacheOnDisk(CacheAbstract):
         def release(self, key):
             self.file_locks[key].release()
 
+        def acquire_flight(self, key, blocking=True):
+            """
+            Locks `key` across processes while its value is computed.
+            Returns the lock file, or None if not `blocking` and another
+            process holds the lock. The lock file is deleted when released.
+            """
+            key = self.key_filter_in(key)
+            flags = portalocker.LOCK_EX
+            if not blocking:
+                flags |= portalocker.LOCK_NB
+            while True:
+                lock_file = recfile.open(
+                    key, mode="wb", path=os.path.join(self.folder, "locks")
+                )
+                try:
+                    portalocker.lock(lock_file, flags)
+                except (IOError, OSError):
+                    lock_file.close()
+                    return None
+                try:
+                    # the previous holder may have deleted the file meanwhile
+                    if os.path.samestat(
+                        os.fstat(lock_file.fileno()), os.stat(lock_file.name)
+                    ):
+                        return lock_file
+                except OSError:
+                    pass
+                portalocker.unlock(lock_file)
+                lock_file.close()
+
+        def release_flight(self, lock_file):
+            try:
+                os.unlink(lock_file.name)
+            except OSError:
+                # e.g. open files cannot be deleted on windows
+                pass
+            portalocker.unlock(lock_file)
+            lock_file.close()
+
         def __setitem__(self, key, value):
             key = self.key_filter_in(key)
             val_file = recfile.open(key, mode="wb", path=self.folder)
@@ -381,8 +718,51 @@ class CacheOnDisk(CacheAbstract):
             except IOError:
                 raise KeyError
 
+        def set(self, key, value, time_expire=None):
+            self[key] = value
+
+        def tag(self, key, tags):
+            """
+            Adds `key` to the set of keys of each tag, dropping the keys
+            deleted since they were tagged
+            """
+
+            def add(keys):
+                folder, key_filter_in = self.folder, self.key_filter_in
+                keys = {
+                    k for k in keys if recfile.exists(key_filter_in(k), path=folder)
+                }
+                return keys | {key}
+
+            for tag in tags:
+                tag_key = CacheAbstract.tag_prefix + tag
+                self.acquire(tag_key)
+                try:
+                    self.safe_apply(tag_key, add, default_value=set())
+                finally:
+                    self.release(tag_key)
+
+        def untag(self, tags):
+            """
+            Empties the sets of keys of `tags`, returns the keys they had
+            """
+            keys = set()
+            for tag in tags:
+                tag_key = CacheAbstract.tag_prefix + tag
+                self.acquire(tag_key)
+                try:
+                    self.safe_apply(
+                        tag_key, lambda v: keys.update(v) or set(), default_value=set()
+                    )
+                finally:
+                    self.release(tag_key)
+            return keys
+
         def __iter__(self):
             for dirpath, dirnames, filenames in os.walk(self.folder):
+                if dirpath == self.folder:
+                    # not keys but lock files and CacheOnSQLite
+                    dirnames[:] = [d for d in dirnames if d not in ("locks", "sqlite")]
                 for filename in filenames:
                     yield self.key_filter_out(filename)
 
@@ -446,20 +826,58 @@ class CacheOnDisk(CacheAbstract):
 
         self.storage = CacheOnDisk.PersistentStorage(folder)
 
-    def __call__(self, key, f, time_expire=DEFAULT_TIME_EXPIRE):
+    def _count(self, hits=0, misses=0):
+        """
+        Counts hits and misses, flushing them every `stats_interval` seconds
+        """
+        now = time.time()
+        self.stats_locker.acquire()
+        stats = self.pending_stats.get(self.storage.folder)
+        if stats is None:
+            stats = self.pending_stats[self.storage.folder] = {
+                "hit_total": 0,
+                "misses": 0,
+                "flushed": now,
+            }
+        stats["hit_total"] += hits
+        stats["misses"] += misses
+        flush = now - stats["flushed"] >= self.stats_interval
+        self.stats_locker.release()
+        if flush:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """
+        Adds the hits and misses counted by this process to the statistics
+        file
+        """
         self.initialize()
+        self.stats_locker.acquire()
+        stats = self.pending_stats.pop(self.storage.folder, None)
+        self.stats_locker.release()
+        if not stats or not (stats["hit_total"] or stats["misses"]):
+            return
 
-        def inc_hit_total(v):
-            v["hit_total"] += 1
+        def add(v):
+            v["hit_total"] += stats["hit_total"]
+            v["misses"] += stats["misses"]
             return v
 
-        def inc_misses(v):
-            v["misses"] += 1
-            return v
+        self.storage.acquire(CacheAbstract.cache_stats_name)
+        try:
+            self.storage.safe_apply(
+                CacheAbstract.cache_stats_name,
+                add,
+                default_value={"hit_total": 0, "misses": 0},
+            )
+        finally:
+            self.storage.release(CacheAbstract.cache_stats_name)
+
+    def __call__(self, key, f, time_expire=DEFAULT_TIME_EXPIRE):
+        self.initialize()
 
         dt = time_expire
         self.storage.acquire(key)
-        self.storage.acquire(CacheAbstract.cache_stats_name)
 
         try:
             item = self.storage.get(key)
@@ -467,41 +885,48 @@ class CacheOnDisk(CacheAbstract):
             del self.storage[key]
             item = self.storage.get(key)
 
-        self.storage.safe_apply(
-            CacheAbstract.cache_stats_name,
-            inc_hit_total,
-            default_value={"hit_total": 0, "misses": 0},
-        )
-
         if item and f is None:
             del self.storage[key]
 
         if f is None:
-            self.storage.release(CacheAbstract.cache_stats_name)
             self.storage.release(key)
+            self._count(hits=1)
             return None
 
         now = time.time()
+        misses = 0
 
-        if item and ((dt is None) or (item[0] > now - dt)):
-            value = item[1]
-        else:
+        try:
+            if item and ((dt is None) or (item[0] > now - dt)):
+                return item[1]
+            flight = None
+            if self._single_flight(dt):
+                # other threads wait for self.storage.acquire(key)
+                flight = self.storage.acquire_flight(
+                    key, blocking=not self._stale(item, dt, now)
+                )
+                if flight is None:
+                    # another process is computing it
+                    return item[1]
             try:
+                if flight:
+                    try:
+                        item = self.storage.get(key)
+                    except Exception:
+                        item = None
+                    if item and ((dt is None) or (item[0] > now - dt)):
+                        # computed by another process meanwhile
+                        return item[1]
                 value = f()
-            except:
-                self.storage.release(CacheAbstract.cache_stats_name)
-                self.storage.release(key)
-                raise
-            self.storage[key] = (now, value)
-            self.storage.safe_apply(
-                CacheAbstract.cache_stats_name,
-                inc_misses,
-                default_value={"hit_total": 0, "misses": 0},
-            )
-
-        self.storage.release(CacheAbstract.cache_stats_name)
-        self.storage.release(key)
-        return value
+                self.storage.set(key, (now, value), dt)
+            finally:
+                if flight:
+                    self.storage.release_flight(flight)
+            misses = 1
+            return value
+        finally:
+            self.storage.release(key)
+            self._count(hits=1, misses=misses)
 
     def clear(self, regex=None):
         self.initialize()
@@ -526,6 +951,407 @@ class CacheOnDisk(CacheAbstract):
         self.storage.release(key)
         return value
 
+    def tag(self, key, *tags):
+        self.initialize()
+        self.storage.tag(key, tags)
+
+    def invalidate(self, *tags):
+        self.initialize()
+        storage = self.storage
+        keys = storage.untag(tags)
+        for key in keys:
+            storage.acquire(key)
+            try:
+                del storage[key]
+            except KeyError:
+                pass
+            storage.release(key)
+        return list(keys)
+
+
+class CacheOnSQLite(CacheOnDisk):
+    """
+    Disk based cache stored in a single SQLite file
+
+    This is a `CacheOnDisk` that stores all the keys in `cache/sqlite/cache.db`
+    instead of one file per key. The file is shared by all the processes.
+    When the values take more than `max_bytes`, the entries older than the
+    `time_expire` they were stored with are deleted, then the least recently
+    used ones.
+
+    Usage example: put in models::
+
+        from gluon.cache import CacheOnSQLite
+        cache.disk = CacheOnSQLite(request, max_bytes=256 * 2**20)
+    """
+
+    class SQLiteStorage(object):
+        """
+        Implements the `PersistentStorage` interface in a SQLite database.
+        """
+
+        # seconds between the updates of the last access time of a key
+        touch_interval = 10
+        # seconds after which the lock of a process computing a value is
+        # considered abandoned
+        flight_lease = 60
+        flight_wait = 0.05
+
+        def __init__(self, folder, max_bytes=None, mmap_size=2**28):
+            self.folder = folder
+            self.filename = os.path.join(folder, "cache.db")
+            self.max_bytes = max_bytes
+            self.mmap_size = mmap_size
+            self.file_locks = defaultdict(thread.allocate_lock)
+            self.local = threading.local()
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            db = self.db
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY, value BLOB, size INTEGER,
+                    expires REAL, accessed REAL);
+                CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed);
+                CREATE INDEX IF NOT EXISTS cache_expires ON cache(expires);
+                CREATE TABLE IF NOT EXISTS cache_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER);
+                INSERT OR IGNORE INTO cache_size VALUES (0, 0);
+                CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+                BEGIN UPDATE cache_size SET bytes = bytes + new.size; END;
+                CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+                BEGIN UPDATE cache_size SET bytes = bytes + new.size - old.size; END;
+                CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+                BEGIN UPDATE cache_size SET bytes = bytes - old.size; END;
+                CREATE TABLE IF NOT EXISTS cache_flights (
+                    key TEXT PRIMARY KEY, expires REAL);
+                CREATE TABLE IF NOT EXISTS cache_tags (
+                    tag TEXT, key TEXT, PRIMARY KEY (tag, key)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS cache_tags_key ON cache_tags(key);
+                CREATE TRIGGER IF NOT EXISTS cache_untag AFTER DELETE ON cache
+                BEGIN DELETE FROM cache_tags WHERE key = old.key; END;
+                """)
+
+        @property
+        def db(self):
+            """
+            The connection of the current thread
+            """
+            db = getattr(self.local, "db", None)
+            if db is None:
+                db = self.local.db = sqlite3.connect(
+                    self.filename, timeout=60, isolation_level=None
+                )
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("PRAGMA mmap_size=%d" % self.mmap_size)
+            return db
+
+        def acquire(self, key):
+            self.file_locks[key].acquire()
+
+        def release(self, key):
+            self.file_locks[key].release()
+
+        def acquire_flight(self, key, blocking=True):
+            """
+            Leases `key` across processes while its value is computed.
+            Returns the lease, or None if not `blocking` and another process
+            holds it.
+            """
+            while True:
+                now = time.time()
+                cursor = self.db.execute(
+                    "INSERT INTO cache_flights VALUES (?, ?) ON CONFLICT(key) "
+                    "DO UPDATE SET expires = excluded.expires "
+                    "WHERE cache_flights.expires < ?",
+                    (key, now + self.flight_lease, now),
+                )
+                if cursor.rowcount:
+                    return (key,)
+                if not blocking:
+                    return None
+                time.sleep(self.flight_wait)
+
+        def release_flight(self, lease):
+            self.db.execute("DELETE FROM cache_flights WHERE key = ?", lease)
+
+        def get(self, key, default=None):
+            row = self.db.execute(
+                "SELECT value, accessed FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return default
+            now = time.time()
+            if row[1] < now - self.touch_interval:
+                self.db.execute(
+                    "UPDATE cache SET accessed = ? WHERE key = ?", (now, key)
+                )
+            return pickle.loads(row[0])
+
+        def __getitem__(self, key):
+            value = self.get(key, self)
+            if value is self:
+                raise KeyError
+            return value
+
+        def set(self, key, value, time_expire=None):
+            """
+            Stores `value`, which expires after `time_expire` seconds
+            (or when evicted, if None)
+            """
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            now = time.time()
+            expires = None if time_expire is None else now + time_expire
+            self.db.execute(
+                "INSERT INTO cache VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO "
+                "UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires = excluded.expires, accessed = excluded.accessed",
+                (key, sqlite3.Binary(data), len(key) + len(data), expires, now),
+            )
+            if self.max_bytes is not None:
+                self.evict(self.max_bytes)
+
+        __setitem__ = set
+
+        def evict(self, max_bytes):
+            """
+            Deletes the expired entries and then the least recently used ones
+            until the values take at most `max_bytes`
+            """
+            db = self.db
+            size = db.execute("SELECT bytes FROM cache_size").fetchone()[0]
+            if size <= max_bytes:
+                return
+            db.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            while True:
+                size = db.execute("SELECT bytes FROM cache_size").fetchone()[0]
+                if size <= max_bytes:
+                    break
+                keys, freed = [], 0
+                for key, entry_size in db.execute(
+                    "SELECT key, size FROM cache ORDER BY accessed LIMIT 100"
+                ):
+                    keys.append((key,))
+                    freed += entry_size
+                    if size - freed <= max_bytes:
+                        break
+                if not keys:
+                    break
+                db.executemany("DELETE FROM cache WHERE key = ?", keys)
+
+        def __delitem__(self, key):
+            if not self.db.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount:
+                raise KeyError
+
+        def __contains__(self, key):
+            return bool(
+                self.db.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+            )
+
+        def __iter__(self):
+            return iter(self.keys())
+
+        def keys(self):
+            return [row[0] for row in self.db.execute("SELECT key FROM cache")]
+
+        def delete(self, keys):
+            self.db.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+
+        def tag(self, key, tags):
+            self.db.executemany(
+                "INSERT OR IGNORE INTO cache_tags VALUES (?, ?)",
+                [(tag, key) for tag in tags],
+            )
+
+        def untag(self, tags):
+            db = self.db
+            keys = set()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for tag in tags:
+                    keys.update(
+                        row[0]
+                        for row in db.execute(
+                            "SELECT key FROM cache_tags WHERE tag = ?", (tag,)
+                        )
+                    )
+                    db.execute("DELETE FROM cache_tags WHERE tag = ?", (tag,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return keys
+
+        def safe_apply(self, key, function, default_value=None):
+            """
+            Atomically applies `function` to the value of a key and stores the
+            result, which is returned
+            """
+            db = self.db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT value FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                value = pickle.loads(row[0])[1] if row else default_value
+                new_value = function(value)
+                self.set(key, (time.time(), new_value))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return new_value
+
+    def __init__(self, request=None, folder=None, max_bytes=64 * 2**20):
+        CacheOnDisk.__init__(self, request, folder)
+        self.max_bytes = max_bytes
+
+    def initialize(self):
+        if self.initialized:
+            return
+        CacheOnDisk.initialize(self)
+        self.storage = CacheOnSQLite.SQLiteStorage(
+            os.path.join(self.storage.folder, "sqlite"), self.max_bytes
+        )
+
+    def clear(self, regex=None):
+        self.initialize()
+        if regex is None:
+            self.storage.db.execute("DELETE FROM cache")
+            self.storage.db.execute("DELETE FROM cache_tags")
+        else:
+            r = re.compile(regex)
+            self.storage.delete([key for key in self.storage if r.match(key)])
+
+    def invalidate(self, *tags):
+        self.initialize()
+        keys = self.storage.untag(tags)
+        self.storage.delete(keys)
+        return list(keys)
+
+
+class CacheTiered(CacheAbstract):
+    """
+    Two level caching: a short lived per process CacheInRam (L1) in front of
+    a cache shared by the processes (L2), e.g. cache.disk (the default) or a
+    RedisCache
+
+    Values are computed and stored through the L2 and kept in the L1 for at
+    most `l1_expire` seconds, None values for at most `negative_expire`
+    seconds. Keys cleared in a process are cleared from the L1 of the other
+    processes within `sync_interval` seconds: `clear` publishes the regex in
+    the L2 and increments a generation counter there, that every process
+    checks.
+
+    Usage example: put in models::
+
+        from gluon.cache import CacheTiered
+        cache.tiered = CacheTiered(request, cache.disk)
+    """
+
+    generation_key = "web2py_cache_tiered:generation"
+    sync_interval = 1
+    # generation and time of the last check, by L1 application
+    synced = {}
+
+    def __init__(self, request=None, l2=None, l1_expire=5, negative_expire=1):
+        self.request = request
+        self.l2 = l2 or CacheOnDisk(request)
+        self.app = "%s:tiered" % (request.application if request else "")
+        self.l1 = CacheInRam(Storage(application=self.app))
+        self.l1_expire = l1_expire
+        self.negative_expire = negative_expire
+
+    def __call__(self, key, f, time_expire=DEFAULT_TIME_EXPIRE):
+        self.sync()
+        if f is None:
+            self.l1(key, None)
+            self.l2(key, None)
+            self.publish("^%s$" % re.escape(key))
+            return None
+        dt = self.l1_expire
+        if time_expire is not None:
+            dt = min(dt, time_expire)
+        self.l1.initialize()
+        item = self.l1.storage.get(key)
+        if item is not None and item[1] is None:
+            dt = min(dt, self.negative_expire)
+        return self.l1(key, lambda: self.l2(key, f, time_expire), dt)
+
+    def clear(self, regex=None):
+        self.l1.clear(regex)
+        self.l2.clear(".*" if regex is None else regex)
+        self.publish(regex)
+
+    def increment(self, key, value=1):
+        value = self.l2.increment(key, value)
+        self.l1(key, None)
+        self.publish("^%s$" % re.escape(key))
+        return value
+
+    def tag(self, key, *tags):
+        self.l1.tag(key, *tags)
+        self.l2.tag(key, *tags)
+
+    def invalidate(self, *tags):
+        self.l1.invalidate(*tags)
+        keys = self.l2.invalidate(*tags)
+        if keys:
+            regex = "^(?:%s)$" % "|".join(re.escape(key) for key in keys)
+            self.l1.clear(regex)
+            self.publish(regex)
+        return keys
+
+    def publish(self, regex):
+        """
+        Makes the other processes clear the keys matching `regex` (all the
+        keys if None) from their L1
+        """
+        generation = self.l2.increment(self.generation_key)
+        self.l2(
+            "%s:%s" % (self.generation_key, generation), lambda: regex or ".*", 3600
+        )
+
+    def _lookup(self, key):
+        """
+        Returns the value of `key` in the L2, None if it is missing, without
+        storing anything (`self.l2(key, None)` would delete it)
+        """
+
+        def missing():
+            raise KeyError(key)
+
+        try:
+            return self.l2(key, missing, None)
+        except KeyError:
+            return None
+
+    def sync(self):
+        """
+        Clears from the L1 the keys cleared by the other processes
+        """
+        now = time.time()
+        synced = self.synced.get(self.app)
+        if synced and now - synced[1] < self.sync_interval:
+            return
+        generation = self.l2.increment(self.generation_key, 0)
+        if synced is None:
+            # a new L1 has nothing to clear
+            self.synced[self.app] = (generation, now)
+            return
+        if generation != synced[0]:
+            if generation < synced[0] or generation - synced[0] > 100:
+                regexes = [None]
+            else:
+                regexes = [
+                    self._lookup("%s:%s" % (self.generation_key, g))
+                    for g in range(synced[0] + 1, generation + 1)
+                ]
+            for regex in regexes:
+                # a missing regex means that anything could have changed
+                self.l1.clear(regex)
+        self.synced[self.app] = (generation, now)
+
 
 class CacheAction(object):
     def __init__(self, func, key, time_expire, cache, cache_model):
@@ -598,6 +1424,7 @@ class Cache(object):
         public=True,
         valid_statuses=None,
         quick=None,
+        etag=None,
     ):
         """Better fit for caching an action
 
@@ -623,9 +1450,43 @@ class Cache(object):
                 pass an explicit list of statuses on which turn the cache on
             quick: Session,Vars,Lang,User-agent,Public:
                 fast overrides with initials, e.g. 'SVLP' or 'VLP', or 'VLP'
+            etag: by default a strong ETag is computed from the body of 200
+                responses when the action returns a string, and a request
+                whose If-None-Match matches it gets a 304 with no body.
+                Pass True to also hash other return values (e.g. the dict
+                rendered by the view, together with response.view and
+                response.flash, and response.session_id if `session`),
+                False to never send an ETag.
+                With cache_model a revalidation is answered from the cache
+                without calling the action.
+                The ETag of a dict does not cover anything else the view
+                and its layout render (e.g. the logged in user, menus or
+                other session values, or the view files themselves), so a
+                client could get a 304 for a stale page: use etag=True only
+                for views that render nothing but the returned values.
         """
         from gluon import current
         from gluon.http import HTTP
+        from gluon.http import etag as http_etag
+        from gluon.http import etag_matches
+
+        def body_etag(body, session_):
+            if isinstance(body, (str, bytes)):
+                return http_etag(body)
+            elif etag:
+                response = current.response
+                session_id = response.session_id if session_ else None
+                try:
+                    return http_etag(
+                        pickle.dumps(
+                            (response.view, body, response.flash, session_id),
+                            pickle.HIGHEST_PROTOCOL,
+                        )
+                    )
+                except Exception:
+                    # not everything the action returns can be pickled
+                    return None
+            return None
 
         def wrap(func):
             def wrapped_f():
@@ -725,6 +1586,14 @@ class Cache(object):
                         "Cache-Control": cache_control,
                     }
                     current.response.headers.update(headers)
+                    if etag is not False and str(status) == "200":
+                        tag = body_etag(http.body if http else rtn, session_)
+                        if tag:
+                            current.response.headers["ETag"] = tag
+                            if etag_matches(
+                                current.request.env.http_if_none_match, tag
+                            ):
+                                raise HTTP(304, "", **current.response.headers)
                 if cache_model and not send_headers:
                     # we cached already the value, but the status is not valid
                     # so we need to delete the cached value
@@ -778,6 +1647,66 @@ class Cache(object):
 
         return tmp
 
+    def invalidate(self, *tags):
+        """
+        Deletes the entries tagged with any of `tags` from cache.ram,
+        cache.disk and the other cache models set as attributes of the cache
+        (e.g. cache.redis)
+        """
+        cache_models = []
+        for cache_model in vars(self).values():
+            if hasattr(cache_model, "invalidate") and not any(
+                cache_model is c for c in cache_models
+            ):
+                cache_models.append(cache_model)
+        # a CacheTiered must find the keys in its L2 to tell the other
+        # processes which keys to drop from their L1
+        cache_models.sort(key=lambda c: not isinstance(c, CacheTiered))
+        for cache_model in cache_models:
+            cache_model.invalidate(*tags)
+
+    def invalidate_on_write(self, *tables):
+        """
+        Invalidates the tag named after each table whenever the table is
+        inserted, updated or deleted through the DAL. Entries are tagged
+        with `with_tags`, e.g.::
+
+            cache.invalidate_on_write(db.person)
+            rows = db(db.person).select(
+                cache=(cache.with_tags(cache.ram, "person"), 3600),
+                cacheable=True)
+        """
+        for table in tables:
+            callback = lambda *args, tag=table._tablename: self.invalidate(tag)
+            table._after_insert.append(callback)
+            table._after_update.append(callback)
+            table._after_delete.append(callback)
+
+    @staticmethod
+    def with_tags(cache_model, *tags):
+        """
+        allow replacing cache.ram with cache.with_tags(cache.ram, 'person')
+        the entries it computes are tagged with `tags`, so that
+        cache.invalidate('person') deletes them
+        """
+
+        def tagged(key, f, time_expire=DEFAULT_TIME_EXPIRE):
+            if f is None:
+                return cache_model(key, f, time_expire)
+            computed = []
+
+            def compute():
+                computed.append(True)
+                return f()
+
+            value = cache_model(key, compute, time_expire)
+            if computed:
+                # only new entries need to be tagged
+                cache_model.tag(key, *tags)
+            return value
+
+        return tagged
+
     @staticmethod
     def with_prefix(cache_model, prefix):
         """
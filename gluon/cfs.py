@@ -14,12 +14,137 @@ Note:
 """
 
 import _thread as thread
+import marshal
+import sys
+import time
+import types
+from collections import OrderedDict
 from os import stat
 
 from gluon.fileutils import read_file
 
-cfs = {}  # for speed-up
-cfs_lock = thread.allocate_lock()  # and thread safety
+
+def sizeof(data):
+    """
+    Approximates the memory used by `data`, a code object, a string or a
+    container of them.
+    """
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    elif isinstance(data, types.CodeType):
+        try:
+            return len(marshal.dumps(data))
+        except ValueError:
+            return sys.getsizeof(data)
+    elif isinstance(data, (tuple, list)):
+        return sum(sizeof(item) for item in data)
+    elif isinstance(data, dict):
+        return sum(sizeof(k) + sizeof(v) for k, v in data.items())
+    return sys.getsizeof(data)
+
+
+class CodeCache(object):
+    """
+    A thread safe LRU cache for the compiled models, controllers and views
+    and for the language dictionaries.
+
+    Args:
+        max_bytes(int): approximate memory cap, least recently used entries
+            are evicted above it (None for no limit)
+        max_entries(int): maximum number of entries (None for no limit)
+        stat_interval(int): seconds during which a cached entry is trusted
+            without checking the modification time of its file(s). The
+            default 0 checks files at every lookup, set it in production to
+            save the `stat` calls.
+
+    Entries are lists `[version, data, size, checked]` where `version` is the
+    modification time (or the tuple of modification times) of the files
+    `data` was built from, and `checked` is the time of the last check.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, max_entries=None, stat_interval=0):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.stat_interval = stat_interval
+        self.storage = OrderedDict()
+        self.lock = thread.allocate_lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.storage)
+
+    def __contains__(self, key):
+        return key in self.storage
+
+    def get(self, key):
+        """
+        Returns the entry for `key` (or None) and marks it as recently used
+        """
+        with self.lock:
+            item = self.storage.get(key)
+            if item is not None:
+                self.storage.move_to_end(key)
+            return item
+
+    def fresh(self, item, now):
+        """
+        True if `item` was checked less than `stat_interval` seconds ago
+        """
+        return self.stat_interval and now - item[3] < self.stat_interval
+
+    def hit(self, item, now):
+        with self.lock:
+            self.hits += 1
+            item[3] = now
+        return item[1]
+
+    def set(self, key, version, data, now):
+        """
+        Stores `data` built from files with the given `version`, evicting the
+        least recently used entries if needed.
+        """
+        size = sizeof(data)
+        with self.lock:
+            self.misses += 1
+            old = self.storage.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self.storage[key] = [version, data, size, now]
+            self.bytes += size
+            while len(self.storage) > 1 and (
+                (self.max_bytes is not None and self.bytes > self.max_bytes)
+                or (
+                    self.max_entries is not None
+                    and len(self.storage) > self.max_entries
+                )
+            ):
+                old = self.storage.popitem(last=False)[1]
+                self.bytes -= old[2]
+                self.evictions += 1
+        return data
+
+    def clear(self):
+        with self.lock:
+            self.storage.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters and the current size
+        """
+        with self.lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                entries=len(self.storage),
+                bytes=self.bytes,
+            )
+
+
+cfs = CodeCache()  # for speed-up
+cfs_lock = cfs.lock  # and thread safety
 
 
 def getcfs(key, filename, filter=None):
@@ -36,20 +161,50 @@ def getcfs(key, filename, filter=None):
 
     This is used on Google App Engine since pyc files cannot be saved.
     """
+    now = time.time()
+    item = cfs.get(key)
+    if item and cfs.fresh(item, now):
+        return cfs.hit(item, now)
     try:
         t = stat(filename).st_mtime
     except OSError:
         return filter() if callable(filter) else ""
-    cfs_lock.acquire()
-    item = cfs.get(key, None)
-    cfs_lock.release()
     if item and item[0] == t:
-        return item[1]
+        return cfs.hit(item, now)
     if not callable(filter):
         data = read_file(filename)
     else:
         data = filter()
-    cfs_lock.acquire()
-    cfs[key] = (t, data)
-    cfs_lock.release()
-    return data
+    return cfs.set(key, t, data, now)
+
+
+def getcfs_files(key, filter):
+    """
+    Caches the output of `filter` with `key` until any of the files it
+    depends on is modified.
+
+    Args:
+        key(str): the cache key
+        filter: a function returning a tuple `(data, mtimes)` where
+            `mtimes` lists the `(filename, mtime)` of every file `data` was
+            built from, or is None if `data` must not be cached. As in
+            `getcfs`, each mtime must be taken before the file is read, so
+            that a file modified meanwhile is read again by the next call.
+
+    This is used to cache parsed views together with their extend/include
+    chain.
+    """
+    now = time.time()
+    item = cfs.get(key)
+    if item:
+        if cfs.fresh(item, now):
+            return cfs.hit(item, now)
+        try:
+            if all(stat(f).st_mtime == t for f, t in item[0]):
+                return cfs.hit(item, now)
+        except OSError:
+            pass
+    data, mtimes = filter()
+    if mtimes is None:
+        return data
+    return cfs.set(key, tuple(mtimes), data, now)
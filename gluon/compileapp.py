@@ -12,6 +12,7 @@ Note:
     FOR INTERNAL USE ONLY
 """
 
+import ast
 import copy
 import fnmatch
 import importlib
@@ -27,11 +28,12 @@ from functools import reduce
 from os.path import exists
 from os.path import join as pjoin
 
+from pydal._globals import THREAD_LOCAL
 from pydal.base import BaseAdapter
 
 from gluon import html, rewrite, validators
 from gluon.cache import Cache
-from gluon.cfs import getcfs
+from gluon.cfs import getcfs, getcfs_files
 from gluon.dal import DAL, Field
 from gluon.fileutils import (
     abspath,
@@ -48,7 +50,7 @@ from gluon.restricted import compile2, restricted
 from gluon.settings import global_settings
 from gluon.sqlhtml import SQLFORM, SQLTABLE
 from gluon.storage import List, Storage
-from gluon.template import parse_template
+from gluon.template import file_reader, parse_template
 from gluon.validators import Validator
 
 MAGIC = importlib.util.MAGIC_NUMBER
@@ -578,10 +580,143 @@ REGEX_COMPILED_MODEL = r"models[_.][\w.-]+\.pyc$"
 REGEX_MODEL = r"[\w-]+\.py$"
 
 
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class ModelManifest(object):
+    """
+    The ordered list of model files of an application, together with the
+    models selected by each value of `response.models_to_run`.
+
+    Manifests are cached per application folder and rebuilt only when the
+    `models` (or `compiled`) folder, or one of its subfolders, is modified.
+    """
+
+    manifests = {}
+    max_selections = 1000
+
+    def __init__(self, folder, compiled):
+        if compiled:
+            path = pjoin(folder, "compiled")
+            self.filenames = sorted(
+                listdir(path, REGEX_COMPILED_MODEL, 0),
+                key=lambda f: "{0:03d}".format(f.count(".")) + f,
+            )
+            n = len(path) + 8
+            self.names = [f[n:-4].replace(".", "/") + ".py" for f in self.filenames]
+            dirs = [path]
+        else:
+            path = pjoin(folder, "models")
+            self.filenames = sorted(
+                listdir(path, REGEX_MODEL, 0, sort=False),
+                key=lambda f: "{0:03d}".format(f.count(os.sep)) + f,
+            )
+            n = len(path) + 1
+            self.names = [f[n:].replace(os.sep, "/") for f in self.filenames]
+            dirs = listdir(path, "^$", 0, add_dirs=True) or [path]
+        self.compiled = compiled
+        self.dirs = [(d, _mtime(d)) for d in dirs]
+        self.selections = {}
+
+    @classmethod
+    def get(cls, folder):
+        """
+        Returns the manifest of the application in `folder`
+        """
+        compiled = exists(pjoin(folder, "compiled"))
+        manifest = cls.manifests.get(folder)
+        if (
+            manifest is None
+            or manifest.compiled != compiled
+            or any(_mtime(d) != t for d, t in manifest.dirs)
+        ):
+            manifest = cls.manifests[folder] = cls(folder, compiled)
+        return manifest
+
+    def select(self, models_to_run, controller, start=0):
+        """
+        Returns the indexes (from `start` on) of the models matching
+        `models_to_run`, a list of regular expressions or a compiled one.
+        """
+        if not models_to_run:
+            return ()
+        if isinstance(models_to_run, list):
+            models_to_run = tuple(models_to_run)
+        key = (models_to_run, controller == "appadmin")
+        selected = self.selections.get(key)
+        if selected is None:
+            regex = models_to_run
+            if isinstance(regex, tuple):
+                regex = re_compile("|".join(regex))
+            selected = tuple(
+                i
+                for i, name in enumerate(self.names)
+                if controller == "appadmin" or regex.search(name)
+            )
+            if len(self.selections) >= self.max_selections:
+                self.selections.clear()
+            self.selections[key] = selected
+        return tuple(i for i in selected if i >= start) if start else selected
+
+
+WARM_MODELS = {}  # per process snapshots of the warm models
+
+
+def snapshot_model(before, environment, current_before):
+    """
+    Returns the globals (and the `current` attributes) a model has defined or
+    rebound, given the ones that existed before it ran.
+    """
+    symbols = dict(
+        (k, v) for k, v in environment.items() if k not in before or before[k] is not v
+    )
+    attributes = dict(
+        (k, v)
+        for k, v in current.__dict__.items()
+        if k not in current_before or current_before[k] is not v
+    )
+    return symbols, attributes
+
+
+def restore_model(snapshot, environment):
+    """
+    Copies the globals of a warm model snapshot into `environment`: dict and
+    list values are shallow copied, databases are attached to the current
+    thread so that they are committed or rolled back with the request.
+    """
+    symbols, attributes = snapshot
+    restored = {}
+    for k, v in symbols.items():
+        if id(v) not in restored:
+            if isinstance(v, (dict, list)):
+                restored[id(v)] = copy.copy(v)
+            else:
+                if isinstance(v, DAL):
+                    instances = THREAD_LOCAL.__dict__.setdefault(
+                        "_pydal_db_instances_", {}
+                    )
+                    group = instances.setdefault(v._db_uid, [])
+                    if v not in group:
+                        group.append(v)
+                restored[id(v)] = v
+        environment[k] = restored[id(v)]
+    for k, v in attributes.items():
+        setattr(current, k, restored.get(id(v), v))
+
+
 def run_models_in(environment):
     """
     Runs all models (in the app specified by the current folder)
     It tries pre-compiled models first before compiling them.
+
+    Models whose name matches `response.warm_models` (a list of regular
+    expressions, like `response.models_to_run`) are declared independent from
+    the request: they are run once per process and the globals they define
+    are restored in the following requests, until the model is modified.
     """
     request = current.request
     folder = request.folder
@@ -589,41 +724,47 @@ def run_models_in(environment):
     # f = environment['request'].function
     response = current.response
 
-    path = pjoin(folder, "models")
-    cpath = pjoin(folder, "compiled")
-    compiled = exists(cpath)
-    if compiled:
-        models = sorted(
-            listdir(cpath, REGEX_COMPILED_MODEL, 0),
-            key=lambda f: "{0:03d}".format(f.count(".")) + f,
-        )
-    else:
-        models = sorted(
-            listdir(path, REGEX_MODEL, 0, sort=False),
-            key=lambda f: "{0:03d}".format(f.count(os.sep)) + f,
-        )
-
-    models_to_run = None
-    for model in models:
-        if response.models_to_run != models_to_run:
-            regex = models_to_run = response.models_to_run[:]
-            if isinstance(regex, list):
-                regex = re_compile("|".join(regex))
-        if models_to_run:
-            if compiled:
-                n = len(cpath) + 8
-                fname = model[n:-4].replace(".", "/") + ".py"
-            else:
-                n = len(path) + 1
-                fname = model[n:].replace(os.sep, "/")
-            if not regex.search(fname) and c != "appadmin":
-                continue
-            elif compiled:
-                f = lambda: read_pyc(model)
+    manifest = ModelManifest.get(folder)
+    models_to_run = response.models_to_run
+    if isinstance(models_to_run, list):
+        models_to_run = models_to_run[:]
+    selected = manifest.select(models_to_run, c)
+    rerun = False
+    k = 0
+    while k < len(selected):
+        index = selected[k]
+        model = manifest.filenames[index]
+        if manifest.compiled:
+            f = lambda: read_pyc(model)
+        else:
+            f = lambda: compile2(read_file(model), model)
+        ccode = getcfs(model, model, f)
+        warm_models = response.warm_models
+        if warm_models and re_compile("|".join(warm_models)).search(
+            manifest.names[index]
+        ):
+            snapshot = WARM_MODELS.get(model)
+            if snapshot and snapshot[0] is ccode and not rerun:
+                restore_model(snapshot[1], environment)
             else:
-                f = lambda: compile2(read_file(model), model)
-            ccode = getcfs(model, model, f)
+                # models after a (re)run warm model must be run again too
+                rerun = True
+                before, current_before = dict(environment), dict(current.__dict__)
+                restricted(ccode, environment, layer=model)
+                WARM_MODELS[model] = (
+                    ccode,
+                    snapshot_model(before, environment, current_before),
+                )
+        else:
             restricted(ccode, environment, layer=model)
+        k += 1
+        # models may change the models to run
+        if response.models_to_run != models_to_run:
+            models_to_run = response.models_to_run
+            if isinstance(models_to_run, list):
+                models_to_run = models_to_run[:]
+            selected = manifest.select(models_to_run, c, index + 1)
+            k = 0
 
 
 TEST_CODE = r"""
@@ -731,6 +872,59 @@ def run_controller_in(controller, function, environment):
     return vars
 
 
+REGEX_VIEW_DIRECTIVE = r"(?s)%s\s*(?:extend|include)\s+(.+?)\s*%s"
+
+
+def parse_view(view, folder, environment):
+    """
+    Parses and bytecode compiles the (non compiled) `view` of the
+    application in `folder`.
+
+    The result is cached until any of the files in the extend/include chain
+    of the view is modified. Views extending or including a file named by a
+    dynamic expression are parsed every time.
+
+    Returns:
+        a tuple `(scode, ccode)` with the generated source and code object
+    """
+    path = pjoin(folder, "views")
+    filename = pjoin(path, view)
+    delimiters = environment["response"].delimiters or ("{{", "}}")
+    regex = re_compile(
+        REGEX_VIEW_DIRECTIVE % (re.escape(delimiters[0]), re.escape(delimiters[1]))
+    )
+
+    def parse():
+        texts, mtimes = {}, {}
+
+        def reader(fname, mode="rb"):
+            # stat before reading, a file modified meanwhile is parsed again
+            try:
+                mtimes[fname] = os.stat(fname).st_mtime
+            except OSError:
+                # file_reader reports it
+                pass
+            texts[fname] = text = file_reader(fname, mode)
+            return text
+
+        reader(filename)
+
+        scode = parse_template(view, path, context=environment, reader=reader)
+        ccode = compile2(scode, filename)
+        for text in texts.values():
+            if isinstance(text, bytes):
+                text = text.decode("utf8", "replace")
+            for value in regex.findall(text):
+                try:
+                    ast.literal_eval(value)
+                except (ValueError, SyntaxError):
+                    return (scode, ccode), None
+        return (scode, ccode), list(mtimes.items())
+
+    key = "view:%s:%s:%s" % (filename, delimiters[0], delimiters[1])
+    return getcfs_files(key, parse)
+
+
 def run_view_in(environment):
     """
     Executes the view for the requested action.
@@ -789,10 +983,8 @@ def run_view_in(environment):
                     rewrite.THREAD_LOCAL.routes.error_message % badv,
                     web2py_error=badv,
                 )
-            # Parse template
-            scode = parse_template(view, pjoin(folder, "views"), context=environment)
-            # Compile template
-            ccode = compile2(scode, filename)
+            # Parse and compile template
+            scode, ccode = parse_view(view, folder, environment)
             layer = filename
     restricted(ccode, environment, layer=layer, scode=scode)
     # parse_template saves everything in response body
@@ -13,6 +13,8 @@ import os
 import re
 import sys
 
+from gluon.streamer import precompress
+
 from . import cssmin, jsmin
 
 PY2 = sys.version_info[0] == 2
@@ -62,9 +64,10 @@ def minify(
     files: is a list of URLs to JS and CSS files (not repeated)
     path_info: is the URL of a temp static folder
     folder: is the application folder
-    optimize_css: is a string of the form 'concat|minify|inline'
-    optimize_js: is a string of the form 'concat|minify|inline'
-    (minify requires concat, inline requires concat also)
+    optimize_css: is a string of the form 'concat|minify|inline|precompress'
+    optimize_js: is a string of the form 'concat|minify|inline|precompress'
+    (minify requires concat, inline requires concat also, precompress
+    writes the .gz/.br/.zst variants of the concatenated file)
 
     Returns a new list of:
     - filename (absolute or relative, css or js, actual or temporary) or
@@ -76,9 +79,11 @@ def minify(
     concat_css = "concat" in optimize_css
     minify_css = "minify" in optimize_css
     inline_css = "inline" in optimize_css
+    precompress_css = "precompress" in optimize_css
     concat_js = "concat" in optimize_js
     minify_js = "minify" in optimize_js
     inline_js = "inline" in optimize_js
+    precompress_js = "precompress" in optimize_js
     static_path, temp = path_info.rsplit("/", 1)
     new_files = []
     css = []
@@ -139,6 +144,8 @@ def minify(
             dest = "compressed_%s.css" % dest_key
             tempfile = os.path.join(temppath, dest)
             write_binary_file(tempfile, css)
+            if precompress_css:
+                precompress(tempfile)
             css = path_info + "/%s" % dest
             new_files.append(css)
         else:
@@ -156,6 +163,8 @@ def minify(
             dest = "compressed_%s.js" % dest_key
             tempfile = os.path.join(folder, "static", temp, dest)
             write_binary_file(tempfile, js)
+            if precompress_js:
+                precompress(tempfile)
             js = path_info + "/%s" % dest
         new_files.append(js)
     else:
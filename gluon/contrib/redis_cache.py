@@ -90,6 +90,10 @@ def RedisCache(
        - gives us just the keys that are not expired yet
     - buckets that are expired are removed from the fixed set
     - we scan the keys and then delete them
+
+    Keys can also be tagged (see Cache.with_tags): every tag is a set of
+    keys, so that invalidate(tag) deletes only the keys in it. A tag set
+    expires when its longest lived key does.
     """
 
     locker.acquire()
@@ -283,6 +287,49 @@ class RedisClient(object):
             self.clear_buckets(buckets)
         pipe.execute()
 
+    def tag(self, key, *tags):
+        """
+        Adds the key to the set of each tag. A tag set expires with the
+        longest lived of its keys, so that unused tags do not pile up
+        """
+        newKey = self.__keyFormat__(key)
+        tag_keys = [self.__tagFormat__(tag) for tag in tags]
+        p = self.r_server.pipeline()
+        p.ttl(newKey)
+        for tag_key in tag_keys:
+            p.ttl(tag_key)
+        ttls = p.execute()
+        if ttls[0] < 0:
+            # expired or deleted meanwhile
+            return
+        p = self.r_server.pipeline()
+        for tag_key, ttl in zip(tag_keys, ttls[1:]):
+            p.sadd(tag_key, newKey)
+            if ttl < ttls[0]:
+                p.expire(tag_key, ttls[0])
+        p.execute()
+
+    def invalidate(self, *tags):
+        """
+        Deletes the keys tagged with any of `tags`, returns them
+        """
+        # MULTI/EXEC: no key can be tagged between SMEMBERS and DEL
+        p = self.r_server.pipeline()
+        for tag in tags:
+            tag_key = self.__tagFormat__(tag)
+            p.smembers(tag_key)
+            p.delete(tag_key)
+        keys = set()
+        for members in p.execute()[::2]:
+            keys.update(members)
+        if keys:
+            self.r_server.delete(*keys)
+        prefix = self.prefix
+        return [
+            (k.decode("utf8") if isinstance(k, bytes) else k).replace(prefix, "", 1)
+            for k in keys
+        ]
+
     def clear_buckets(self, buckets):
         p = self.r_server.pipeline()
         for b in buckets:
@@ -309,3 +356,6 @@ class RedisClient(object):
 
     def __keyFormat__(self, key):
         return "%s%s" % (self.prefix, key.replace(" ", "_"))
+
+    def __tagFormat__(self, tag):
+        return "w2p:%s:___cache_tag:%s" % (self.application, tag.replace(" ", "_"))
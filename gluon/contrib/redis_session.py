@@ -40,6 +40,10 @@ def RedisSession(redis_conn, session_expiry=False, with_lock=False, db=None):
                         or so)
 
     Simple slip-in storage for session
+
+    Note:
+        `session.connect(request, response, redis_conn=rconn)` stores the
+        sessions in redis natively, without emulating a DAL table
     """
 
     locker.acquire()
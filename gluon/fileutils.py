@@ -50,6 +50,7 @@ __all__ = (
     "fix_newlines",
     "create_missing_folders",
     "create_missing_app_folders",
+    "app_registry",
     "add_path_first",
 )
 
@@ -600,6 +601,57 @@ def create_missing_app_folders(request):
             global_settings.app_folders.add(request.folder)
 
 
+class ApplicationRegistry(object):
+    """
+    Caches, for each application folder, whether the application exists and
+    whether it is disabled (contains a DISABLED file), so that steady-state
+    requests do not stat the application folder. Missing applications are
+    not cached, so that requests for arbitrary names cannot grow the cache.
+
+    Args:
+        ttl(int): seconds the state of an application is trusted before the
+            filesystem is checked again
+    """
+
+    def __init__(self, ttl=1):
+        self.ttl = ttl
+        self.apps = {}
+
+    def get(self, folder):
+        """
+        Returns a Storage with the `exists` and `disabled` flags of the
+        application in `folder`
+        """
+        now = time.time()
+        state = self.apps.get(folder)
+        if state is None or now - state.checked >= self.ttl:
+            if not os.path.exists(folder):
+                global_settings.app_folders.discard(folder)
+                self.apps.pop(folder, None)
+                return storage.Storage(exists=False, disabled=False, checked=now)
+            state = self.apps[folder] = storage.Storage(
+                exists=True,
+                disabled=os.path.exists(os.path.join(folder, "DISABLED")),
+                checked=now,
+            )
+        return state
+
+    def invalidate(self, folder=None):
+        """
+        Forgets the state of the application in `folder` (or of every
+        application), to be called when an application is created, removed,
+        enabled or disabled
+        """
+        if folder is None:
+            self.apps.clear()
+        else:
+            self.apps.pop(os.path.abspath(folder), None)
+            self.apps.pop(folder, None)
+
+
+app_registry = ApplicationRegistry()
+
+
 def add_path_first(path):
     sys.path = [path] + [
         p for p in sys.path if (not p == path and not p == (path + "/"))
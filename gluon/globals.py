@@ -56,7 +56,9 @@ import re
 import sys
 import tempfile
 import threading
+import time
 import traceback
+import zlib
 from http import cookies as Cookie
 from io import BytesIO, StringIO
 from pickle import DICT, EMPTY_DICT, MARK, Pickler
@@ -64,6 +66,7 @@ from urllib import parse as urlparse
 from urllib.parse import parse_qs
 
 from pydal.contrib import portalocker
+from pydal.helpers.classes import BasicStorage
 from pydal.utils import utcnow
 
 import gluon.settings as settings
@@ -85,6 +88,9 @@ FMT = "%a, %d-%b-%Y %H:%M:%S PST"
 PAST = "Sat, 1-Jan-1971 00:00:00"
 FUTURE = "Tue, 1-Dec-2999 23:59:59"
 
+# session tables whose expiry index was checked by this process
+SESSION_INDEXES = set()
+
 try:
     # FIXME PY3
     from gluon.contrib.minify import minify
@@ -241,11 +247,38 @@ def copystream(src, dest, size, chunk_size, cache_inc=None):
     return
 
 
-def copystream_progress(request, chunk_size=10**5):
+class InputStream(object):
+    """
+    Reads at most `size` bytes from `source` (the wsgi input), calling
+    `inc` with the number of bytes read and `done` once all are read
+    """
+
+    def __init__(self, source, size, inc=None, done=None):
+        self.source = source
+        self.size = size
+        self.inc = inc
+        self.done = done
+
+    def read(self, size=-1):
+        if size < 0 or size > self.size:
+            size = self.size
+        data = self.source.read(size) if size else b""
+        self.size = self.size - len(data) if data else 0
+        callable(self.inc) and data and self.inc(len(data))
+        if not self.size and callable(self.done):
+            self.done()
+            self.done = None
+        return data
+
+
+def copystream_progress(request, chunk_size=10**5, stream=False):
     """
     Copies request.env.wsgi_input into request.body
     and stores progress upload status in cache_ram
     X-Progress-ID:length and X-Progress-ID:uploaded
+
+    With `stream` it returns an InputStream that reads the wsgi input
+    (and updates the progress) as it is consumed instead of copying it.
     """
     env = request.env
     if not env.get("CONTENT_LENGTH", None):
@@ -255,23 +288,29 @@ def copystream_progress(request, chunk_size=10**5):
         size = int(env["CONTENT_LENGTH"])
     except ValueError:
         raise HTTP(400, "Invalid Content-Length header")
-    dest = tempfile.TemporaryFile()
     if "X-Progress-ID" not in request.get_vars:
+        if stream:
+            return InputStream(source, size)
+        dest = tempfile.TemporaryFile()
         copystream(source, dest, size, chunk_size)
         return dest
     cache_key = "X-Progress-ID:" + request.get_vars["X-Progress-ID"]
     cache_ram = CacheInRam(request)  # same as cache.ram because meta_storage
     cache_ram(cache_key + ":length", lambda: size, 0)
     cache_ram(cache_key + ":uploaded", lambda: 0, 0)
-    copystream(
-        source,
-        dest,
-        size,
-        chunk_size,
-        lambda v: cache_ram.increment(cache_key + ":uploaded", v),
-    )
-    cache_ram(cache_key + ":length", None)
-    cache_ram(cache_key + ":uploaded", None)
+
+    def inc(v):
+        cache_ram.increment(cache_key + ":uploaded", v)
+
+    def done():
+        cache_ram(cache_key + ":length", None)
+        cache_ram(cache_key + ":uploaded", None)
+
+    if stream:
+        return InputStream(source, size, inc, done)
+    dest = tempfile.TemporaryFile()
+    copystream(source, dest, size, chunk_size, inc)
+    done()
     return dest
 
 
@@ -334,10 +373,27 @@ class Request(Storage):
     def parse_post_vars(self):
         """Takes the body of the request and unpacks it into
         post_vars. application/json is also automatically parsed
+
+        Uploaded files are the parser's own buffers: in memory up to 64KB,
+        in a temporary file above. If `request.stream_uploads` is set (e.g.
+        in a model) a multipart body not read yet is parsed directly from
+        the wsgi input, without spooling it to request.body first, which is
+        then left empty.
         """
         env = self.env
         post_vars = self._post_vars = Storage()
-        body = self.body
+        streaming = (
+            self.stream_uploads
+            and self._body is None
+            and env.get("CONTENT_TYPE", "").startswith("multipart/form-data")
+        )
+        if streaming:
+            try:
+                body = copystream_progress(self, stream=True)
+            except IOError:
+                raise HTTP(400, "Bad Request - HTTP body is incomplete")
+        else:
+            body = self.body
 
         # if content-type is application/json, we must read the body
         is_json = env.get("CONTENT_TYPE", "")[:16] == "application/json"
@@ -403,9 +459,10 @@ class Request(Storage):
                     try:
                         part = next(parser)
                         if part.filename:  # file upload
+                            # no copy, Field.store reads the part buffer
                             file_storage = Storage(
                                 filename=part.filename,  # already decoded properly
-                                file=BytesIO(part.raw),
+                                file=part.file,
                             )
                             post_vars[part.name] = (
                                 file_storage
@@ -429,6 +486,12 @@ class Request(Storage):
                         # escape parse_post_vars as an HTTP 500. This matches the
                         # lenient behaviour previously applied to ParserError.
                         break
+                if streaming:
+                    # drain what the parser left (e.g. the epilogue) and
+                    # leave an empty body, the input was consumed
+                    while body.read(DEFAULT_CHUNK_SIZE):
+                        pass
+                    body = self._body = BytesIO()
                 body.seek(0)
             # Handle application/x-www-form-urlencoded
             elif content_type.startswith("application/x-www-form-urlencoded"):
@@ -663,6 +726,14 @@ class Response(Storage):
         self.form_label_separator = ": "
         self._csp_enabled = False
 
+    @property
+    def flash(self):
+        # a flash message may be waiting in a session not loaded yet
+        session = self.__dict__.get("_lazy_session")
+        if session is not None:
+            session._load()
+        return self.get("flash")
+
     @property
     def nonce(self):
         if "nonce" not in self:
@@ -764,6 +835,8 @@ class Response(Storage):
         By default, caches in ram for 5 minutes. To change,
         response.cache_includes = (cache_method, time_expire).
         Example: (cache.disk, 60) # caches to disk for 1 minute.
+        Add "precompress" to response.optimize_css/optimize_js to also write
+        the compressed variants of the concatenated files.
         """
         app = current.request.application
 
@@ -1122,11 +1195,93 @@ class Response(Storage):
         )
 
 
+IMMUTABLE_TYPES = (
+    str,
+    bytes,
+    int,
+    float,
+    complex,
+    type(None),
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+)
+
+
+def _snapshot(value, depth=0):
+    """
+    Returns a snapshot of the mutable `value`, made of nested dicts,
+    Storages, Rows, lists, tuples and sets of immutable values, which
+    compares equal to a later snapshot unless `value` was changed in place,
+    or None if `value` holds other objects (that only pickling can compare)
+    """
+    if depth > 10:
+        return None
+    if isinstance(value, (dict, BasicStorage)):
+        items = value.items() if isinstance(value, dict) else vars(value).items()
+    elif isinstance(value, (set, frozenset)):
+        items = enumerate(sorted(value, key=repr))
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    else:
+        return None
+    snapshot = [type(value)]
+    for key, item in items:
+        if not isinstance(item, IMMUTABLE_TYPES):
+            item = _snapshot(item, depth + 1)
+            if item is None:
+                return None
+        snapshot.append(key)
+        snapshot.append(item)
+    return snapshot
+
+
+def _loading(method, mark=None):
+    """
+    Wraps the dict `method` so that a session whose loading was deferred by
+    `Session.connect` is loaded before `method` runs.
+
+    With `mark="dirty"` the session is marked as changed, with `mark="read"`
+    the mutable values it returns are recorded by `Session._expose`, since
+    the caller may change them in place.
+    """
+
+    def wrapper(self, *args, **kwargs):
+        if self.__dict__.get("_loader") is not None:
+            self._load()
+        if mark == "dirty":
+            self.__dict__["_dirty"] = True
+        value = method(self, *args, **kwargs)
+        if mark == "read" and not isinstance(value, IMMUTABLE_TYPES):
+            self._expose(args[0] if method is dict.get else None, value)
+        return value
+
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
 class Session(Storage):
     """
     Defines the session object and the default values of its members (None)
 
-    - session_storage_type   : 'file', 'db', or 'cookie'
+    If connected with `lazy=True` (the implicit connection of each request
+    does so when the `web2py_lazy_session` wsgi environment variable is
+    set), file and db based sessions are loaded (and file based sessions
+    locked) only when the session is first accessed, so requests that never
+    use the session do no session I/O. A flash message stored in the session
+    is then moved to `response.flash` when the session is loaded, or when
+    `response.flash` is read.
+
+    The session records its changes: setting or deleting items marks it as
+    dirty, and a snapshot is taken of the mutable items (Storages, Rows,
+    lists... of plain values) when they are first read, so that changes made
+    in place are detected by comparing snapshots, e.g. session.auth of a
+    logged-in user. Unchanged sessions are not serialized. Reading other
+    mutable objects, or the `values()` and `items()` of the session, marks
+    it as exposed: exposed sessions are pickled and compared with the stored
+    data.
+
+    - session_storage_type   : 'file', 'db', 'redis' or 'cookie'
     - session_cookie_compression_level :
     - session_cookie_expires : cookie expiration
     - session_cookie_key     : for encrypted sessions in cookies
@@ -1147,15 +1302,44 @@ class Session(Storage):
     - session_db_record_id
     - session_db_table
     - session_db_unique_key
+    - session_db_tables      : with shards, the session tables
+    - session_db_expiration  : with shards, the session lifetime in seconds
+    - session_db_expires     : with shards, the expiry of the loaded session
+
+    if session in redis:
+
+    - session_redis          : the redis connection
+    - session_redis_key      : the key of the session
+    - session_redis_ttl      : seconds to the expiry of the loaded session
+    - session_redis_expiration : the session lifetime in seconds
 
     if session in file:
 
     - session_file
     - session_filename
+    - session_shared         : locked only while read and written
+    - session_stored         : with session_shared, the data read and its
+      unpickler
     """
 
     REGEX_SESSION_FILE = r"^(?:[\w-]+/)?[\w.-]+$"
 
+    __getitem__ = __getattr__ = _loading(dict.get, "read")
+    __setitem__ = __setattr__ = _loading(dict.__setitem__, "dirty")
+    __delitem__ = __delattr__ = _loading(dict.__delitem__, "dirty")
+    __contains__ = _loading(dict.__contains__)
+    __iter__ = _loading(dict.__iter__)
+    __len__ = _loading(dict.__len__)
+    __repr__ = _loading(Storage.__repr__)
+    get = _loading(dict.get, "read")
+    keys = _loading(dict.keys)
+    values = _loading(dict.values, "read")
+    items = _loading(dict.items, "read")
+    pop = _loading(dict.pop, "dirty")
+    popitem = _loading(dict.popitem, "dirty")
+    setdefault = _loading(dict.setdefault, "dirty")
+    update = _loading(dict.update, "dirty")
+
     def connect(
         self,
         request=None,
@@ -1171,6 +1355,11 @@ class Session(Storage):
         compression_level=None,
         safe_unpickle=False,
         pickle_allowed_classes=None,
+        lazy=False,
+        shared_lock=False,
+        shards=None,
+        expiration=86400,
+        redis_conn=None,
     ):
         """
         Used in models, allows to customize Session handling
@@ -1192,12 +1381,30 @@ class Session(Storage):
             cookie_key(str): secret for cookie encryption
             cookie_expires: sets the expiration of the cookie
             compression_level(int): 0-9, sets zlib compression on the data
-                before the encryption
+                before the encryption, or before storing it in redis
             safe_unpickle(bool): if True, session data is loaded through a
                 restricted safe unpickler. When False, legacy pickle loading
                 is used for compatibility.
             pickle_allowed_classes(dict): allowed classes for restricted
                 unpickling when safe_unpickle=True.
+            lazy(bool): if True, file and db based sessions are loaded when
+                first accessed instead of now
+            shared_lock(bool): if True, file based sessions are not locked
+                for the whole request but only while read (shared lock) and
+                while written (exclusive lock), so concurrent requests of a
+                client (e.g. ajax components) do not wait for each other.
+                Keys changed by a concurrent request since the session was
+                read are preserved when it is saved.
+            shards(int): with db, partitions the sessions across `shards`
+                tables `<tablename>_<masterapp>_<n>` by hash of their key.
+                Their rows store an indexed expiry timestamp, expired
+                sessions are removed by `trash_expired`. Use a DAL with a
+                `pool_size` to reuse the connections.
+            expiration(int): with shards or redis_conn, seconds of inactivity
+                after which a session expires
+            redis_conn: a redis connection (e.g. from
+                `gluon.contrib.redis_utils.RConn`) to store the sessions in,
+                each as a single key with a time to live of `expiration`
         """
         request = request or current.request
         response = response or current.response
@@ -1205,6 +1412,9 @@ class Session(Storage):
         cookies = request.cookies
 
         self._unlock(response)
+        # forget the loading deferred by a previous connect
+        self.__dict__.update(_loader=None, _dirty=False, _exposed=False, _snapshots={})
+        loader = None
 
         response.session_masterapp = masterapp
         response.session_id_name = "session_id_%s" % masterapp.lower()
@@ -1224,6 +1434,8 @@ class Session(Storage):
         # if we are supposed to use cookie based session data
         if cookie_key:
             response.session_storage_type = "cookie"
+        elif redis_conn is not None:
+            response.session_storage_type = "redis"
         elif db:
             response.session_storage_type = "db"
         else:
@@ -1259,13 +1471,57 @@ class Session(Storage):
                         safe_unpickle=False,
                     )
                 if data:
-                    self.update(data)
+                    loader = lambda: (data, None)
             response.session_id = True
 
         # else if we are supposed to use file based sessions
         elif response.session_storage_type == "file":
             response.session_new = False
             response.session_file = None
+            response.session_shared = shared_lock
+            response.session_stored = None
+            separate = separate and (lambda session_name: session_name[-2:])
+
+            def new_session_file():
+                uuid = web2py_uuid()
+                response.session_id = "%s-%s" % (response.session_client, uuid)
+                if separate:
+                    prefix = separate(response.session_id)
+                    response.session_id = "%s/%s" % (prefix, response.session_id)
+                response.session_filename = safe_path_join(
+                    up(request.folder), masterapp, "sessions", response.session_id
+                )
+                response.session_new = True
+
+            def loads(session_pickled):
+                if safe_unpickle:
+                    return safe_loads(
+                        session_pickled, allowed_classes=pickle_allowed_classes
+                    )
+                return pickle.loads(session_pickled)
+
+            def load_from_file():
+                try:
+                    response.session_file = recfile.open(
+                        response.session_filename, "rb" if shared_lock else "rb+"
+                    )
+                    portalocker.lock(
+                        response.session_file,
+                        portalocker.LOCK_SH if shared_lock else portalocker.LOCK_EX,
+                    )
+                    response.session_locked = True
+                    session_pickled = response.session_file.read()
+                    session_data = loads(session_pickled)
+                    if shared_lock:
+                        self._close(response)
+                        response.session_stored = (session_pickled, loads)
+                    else:
+                        response.session_file.seek(0)
+                    return session_data, session_pickled
+                except Exception:
+                    self._close(response)
+                    new_session_file()
+
             # check if the session_id points to a valid sesion filename
             if response.session_id:
                 if not re.match(self.REGEX_SESSION_FILE, response.session_id):
@@ -1281,35 +1537,66 @@ class Session(Storage):
                         oc = os.path.basename(response.session_filename).split("-")[0]
                         if check_client and response.session_client != oc:
                             raise Exception("cookie attack")
-                        response.session_file = recfile.open(
-                            response.session_filename, "rb+"
-                        )
-                        portalocker.lock(response.session_file, portalocker.LOCK_EX)
-                        response.session_locked = True
-                        session_data = (
-                            safe_load(
-                                response.session_file,
-                                allowed_classes=pickle_allowed_classes,
-                            )
-                            if safe_unpickle
-                            else pickle.load(response.session_file)
-                        )
-                        self.update(session_data)
-                        response.session_file.seek(0)
+                        loader = load_from_file
                     except Exception:
                         response.session_id = None
             if not response.session_id:
-                uuid = web2py_uuid()
-                response.session_id = "%s-%s" % (response.session_client, uuid)
-                separate = separate and (lambda session_name: session_name[-2:])
-                if separate:
-                    prefix = separate(response.session_id)
-                    response.session_id = "%s/%s" % (prefix, response.session_id)
-                response.session_filename = safe_path_join(
-                    up(request.folder), masterapp, "sessions", response.session_id
+                new_session_file()
+
+        # else if the session goes in redis
+        elif response.session_storage_type == "redis":
+            if global_settings.db_sessions is not True:
+                global_settings.db_sessions.add(masterapp)
+            if response.session_file:
+                self._close(response)
+            response.session_new = False
+            response.session_redis = redis_conn
+            response.session_redis_expiration = expiration
+            response.session_redis_compression_level = compression_level
+
+            def new_session_key():
+                response.session_id = "%s-%s" % (response.session_client, web2py_uuid())
+                response.session_redis_key = "w2p:session:%s:%s" % (
+                    masterapp,
+                    response.session_id,
                 )
                 response.session_new = True
 
+            def load_from_redis():
+                # one round trip for the data and its time to live
+                with redis_conn.pipeline() as pipe:
+                    pipe.get(response.session_redis_key)
+                    pipe.ttl(response.session_redis_key)
+                    session_pickled, response.session_redis_ttl = pipe.execute()
+                try:
+                    if compression_level:
+                        session_pickled = zlib.decompress(session_pickled)
+                    if safe_unpickle:
+                        session_data = safe_loads(
+                            session_pickled, allowed_classes=pickle_allowed_classes
+                        )
+                    else:
+                        session_data = pickle.loads(session_pickled)
+                except Exception:
+                    new_session_key()
+                    return None
+                return session_data, session_pickled
+
+            if response.session_id and re.match(
+                self.REGEX_SESSION_FILE, response.session_id
+            ):
+                oc = response.session_id.split("-")[0]
+                if check_client and response.session_client != oc:
+                    new_session_key()
+                else:
+                    response.session_redis_key = "w2p:session:%s:%s" % (
+                        masterapp,
+                        response.session_id,
+                    )
+                    loader = load_from_redis
+            else:
+                new_session_key()
+
         # else the session goes in db
         elif response.session_storage_type == "db":
             if global_settings.db_sessions is not True:
@@ -1325,23 +1612,21 @@ class Session(Storage):
             else:
                 table_migrate = False
             tname = tablename + "_" + masterapp
-            table = db.get(tname, None)
-            Field = db.Field
-            if table is None:
-                db.define_table(
-                    tname,
-                    Field("locked", "boolean", default=False),
-                    Field("client_ip", length=64),
-                    Field("created_datetime", "datetime", default=request.now),
-                    Field("modified_datetime", "datetime"),
-                    Field("unique_key", length=64),
-                    Field("session_data", "blob"),
-                    migrate=table_migrate,
-                )
-                table = db[tname]  # to allow for lazy table
+            if shards:
+                response.session_db_tables = [
+                    self._session_table(db, "%s_%s" % (tname, i), table_migrate, True)
+                    for i in range(shards)
+                ]
+                response.session_db_expiration = expiration
+                table = None
+            else:
+                response.session_db_tables = None
+                table = self._session_table(db, tname, table_migrate)
             response.session_db_table = table
-            if response.session_id:
+
+            def load_from_db():
                 # Get session data out of the database
+                session_data = None
                 try:
                     (record_id, unique_key) = response.session_id.split(":")
                     record_id = int(record_id)
@@ -1350,11 +1635,20 @@ class Session(Storage):
 
                 # Select from database
                 if record_id:
-                    row = table(record_id, unique_key=unique_key)
+                    row_table = table
+                    if shards:
+                        row_table = self._session_shard(response, unique_key)
+                        response.session_db_table = row_table
+                    row = row_table(record_id, unique_key=unique_key)
                     # Make sure the session data exists in the database
                     if row and check_client:
                         if row.client_ip != response.session_client:
                             row = None
+                    if row and shards:
+                        if row.expires_datetime and row.expires_datetime < request.now:
+                            row = None
+                        else:
+                            response.session_db_expires = row.expires_datetime
                     if row:
                         # rows[0].update_record(locked=True)
                         # Unpickle the data
@@ -1366,7 +1660,6 @@ class Session(Storage):
                                 )
                             else:
                                 session_data = pickle.loads(row["session_data"])
-                            self.update(session_data)
                             response.session_new = False
                         except (
                             pickle.UnpicklingError,
@@ -1385,10 +1678,20 @@ class Session(Storage):
                 else:
                     response.session_id = None
                     response.session_new = True
+                    return None
+                session_pickled = row["session_data"]
+                if not isinstance(session_pickled, bytes):
+                    session_pickled = None
+                return session_data, session_pickled
+
+            if response.session_id:
+                loader = load_from_db
             # if there is no session id yet, we'll need to create a
             # new session
             else:
                 response.session_new = True
+                if shards:
+                    response.session_db_table = response.session_db_tables[0]
 
         # set the cookie now if you know the session_id so user can set
         # cookie attributes in controllers/models
@@ -1404,13 +1707,109 @@ class Session(Storage):
                     cookie_expires.strftime(FMT)
                 )
 
-        session_pickled = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
-        response.session_hash = hashlib.md5(session_pickled).hexdigest()
+        self.__dict__["_loader"] = (loader, response)
+        # kept out of the response items (e.g. shown by response.toolbar)
+        response.__dict__["_lazy_session"] = self
+        if not lazy or loader is None:
+            self._load()
 
-        if self.flash:
-            (response.flash, self.flash) = (self.flash, None)
+    @staticmethod
+    def _session_table(db, tname, migrate, expiring=False):
+        """
+        Defines (if needed) and returns the session table `tname`, with an
+        indexed expiry timestamp if `expiring`
+        """
+        table = db.get(tname, None)
+        if table is None:
+            Field = db.Field
+            fields = [
+                Field("locked", "boolean", default=False),
+                Field("client_ip", length=64),
+                Field("created_datetime", "datetime", default=current.request.now),
+                Field("modified_datetime", "datetime"),
+                Field("unique_key", length=64),
+                Field("session_data", "blob"),
+            ]
+            if expiring:
+                fields.append(Field("expires_datetime", "datetime"))
+            started = time.time()
+            db.define_table(tname, *fields, migrate=migrate)
+            table = db[tname]  # to allow for lazy table
+            key = (db._uri_hash, tname)
+            if expiring and migrate and key not in SESSION_INDEXES:
+                # index the expiry only where define_table has just created
+                # (or migrated) the table, i.e. written its .table file, so
+                # that requests do not touch the schema (file times are
+                # coarser than time.time())
+                dbt = table._dbt
+                if dbt is None or os.path.getmtime(dbt) > started - 1:
+                    try:
+                        table.create_index("%s_expires" % tname, table.expires_datetime)
+                    except RuntimeError:
+                        # created meanwhile by another process
+                        pass
+                if dbt is not None:
+                    SESSION_INDEXES.add(key)
+        return table
+
+    @staticmethod
+    def _session_shard(response, unique_key):
+        """
+        Returns the session table of the session `unique_key`
+        """
+        tables = response.session_db_tables
+        return tables[zlib.crc32(unique_key.encode("utf8")) % len(tables)]
+
+    def trash_expired(self, response=None, batch_size=1000, now=None):
+        """
+        Deletes the expired sessions from the tables of sharded db sessions,
+        `batch_size` rows at a time, and returns the number of deleted
+        sessions
+        """
+        response = response or current.response
+        now = now or datetime.datetime.now()
+        deleted = 0
+        for table in response.session_db_tables or []:
+            db = table._db
+            query = table.expires_datetime < now
+            while True:
+                rows = db(query).select(table.id, limitby=(0, batch_size))
+                if rows:
+                    deleted += db(table.id.belongs([r.id for r in rows])).delete()
+                    db.commit()
+                if len(rows) < batch_size:
+                    break
+        return deleted
+
+    def _load(self):
+        """
+        Loads the session data, if not loaded yet
+        """
+        loader, response = self.__dict__["_loader"] or (None, None)
+        if response is None:
+            return
+        self.__dict__["_loader"] = None
+        response.__dict__.pop("_lazy_session", None)
+        session_data, session_pickled = (loader and loader()) or (None, None)
+        if session_data:
+            # values set before loading (e.g. by secure()) prevail
+            for key, value in dict.items(self):
+                if key not in session_data or session_data[key] != value:
+                    self.__dict__["_dirty"] = True
+            dict.update(session_data, dict.items(self))
+            dict.update(self, session_data)
+            if session_pickled is None:
+                session_pickled = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+            response.session_hash = hashlib.md5(session_pickled).hexdigest()
+
+        if dict.get(self, "flash"):
+            (response.flash, self.flash) = (dict.get(self, "flash"), None)
+
+    def _loaded(self):
+        return self.__dict__.get("_loader") is None
 
     def renew(self, clear_session=False):
+        self._load()
         if clear_session:
             self.clear()
 
@@ -1423,6 +1822,18 @@ class Session(Storage):
         if response.session_storage_type == "cookie":
             return
 
+        # if the session goes in redis
+        if response.session_storage_type == "redis":
+            if not response.session_new:
+                response.session_redis.delete(response.session_redis_key)
+            response.session_id = "%s-%s" % (response.session_client, web2py_uuid())
+            response.session_redis_key = "w2p:session:%s:%s" % (
+                masterapp,
+                response.session_id,
+            )
+            response.session_new = True
+            return
+
         # if the session goes in file
         if response.session_storage_type == "file":
             self._close(response)
@@ -1455,6 +1866,16 @@ class Session(Storage):
                 return
             (record_id, sep, unique_key) = response.session_id.partition(":")
 
+            if response.session_db_tables:
+                # a new key may belong to another shard: store a new session
+                if record_id.isdigit():
+                    table._db(
+                        (table.id == record_id) & (table.unique_key == unique_key)
+                    ).delete()
+                response.session_id = response.session_db_record_id = None
+                response.session_new = True
+                return
+
             if record_id.isdigit() and int(record_id) > 0:
                 new_unique_key = web2py_uuid()
                 row = table(record_id)
@@ -1489,7 +1910,8 @@ class Session(Storage):
         response = current.response
         rcookies = response.cookies
         scookies = rcookies.get(response.session_id_name)
-        if self._forget:
+        if dict.get(self, "_forget") or not self._loaded():
+            # the client keeps the cookie of a session that was not loaded
             if scookies:
                 del rcookies[response.session_id_name]
             return
@@ -1549,12 +1971,20 @@ class Session(Storage):
                 os.unlink(target)
             except:
                 pass
+        elif response.session_storage_type == "redis":
+            if response.session_redis_key:
+                response.session_redis.delete(response.session_redis_key)
         elif response.session_storage_type == "db":
             table = response.session_db_table
             if response.session_id:
                 (record_id, sep, unique_key) = response.session_id.partition(":")
                 if record_id.isdigit() and int(record_id) > 0:
                     table._db(table.id == record_id).delete()
+        # no need to load what is being cleared
+        if not self._loaded():
+            self.__dict__["_loader"] = None
+            response.__dict__.pop("_lazy_session", None)
+        self.__dict__["_dirty"] = True
         Storage.clear(self)
 
     def is_new(self):
@@ -1575,18 +2005,26 @@ class Session(Storage):
         else:
             return True
 
+    def _set_flag(self, key, value):
+        """
+        Sets an internal flag without loading the session
+        """
+        if self._loaded() and dict.get(self, key) != value:
+            self.__dict__["_dirty"] = True
+        dict.__setitem__(self, key, value)
+
     def secure(self):
-        self._secure = True
+        self._set_flag("_secure", True)
 
     def samesite(self, mode="Lax"):
-        self._same_site = mode
+        self._set_flag("_same_site", mode)
 
     def forget(self, response=None):
         self._close(response)
-        self._forget = True
+        self._set_flag("_forget", True)
 
     def _try_store_in_cookie(self, request, response):
-        if self._forget or self._unchanged(response):
+        if dict.get(self, "_forget") or self._unchanged(response):
             # self.clear_session_cookies()
             self.save_session_id_cookie()
             return False
@@ -1606,27 +2044,56 @@ class Session(Storage):
             rcookies[name]["expires"] = expires
         return True
 
+    def _expose(self, key, value):
+        """
+        Records that the mutable `value` (of `key`, if known) was handed out
+        and may be changed in place
+        """
+        snapshots = self.__dict__.setdefault("_snapshots", {})
+        if self.__dict__.get("_exposed") or key in snapshots:
+            return
+        snapshot = None if key is None else _snapshot(value)
+        if snapshot is None:
+            self.__dict__["_exposed"] = True
+        else:
+            snapshots[key] = snapshot
+
     def _unchanged(self, response):
+        if not self._loaded():
+            return True
         if response.session_new:
             internal = ["_last_timestamp", "_secure", "_start_timestamp", "_same_site"]
             for item in self.keys():
                 if item not in internal:
                     return False
             return True
+        if self.__dict__.get("_dirty"):
+            return False
+        if not self.__dict__.get("_exposed"):
+            snapshots = self.__dict__.get("_snapshots") or {}
+            return all(
+                _snapshot(dict.get(self, key)) == snapshot
+                for key, snapshot in snapshots.items()
+            )
+        # mutable items may have been changed in place
         session_pickled = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
         response.session_pickled = session_pickled
         session_hash = hashlib.md5(session_pickled).hexdigest()
         return response.session_hash == session_hash
 
     def _try_store_in_db(self, request, response):
+        if response.session_storage_type == "redis":
+            return self._try_store_in_redis(request, response)
         # don't save if file-based sessions,
         # no session id, or session being forgotten
         # or no changes to session (Unless the session is new)
         if (
             not response.session_db_table
-            or self._forget
+            or dict.get(self, "_forget")
             or (self._unchanged(response) and not response.session_new)
         ):
+            if response.session_db_tables and not dict.get(self, "_forget"):
+                self._touch_db_session(request, response)
             if (
                 not response.session_db_table
                 and global_settings.db_sessions is not True
@@ -1655,6 +2122,13 @@ class Session(Storage):
             session_data=session_pickled,
             unique_key=unique_key,
         )
+        if response.session_db_tables:
+            table = response.session_db_table = self._session_shard(
+                response, unique_key
+            )
+            dd["expires_datetime"] = request.now + datetime.timedelta(
+                seconds=response.session_db_expiration
+            )
         if record_id:
             if not table._db(table.id == record_id).update(**dd):
                 record_id = None
@@ -1667,6 +2141,45 @@ class Session(Storage):
         self.save_session_id_cookie()
         return True
 
+    def _try_store_in_redis(self, request, response):
+        try:
+            if not response.session_id or dict.get(self, "_forget"):
+                return False
+            redis_conn = response.session_redis
+            key = response.session_redis_key
+            expiration = response.session_redis_expiration or None
+            if self._unchanged(response):
+                # postpone the expiry when half of the lifetime is over
+                ttl = response.session_redis_ttl
+                if expiration and ttl is not None and 0 <= ttl < expiration / 2:
+                    redis_conn.expire(key, expiration)
+                return False
+            session_pickled = response.session_pickled or pickle.dumps(
+                self, pickle.HIGHEST_PROTOCOL
+            )
+            if response.session_redis_compression_level:
+                session_pickled = zlib.compress(
+                    session_pickled, response.session_redis_compression_level
+                )
+            redis_conn.set(key, session_pickled, ex=expiration)
+            return True
+        finally:
+            self.save_session_id_cookie()
+
+    def _touch_db_session(self, request, response):
+        """
+        Postpones the expiry of an unchanged sharded db session when half of
+        its lifetime is over
+        """
+        expires = response.session_db_expires
+        expiration = datetime.timedelta(seconds=response.session_db_expiration)
+        if response.session_db_record_id and expires:
+            if expires - request.now < expiration / 2:
+                table = response.session_db_table
+                table._db(table.id == response.session_db_record_id).update(
+                    expires_datetime=request.now + expiration
+                )
+
     def _try_store_in_cookie_or_file(self, request, response):
         if response.session_storage_type == "file":
             return self._try_store_in_file(request, response)
@@ -1678,11 +2191,13 @@ class Session(Storage):
             if (
                 not response.session_id
                 or not response.session_filename
-                or self._forget
+                or dict.get(self, "_forget")
                 or self._unchanged(response)
             ):
                 # self.clear_session_cookies()
                 return False
+            elif response.session_stored and not response.session_new:
+                return self._try_merge_in_file(response)
             else:
                 if response.session_new or not response.session_file:
                     # Tests if the session sub-folder exists, if not, create it
@@ -1705,6 +2220,42 @@ class Session(Storage):
             self._close(response)
             self.save_session_id_cookie()
 
+    def _try_merge_in_file(self, response):
+        """
+        Saves a session read with a shared lock: if the stored session was
+        changed meanwhile, the keys changed by this request are applied to it
+        """
+        stored, loads = response.session_stored
+        try:
+            response.session_file = recfile.open(response.session_filename, "rb+")
+        except IOError:
+            # removed meanwhile
+            response.session_file = recfile.open(response.session_filename, "wb")
+        portalocker.lock(response.session_file, portalocker.LOCK_EX)
+        response.session_locked = True
+        current_pickled = response.session_file.read()
+        if current_pickled and current_pickled != stored:
+            try:
+                session_data = loads(current_pickled)
+            except Exception:
+                session_data = dict(dict.items(self))
+            before = loads(stored)
+            for key in set(before) | set(dict.keys(self)):
+                if key not in self:
+                    session_data.pop(key, None)
+                elif key not in before or before[key] != dict.get(self, key):
+                    session_data[key] = dict.get(self, key)
+            dict.clear(self)
+            dict.update(self, session_data)
+            response.session_pickled = None
+        session_pickled = response.session_pickled or pickle.dumps(
+            self, pickle.HIGHEST_PROTOCOL
+        )
+        response.session_file.seek(0)
+        response.session_file.write(session_pickled)
+        response.session_file.truncate()
+        return True
+
     def _unlock(self, response):
         if response and response.session_file and response.session_locked:
             try:
@@ -14,6 +14,8 @@ import base64
 import copy
 import copyreg
 import functools
+import hashlib
+import hmac
 import itertools
 import os
 import pickle
@@ -25,12 +27,12 @@ from html.parser import HTMLParser
 from urllib.parse import quote as urllib_quote
 from urllib.parse import urlencode
 
+from pydal._compat import to_bytes
 from yatl import sanitizer
 from gluon import decoder
 from gluon.highlight import highlight
 from gluon.storage import Storage
 from gluon.utils import compare, web2py_uuid
-from gluon.validators import simple_hash
 
 
 def local_html_escape(data, quote=False):
@@ -54,6 +56,8 @@ regex_crlf = re.compile("\r|\n")
 
 join = "".join
 
+url_signers = dict()  # hmac objects by explicit key and salt, see url_signature
+
 # name2codepoint is incomplete respect to xhtml (and xml): 'apos' is missing.
 entitydefs = dict([(k_v[0], chr(k_v[1])) for k_v in name2codepoint.items()])
 entitydefs.setdefault("apos", "'")
@@ -185,6 +189,29 @@ class SafeString(str):
         return self
 
 
+def url_signature(message, hmac_key, salt="", cache=True):
+    """
+    Same as `simple_hash(message, hmac_key, salt, digest_alg="sha1")` but
+    copies an hmac already initialized with the key, since all the links of
+    a page are usually signed with the same one. Pass cache=False for keys
+    that must not be kept in memory (e.g. the per-user keys of
+    user_signature)
+    """
+    key = (hmac_key, salt)
+    signer = url_signers.get(key) if cache else None
+    if signer is None:
+        signer = hmac.new(to_bytes(hmac_key) + to_bytes(salt), digestmod=hashlib.sha1)
+        if not cache:
+            signer.update(to_bytes(message))
+            return signer.hexdigest()
+        if len(url_signers) >= 100:
+            url_signers.clear()
+        url_signers[key] = signer
+    signer = signer.copy()
+    signer.update(to_bytes(message))
+    return signer.hexdigest()
+
+
 def URL(
     a=None,
     c=None,
@@ -391,11 +418,13 @@ def URL(
         for val in vals:
             list_vars.append((key, val))
 
+    cache_key = True
     if user_signature:
         from gluon.globals import current
 
         if current.session.auth:
             hmac_key = current.session.auth.hmac_key
+            cache_key = False
 
     if hmac_key:
         # generate an hmac signature of the vars & args so can later
@@ -415,7 +444,7 @@ def URL(
 
         # re-assembling the same way during hash authentication
         message = h_args + "?" + urlencode(sorted(h_vars))
-        sig = simple_hash(message, hmac_key or "", salt or "", digest_alg="sha1")
+        sig = url_signature(message, hmac_key, salt or "", cache_key)
         # add the signature into vars
         list_vars.append(("_signature", sig))
 
@@ -565,7 +594,7 @@ def verifyURL(
     message = h_args + "?" + urlencode(sorted(h_vars))
 
     # hash with the hmac_key provided
-    sig = simple_hash(message, str(hmac_key), salt or "", digest_alg="sha1")
+    sig = url_signature(message, str(hmac_key), salt or "", not user_signature)
 
     # put _signature back in get_vars just in case a second call to URL.verify is performed
     # (otherwise it'll immediately return false)
@@ -10,6 +10,7 @@ HTTP statuses helpers
 --------------------------------------------
 """
 
+import hashlib
 import re
 from urllib.parse import quote as urllib_quote
 from xml.sax.saxutils import escape as xml_escape
@@ -19,6 +20,8 @@ __all__ = [
     "redirect",
     "content_disposition_filename",
     "content_disposition_header",
+    "etag",
+    "etag_matches",
 ]
 
 # RFC 7230 token characters: the only bytes allowed in a Content-Disposition
@@ -123,6 +126,23 @@ class HTTP(Exception):
                 str(cookie)[11:] for cookie in cookies.values()
             ]
 
+    def revalidate(self, if_none_match):
+        """
+        Adds a strong ETag computed from the body of a 200 response and turns
+        it into a 304 with an empty body if it matches `if_none_match` (the
+        value of the request If-None-Match header). Bodies that are not
+        strings and responses that already carry an ETag are left alone.
+        """
+        if self.status != 200 or not isinstance(self.body, (str, bytes, bytearray)):
+            return self
+        tag = self.headers.get("ETag")
+        if tag is None:
+            tag = self.headers["ETag"] = etag(self.body)
+        if etag_matches(if_none_match, tag):
+            self.status = 304
+            self.body = ""
+        return self
+
     def to(self, responder, env=None):
         env = env or {}
         status = self.status
@@ -190,6 +210,33 @@ class HTTP(Exception):
         return self.message
 
 
+def etag(body):
+    """Returns a strong ETag (quoted md5 digest) for a str or bytes `body`"""
+    if isinstance(body, str):
+        body = body.encode("utf8")
+    return '"%s"' % hashlib.md5(body).hexdigest()
+
+
+def etag_matches(if_none_match, tag):
+    """
+    True if the value of an If-None-Match header matches the ETag `tag`.
+    As RFC 7232 requires, the comparison is weak (W/ prefixes are ignored).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for item in if_none_match.split(","):
+        item = item.strip()
+        if item.startswith("W/"):
+            item = item[2:]
+        if item == tag:
+            return True
+    return False
+
+
 def redirect(location="", how=303, client_side=False, headers=None):
     """Raises a redirect (303)
 
@@ -12,6 +12,7 @@ Translation system
 """
 
 import ast
+import atexit
 import builtins
 import copyreg
 import logging
@@ -19,7 +20,8 @@ import os
 import pkgutil
 import re
 import sys
-from threading import RLock
+import time
+from threading import Lock, RLock, Thread
 
 from pydal.contrib.portalocker import LockedFile, read_locked
 from yatl.sanitizer import xmlescape
@@ -112,12 +114,12 @@ def markmin(s):
 ttab_in = str.maketrans("\\%{}", "\x1c\x1d\x1e\x1f")
 ttab_out = str.maketrans("\x1c\x1d\x1e\x1f", "\\%{}")
 
-# cache of translated messages:
+# cache of translated messages, compiled into MessageTemplates:
 # global_language_cache:
 # { 'languages/xx.py':
-#     ( {"def-message": "xx-message",
+#     ( {"def-message": MessageTemplate("xx-message"),
 #        ...
-#        "def-message": "xx-message"}, lock_object )
+#        "def-message": MessageTemplate("xx-message")}, lock_object )
 #  'languages/yy.py': ( {dict}, lock_object )
 #  ...
 # }
@@ -281,6 +283,119 @@ def read_possible_languages(langpath):
     )
 
 
+class LanguageCatalog(object):
+    """
+    What the translators of an application need from its languages folder,
+    computed once per process and shared by all the requests: the possible
+    languages, the default language, the plural rules of each language and
+    the language selected for each Accept-Language header.
+    """
+
+    def __init__(self, langpath, info):
+        self.langpath = langpath
+        self.info = info
+        self.languages = set(lang for lang in info if lang != "default")
+        default = info["default"]
+        if default[2] == 0:  # langfile_mtime
+            # languages/default.py is not found
+            self.default_language_file = langpath
+            self.default_languages = [DEFAULT_LANGUAGE]
+        else:
+            self.default_language_file = os.path.join(langpath, "default.py")
+            self.default_languages = [default[0]]  # !langcode!
+        self.plurals = {}
+        for language, lang_info in info.items():
+            (
+                pname,
+                pmtime,
+                plural_language,
+                nplurals,
+                get_plural_id,
+                construct_plural_form,
+            ) = lang_info[3:]
+            if pname:
+                pname = os.path.join(langpath, pname)
+            self.plurals[language] = (
+                pname,
+                pmtime,
+                plural_language,
+                nplurals,
+                get_plural_id,
+                construct_plural_form,
+            )
+        self.accepted = {}  # {(accept_language, current_languages): result}
+
+    def plural(self, language):
+        """
+        Returns `(plural_file, plural_file_mtime, plural_language, nplurals,
+        get_plural_id, construct_plural_form)` for the language
+        """
+        return self.plurals.get(language) or (
+            None,
+            0,
+            "default",
+            DEFAULT_NPLURALS,
+            DEFAULT_GET_PLURAL_ID,
+            DEFAULT_CONSTRUCT_PLURAL_FORM,
+        )
+
+    def select(self, languages, current_languages):
+        """
+        Returns the first of the requested languages that matches a possible
+        or current language, or "" if none does
+        """
+        language = ""
+        all_languages = self.languages | set(current_languages)
+        for lang in languages:
+            # compare "aa-bb" | "aa" from *language* parameter
+            # with strings from langlist using such alghorythm:
+            # xx-yy.py -> xx.py -> xx*.py
+            lang5 = lang[:5]
+            if lang5 in all_languages:
+                language = lang5
+            else:
+                lang2 = lang[:2]
+                if len(lang5) > 2 and lang2 in all_languages:
+                    language = lang2
+                else:
+                    for l in all_languages:
+                        if l[:2] == lang2:
+                            language = l
+            if language:
+                break
+        return language
+
+    def negotiate(self, accept_language, current_languages):
+        """
+        Returns the languages requested by an Accept-Language header and the
+        selected one, memoized for the header
+        """
+        key = (accept_language, tuple(current_languages))
+        result = self.accepted.get(key)
+        if result is None:
+            languages = tuple(regex_language.findall(accept_language.lower()))
+            result = (languages, self.select(languages, current_languages))
+            if len(self.accepted) >= 1000:
+                self.accepted.clear()
+            self.accepted[key] = result
+        return result
+
+
+catalogs = {}  # {langpath: LanguageCatalog}
+
+
+def get_catalog(langpath):
+    """
+    Returns the LanguageCatalog of `langpath`, built again when the
+    possible languages change
+    """
+    info = read_possible_languages(langpath)
+    catalog = catalogs.get(langpath)
+    if catalog is None or catalog.info is not info:
+        catalog = catalogs[langpath] = LanguageCatalog(langpath, info)
+    return catalog
+
+
 def read_plural_dict_aux(filename):
     lang_text = read_locked(filename).decode("utf8").replace("\r\n", "\n")
     try:
@@ -320,16 +435,20 @@ def write_plural_dict(filename, contents):
             fp.close()
 
 
+def write_dict_aux(fp, contents):
+    fp.write("# -*- coding: utf-8 -*-\n{\n")
+    for key in sorted(contents, key=lambda x: x.lower()):
+        fp.write("%s: %s,\n" % (repr(Utf8(key)), repr(Utf8(contents[key]))))
+    fp.write("}\n")
+
+
 def write_dict(filename, contents):
     if "__corrupted__" in contents:
         return
     fp = None
     try:
         fp = LockedFile(filename, "w")
-        fp.write("# -*- coding: utf-8 -*-\n{\n")
-        for key in sorted(contents, key=lambda x: x.lower()):
-            fp.write("%s: %s,\n" % (repr(Utf8(key)), repr(Utf8(contents[key]))))
-        fp.write("}\n")
+        write_dict_aux(fp, contents)
     except (IOError, OSError):
         if is_writable():
             logging.warning("Unable to write to file %s" % filename)
@@ -339,6 +458,231 @@ def write_dict(filename, contents):
             fp.close()
 
 
+def merge_dict(filename, contents):
+    """
+    Adds to the language file the messages of `contents` it does not have
+    yet, keeping what other threads, processes or the translators wrote
+    in the meantime
+    """
+    fp = None
+    try:
+        fp = LockedFile(filename, "a+")
+        fp.file.seek(0)
+        try:
+            current = safe_eval(fp.read().replace("\r\n", "\n")) or {}
+        except Exception:
+            return  # corrupted, see read_dict_aux
+        missing = [key for key in contents if key not in current]
+        if not missing:
+            return
+        current.update((key, contents[key]) for key in missing)
+        fp.file.seek(0)
+        fp.file.truncate(0)
+        write_dict_aux(fp, current)
+    except (IOError, OSError):
+        if is_writable():
+            logging.warning("Unable to write to file %s" % filename)
+    finally:
+        if fp:
+            fp.close()
+
+
+class LanguageWriter(object):
+    """
+    Adds the messages missing from the language files in a background
+    thread, that merges them into each file at most once every `interval`
+    seconds, instead of rewriting the file in the request thread for every
+    new message.
+
+    Set `enabled` to False in production to never write the language and
+    plural files.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.enabled = True
+        self.pending = {}  # {filename: {message: translation}}
+        self.lock = Lock()
+        self.thread = None
+
+    def add(self, filename, message, translation):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.pending.setdefault(filename, {})[message] = translation
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = Thread(target=self.run, name="language writer")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+
+    def flush(self):
+        """
+        Writes the pending messages now
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for filename, contents in pending.items():
+            merge_dict(filename, contents)
+
+
+language_writer = LanguageWriter()
+atexit.register(language_writer.flush)
+
+
+def parse_placeholder(s):
+    """
+    Parses the string `s` in a `%{}` placeholder, once the parameters are
+    substituted, into `(kind, word, ref, case, fun, parts)` or None if it is
+    not a plural-forms placeholder.
+
+    String in `%{}` is transformed by this rules. If string starts with
+    `!` or `?` such transformations take place:
+
+        "!string of words" -> "String of word" (Capitalize)
+        "!!string of words" -> "String Of Word" (Title)
+        "!!!string of words" -> "STRING OF WORD" (Upper)
+
+        "?word1?number" -> "word1" or "number"
+                      (return word1 if number == 1,
+                       return number otherwise)
+        "??number" or "?number" -> "" or "number"
+                      (as above with word1 = "")
+
+        "?word1?number?word0" -> "word1" or "number" or "word0"
+                      (return word1 if number == 1,
+                       return word0 if number == 0,
+                       return number otherwise)
+        "?word1?number?" -> "word1" or "number" or ""
+                      (as above with word0 = "")
+        "??number?word0" -> "number" or "word0"
+                      (as above with word1 = "")
+        "??number?" -> "number" or ""
+                      (as above with word1 = word0 = "")
+
+        "?word1?word[number]" -> "word1" or "word"
+                      (return word1 if symbols[number] == 1,
+                       return word otherwise)
+        "?word1?[number]" -> "" or "word1"
+                      (as above with word = "")
+        "??word[number]" or "?word[number]" -> "" or "word"
+                      (as above with word1 = "")
+
+        "?word1?word?word0[number]" -> "word1" or "word" or "word0"
+                      (return word1 if symbols[number] == 1,
+                       return word0 if symbols[number] == 0,
+                       return word otherwise)
+        "?word1?word?[number]" -> "word1" or "word" or ""
+                      (as above with word0 = "")
+        "??word?word0[number]" -> "" or "word" or "word0"
+                      (as above with word1 = "")
+        "??word?[number]" -> "" or "word"
+                      (as above with word1 = word0 = "")
+
+    Other strings, (those not starting with  `!` or `?`)
+    are processed by self.plural
+    """
+    m = regex_plural_tuple.match(s)
+    if m:
+        # word[number] or word, ref is the index of the number in symbols
+        kind = "tuple"
+        w, i = m.group("w", "i")
+        ref = None if i is None else int(i)
+    else:
+        m = regex_plural_dict.match(s)
+        if not m:
+            return None
+        # word(key or num), ref is the number or its key in symbols
+        kind = "dict"
+        w, n = m.group("w", "n")
+        ref = int(n) if n.isdigit() else n
+    c = w[0] if w[0] in "!?" else ""
+    fun = parts = None
+    if c == "?":
+        p1, sep, p2 = w[1:].partition("?")
+        part1 = p1 if sep else ""
+        part2, sep, part3 = (p2 if sep else p1).partition("?")
+        if not sep:
+            part3 = part2
+        parts = (part1, part2, part3)
+    elif c == "!":
+        if w.startswith("!!!"):
+            w, fun = w[3:], str.upper
+        elif w.startswith("!!"):
+            w, fun = w[2:], str.title
+        else:
+            w, fun = w[1:], str.capitalize
+    return (kind, w, ref, c, fun, parts)
+
+
+class MessageTemplate(object):
+    """
+    A translated message compiled once for all its renderings: its text
+    when there are no parameters and its `%{}` placeholders parsed by
+    parse_placeholder
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.text = message.translate(ttab_out)
+        self.placeholders = {}
+
+    def substitute(self, T, symbols):
+        """
+        Substitutes parameters from symbols into message using %, then
+        renders the `%{}` placeholders with T.plural
+        """
+        message = self.message % symbols
+        if "%{" not in message:
+            return message
+        return regex_plural.sub(
+            lambda m: self.render_placeholder(T, symbols, m), message
+        )
+
+    def render_placeholder(self, T, symbols, m):
+        s = m.group(1)
+        placeholder = self.placeholders.get(s, False)
+        if placeholder is False:
+            placeholder = parse_placeholder(s)
+            if len(self.placeholders) >= 100:
+                self.placeholders.clear()
+            self.placeholders[s] = placeholder
+        if placeholder is None:
+            return m.group(0)
+        kind, w, ref, c, fun, parts = placeholder
+        # without [number], ?... and !... placeholders take no symbol
+        numbered = kind == "dict" or ref is not None or not c
+        if not numbered:
+            n = None
+        elif kind == "tuple":
+            n = symbols[ref or 0]
+        else:
+            n = ref if isinstance(ref, int) else symbols[ref]
+        if c == "?":
+            part1, part2, part3 = parts
+            if numbered:
+                num = int(n)
+            elif part2:
+                # ?[word]?number[?number] or ?number
+                num = int(part2)
+            else:
+                return m.group(0)
+            part = part1 if num == 1 else part3 if num == 0 else part2
+        elif c == "!":
+            part = fun(T.plural(w, n)) if numbered else fun(w)
+        else:
+            part = T.plural(w, n)
+        return m.group(0) if part == s else part
+
+
 class lazyT(object):
     """
     Never to be called explicitly, returned by
@@ -462,6 +806,8 @@ class TranslatorFactory(object):
         - en and en-en are considered different languages!
         - if language xx-yy is not found force() probes other similar languages
           using such algorithm: `xx-yy.py -> xx.py -> xx-yy*.py -> xx*.py`
+        - missing messages are added to the language file in background by
+          `language_writer`, `language_writer.enabled = False` turns it off
     """
 
     def __init__(self, langpath, http_accept_language):
@@ -556,16 +902,14 @@ class TranslatorFactory(object):
             languages = languages[0]
         if not languages or languages[0] is None:
             # set default language from default.py/DEFAULT_LANGUAGE
-            pl_info = self.get_possible_languages_info("default")
-            if pl_info[2] == 0:  # langfile_mtime
+            catalog = get_catalog(self.langpath)
+            self.default_language_file = catalog.default_language_file
+            if self.default_language_file == self.langpath:
                 # if languages/default.py is not found
-                self.default_language_file = self.langpath
                 self.default_t = {}
-                self.current_languages = [DEFAULT_LANGUAGE]
             else:
-                self.default_language_file = os.path.join(self.langpath, "default.py")
                 self.default_t = read_dict(self.default_language_file)
-                self.current_languages = [pl_info[0]]  # !langcode!
+            self.current_languages = list(catalog.default_languages)
         else:
             self.current_languages = list(languages)
         self.force(self.http_accept_language)
@@ -605,7 +949,12 @@ class TranslatorFactory(object):
                     form = self.construct_plural_form(word, id)
                     forms[id - 1] = form
                     self.plural_dict[word] = forms
-                    if self.is_writable and is_writable() and self.plural_file:
+                    if (
+                        self.is_writable
+                        and language_writer.enabled
+                        and is_writable()
+                        and self.plural_file
+                    ):
                         write_plural_dict(self.plural_file, self.plural_dict)
                     return form
         return word
@@ -622,73 +971,42 @@ class TranslatorFactory(object):
         default language will be selected if none
         of them matches possible_languages.
         """
-        pl_info = read_possible_languages(self.langpath)
+        catalog = get_catalog(self.langpath)
 
         def set_plural(language):
             """
             initialize plural forms subsystem
             """
-            lang_info = pl_info.get(language)
-            if lang_info:
-                (
-                    pname,
-                    pmtime,
-                    self.plural_language,
-                    self.nplurals,
-                    self.get_plural_id,
-                    self.construct_plural_form,
-                ) = lang_info[3:]
-                pdict = {}
-                if pname:
-                    pname = os.path.join(self.langpath, pname)
-                    if pmtime != 0:
-                        pdict = read_plural_dict(pname)
-                self.plural_file = pname
-                self.plural_dict = pdict
-            else:
-                self.plural_language = "default"
-                self.nplurals = DEFAULT_NPLURALS
-                self.get_plural_id = DEFAULT_GET_PLURAL_ID
-                self.construct_plural_form = DEFAULT_CONSTRUCT_PLURAL_FORM
-                self.plural_file = None
-                self.plural_dict = {}
+            (
+                pname,
+                pmtime,
+                self.plural_language,
+                self.nplurals,
+                self.get_plural_id,
+                self.construct_plural_form,
+            ) = catalog.plural(language)
+            self.plural_file = pname
+            self.plural_dict = read_plural_dict(pname) if pmtime != 0 else {}
 
-        language = ""
         if len(languages) == 1 and isinstance(languages[0], str):
-            languages = regex_language.findall(languages[0].lower())
-        elif not languages or languages[0] is None:
-            languages = []
-        self.requested_languages = languages = tuple(languages)
-        if languages:
-            all_languages = set(lang for lang in pl_info if lang != "default") | set(
-                self.current_languages
+            languages, language = catalog.negotiate(
+                languages[0], self.current_languages
             )
-            for lang in languages:
-                # compare "aa-bb" | "aa" from *language* parameter
-                # with strings from langlist using such alghorythm:
-                # xx-yy.py -> xx.py -> xx*.py
-                lang5 = lang[:5]
-                if lang5 in all_languages:
-                    language = lang5
-                else:
-                    lang2 = lang[:2]
-                    if len(lang5) > 2 and lang2 in all_languages:
-                        language = lang2
-                    else:
-                        for l in all_languages:
-                            if l[:2] == lang2:
-                                language = l
-                if language:
-                    if language in self.current_languages:
-                        break
-                    self.language_file = os.path.join(self.langpath, language + ".py")
-                    self.t = read_dict(self.language_file)
-                    self.cache = global_language_cache.setdefault(
-                        self.language_file, ({}, RLock())
-                    )
-                    set_plural(language)
-                    self.accepted_language = language
-                    return languages
+        else:
+            if not languages or languages[0] is None:
+                languages = ()
+            languages = tuple(languages)
+            language = catalog.select(languages, self.current_languages)
+        self.requested_languages = languages
+        if language and language not in self.current_languages:
+            self.language_file = os.path.join(self.langpath, language + ".py")
+            self.t = read_dict(self.language_file)
+            self.cache = global_language_cache.setdefault(
+                self.language_file, ({}, RLock())
+            )
+            set_plural(language)
+            self.accepted_language = language
+            return languages
         self.accepted_language = language
         if not language:
             if self.current_languages:
@@ -752,8 +1070,10 @@ class TranslatorFactory(object):
             prefix = "@" + (ftag or "userdef") + "\x01"
         else:
             prefix = "@" + self.ftag + "\x01"
-        message = get_from_cache(
-            self.cache, prefix + message, lambda: get_tr(message, prefix, filter)
+        template = get_from_cache(
+            self.cache,
+            prefix + message,
+            lambda: MessageTemplate(get_tr(message, prefix, filter)),
         )
         if symbols or symbols == 0 or symbols == "":
             if isinstance(symbols, dict):
@@ -773,8 +1093,8 @@ class TranslatorFactory(object):
                     )
                     for value in symbols
                 )
-            message = self.params_substitution(message, symbols)
-        return XML(message.translate(ttab_out)).xml()
+            return XML(self.substitute(template, symbols).translate(ttab_out)).xml()
+        return XML(template.text).xml()
 
     def M(
         self,
@@ -834,7 +1154,7 @@ class TranslatorFactory(object):
             and is_writable()
             and self.language_file != self.default_language_file
         ):
-            write_dict(self.language_file, self.t)
+            language_writer.add(self.language_file, key, mt)
         return regex_backslash.sub(lambda m: m.group(1).translate(ttab_in), mt)
 
     def params_substitution(self, message, symbols):
@@ -848,162 +1168,24 @@ class TranslatorFactory(object):
         Note:
             *symbols* MUST BE OR tuple OR dict of parameters!
         """
+        return MessageTemplate(message).substitute(self, symbols)
 
-        def sub_plural(m):
-            """String in `%{}` is transformed by this rules:
-            If string starts with  `!` or `?` such transformations
-            take place:
-
-                "!string of words" -> "String of word" (Capitalize)
-                "!!string of words" -> "String Of Word" (Title)
-                "!!!string of words" -> "STRING OF WORD" (Upper)
-
-                "?word1?number" -> "word1" or "number"
-                              (return word1 if number == 1,
-                               return number otherwise)
-                "??number" or "?number" -> "" or "number"
-                              (as above with word1 = "")
-
-                "?word1?number?word0" -> "word1" or "number" or "word0"
-                              (return word1 if number == 1,
-                               return word0 if number == 0,
-                               return number otherwise)
-                "?word1?number?" -> "word1" or "number" or ""
-                              (as above with word0 = "")
-                "??number?word0" -> "number" or "word0"
-                              (as above with word1 = "")
-                "??number?" -> "number" or ""
-                              (as above with word1 = word0 = "")
-
-                "?word1?word[number]" -> "word1" or "word"
-                              (return word1 if symbols[number] == 1,
-                               return word otherwise)
-                "?word1?[number]" -> "" or "word1"
-                              (as above with word = "")
-                "??word[number]" or "?word[number]" -> "" or "word"
-                              (as above with word1 = "")
-
-                "?word1?word?word0[number]" -> "word1" or "word" or "word0"
-                              (return word1 if symbols[number] == 1,
-                               return word0 if symbols[number] == 0,
-                               return word otherwise)
-                "?word1?word?[number]" -> "word1" or "word" or ""
-                              (as above with word0 = "")
-                "??word?word0[number]" -> "" or "word" or "word0"
-                              (as above with word1 = "")
-                "??word?[number]" -> "" or "word"
-                              (as above with word1 = word0 = "")
-
-            Other strings, (those not starting with  `!` or `?`)
-            are processed by self.plural
-            """
-
-            def sub_tuple(m):
-                """word
-                !word, !!word, !!!word
-                ?word1?number
-                     ??number, ?number
-                ?word1?number?word0
-                ?word1?number?
-                     ??number?word0
-                     ??number?
-
-                word[number]
-                !word[number], !!word[number], !!!word[number]
-                ?word1?word[number]
-                ?word1?[number]
-                     ??word[number], ?word[number]
-                ?word1?word?word0[number]
-                ?word1?word?[number]
-                     ??word?word0[number]
-                     ??word?[number]
-                """
-                w, i = m.group("w", "i")
-                c = w[0]
-                if c not in "!?":
-                    return self.plural(w, symbols[int(i or 0)])
-                elif c == "?":
-                    (p1, sep, p2) = w[1:].partition("?")
-                    part1 = p1 if sep else ""
-                    (part2, sep, part3) = (p2 if sep else p1).partition("?")
-                    if not sep:
-                        part3 = part2
-                    if i is None:
-                        # ?[word]?number[?number] or ?number
-                        if not part2:
-                            return m.group(0)
-                        num = int(part2)
-                    else:
-                        # ?[word1]?word[?word0][number]
-                        num = int(symbols[int(i or 0)])
-                    return part1 if num == 1 else part3 if num == 0 else part2
-                elif w.startswith("!!!"):
-                    word = w[3:]
-                    fun = lambda x: x.upper()
-                elif w.startswith("!!"):
-                    word = w[2:]
-                    fun = lambda x: x.title()
-                else:
-                    word = w[1:]
-                    fun = lambda x: x.capitalize()
-                if i is not None:
-                    return fun(self.plural(word, symbols[int(i)]))
-                return fun(word)
-
-            def sub_dict(m):
-                """word(key or num)
-                !word(key or num), !!word(key or num), !!!word(key or num)
-                ?word1?word(key or num)
-                     ??word(key or num), ?word(key or num)
-                ?word1?word?word0(key or num)
-                ?word1?word?(key or num)
-                     ??word?word0(key or num)
-                ?word1?word?(key or num)
-                     ??word?(key or num), ?word?(key or num)
-                """
-                w, n = m.group("w", "n")
-                c = w[0]
-                n = int(n) if n.isdigit() else symbols[n]
-                if c not in "!?":
-                    return self.plural(w, n)
-                elif c == "?":
-                    # ?[word1]?word[?word0](key or num), ?[word1]?word(key or num) or ?word(key or num)
-                    (p1, sep, p2) = w[1:].partition("?")
-                    part1 = p1 if sep else ""
-                    (part2, sep, part3) = (p2 if sep else p1).partition("?")
-                    if not sep:
-                        part3 = part2
-                    num = int(n)
-                    return part1 if num == 1 else part3 if num == 0 else part2
-                elif w.startswith("!!!"):
-                    word = w[3:]
-                    fun = lambda x: x.upper()
-                elif w.startswith("!!"):
-                    word = w[2:]
-                    fun = lambda x: x.title()
-                else:
-                    word = w[1:]
-                    fun = lambda x: x.capitalize()
-                s = fun(self.plural(word, n))
-                return s
-
-            s = m.group(1)
-            part = regex_plural_tuple.sub(sub_tuple, s)
-            if part == s:
-                part = regex_plural_dict.sub(sub_dict, s)
-                if part == s:
-                    return m.group(0)
-            return part
-
-        message = message % symbols
-        message = regex_plural.sub(sub_plural, message)
-        return message
+    def substitute(self, template, symbols):
+        """
+        Substitutes symbols into the MessageTemplate `template`, through
+        params_substitution if a subclass overrides it
+        """
+        if type(self).params_substitution is not TranslatorFactory.params_substitution:
+            return self.params_substitution(template.message, symbols)
+        return template.substitute(self, symbols)
 
     def translate(self, message, symbols):
         """
         Gets cached translated message with inserted parameters(symbols)
         """
-        message = get_from_cache(self.cache, message, lambda: self.get_t(message))
+        template = get_from_cache(
+            self.cache, message, lambda: MessageTemplate(self.get_t(message))
+        )
         if symbols or symbols == 0 or symbols == "":
             if isinstance(symbols, dict):
                 symbols.update(
@@ -1022,8 +1204,8 @@ class TranslatorFactory(object):
                     )
                     for value in symbols
                 )
-            message = self.params_substitution(message, symbols)
-        return message.translate(ttab_out)
+            return self.substitute(template, symbols).translate(ttab_out)
+        return template.text
 
 
 def findT(path, language=DEFAULT_LANGUAGE):
@@ -25,6 +25,7 @@ from urllib.parse import quote
 from gluon.fileutils import (
     abspath,
     add_path_first,
+    app_registry,
     create_missing_app_folders,
     create_missing_folders,
     read_file,
@@ -409,8 +410,8 @@ def wsgibase(environ, responder):
                 # access the requested application
                 # ##################################################
 
-                disabled = pjoin(request.folder, "DISABLED")
-                if not exists(request.folder):
+                app_state = app_registry.get(request.folder)
+                if not app_state.exists:
                     if app == rwthread.routes.default_application and app != "welcome":
                         redirect(URL("welcome", "default", "index"))
                     elif rwthread.routes.error_handler:
@@ -429,7 +430,7 @@ def wsgibase(environ, responder):
                             rwthread.routes.error_message % "invalid request",
                             web2py_error="invalid application",
                         )
-                elif not request.is_local and exists(disabled):
+                elif not request.is_local and app_state.disabled:
                     five0three = os.path.join(request.folder, "static", "503.html")
                     if os.path.exists(five0three):
                         raise HTTP(503, open(five0three, "r").read())
@@ -479,7 +480,9 @@ def wsgibase(environ, responder):
                 # ##################################################
 
                 if not env.web2py_disable_session:
-                    session.connect(request, response)
+                    session.connect(
+                        request, response, lazy=bool(env.web2py_lazy_session)
+                    )
 
                 # ##################################################
                 # run controller
@@ -533,9 +536,11 @@ def wsgibase(environ, responder):
                         )
 
                     if request.ajax:
-                        if response.flash:
+                        # do not load the session only to look for a flash
+                        flash = response.get("flash")
+                        if flash:
                             http_response.headers["web2py-component-flash"] = quote(
-                                xmlescape(response.flash).replace("\n", "")
+                                xmlescape(flash).replace("\n", "")
                             )
                         if response.js:
                             http_response.headers["web2py-component-command"] = quote(
@@ -549,6 +554,16 @@ def wsgibase(environ, responder):
                     session._fixup_before_save()
                     http_response.cookies2headers(response.cookies)
 
+                    # ##################################################
+                    # if asked to, answer revalidations with a 304
+                    # ##################################################
+
+                    if response.auto_etag and request.env.request_method in (
+                        "GET",
+                        "HEAD",
+                    ):
+                        http_response.revalidate(env.http_if_none_match)
+
                 ticket = None
 
             except RestrictedError as e:
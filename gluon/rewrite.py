@@ -22,6 +22,11 @@ import threading
 import traceback
 from urllib.parse import quote, quote_plus, unquote
 
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
 from gluon.fileutils import abspath, read_file
 from gluon.http import HTTP
 from gluon.settings import global_settings
@@ -84,6 +89,96 @@ def _router_default():
     return router
 
 
+def route_prefix(regex):
+    """
+    Returns the literal text the path must start with for the compiled
+    routes regex to match a key, or None if it cannot be told (e.g. the
+    regex has a top level alternative or ignores the case)
+    """
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    prefix = None
+    for op, av in parsed:
+        if op is sre_parse.BRANCH:
+            return None
+        elif prefix is None:
+            # the path starts after the first space
+            if op is sre_parse.LITERAL and av == 32:
+                prefix = ""
+        elif op is sre_parse.LITERAL:
+            prefix += chr(av)
+        else:
+            break
+    return prefix
+
+
+class RouteTable(list):
+    """
+    The compiled `(regex, value, env)` routes of routes_app, routes_in or
+    routes_out, with a trie of the routes by the literal prefix of their
+    path. A key is matched only against the routes whose prefix its path
+    starts with (and those without a known prefix), in the routes order,
+    so the first match is the same as trying every route in turn.
+    """
+
+    def __init__(self, routes=()):
+        list.__init__(self, routes)
+        self.index = None
+
+    def append(self, route):
+        list.append(self, route)
+        self.index = None
+
+    def build(self):
+        trie, unindexed = {}, []
+        for i, route in enumerate(self):
+            prefix = route_prefix(route[0])
+            if prefix is None:
+                unindexed.append(i)
+                continue
+            node = trie
+            for c in prefix:
+                node = node.setdefault(c, {})
+            node.setdefault(None, []).append(i)
+        self.index = (trie, unindexed)
+        return self.index
+
+    def candidates(self, key):
+        """
+        Returns the routes that may match `key`, in order
+        """
+        # keys are "[remote address]:[protocol]://[host]:[method] [path]",
+        # the path can be told apart only if there is no other space
+        if key.count(" ") != 1:
+            return self
+        trie, unindexed = self.index or self.build()
+        found = list(unindexed)
+        node = trie
+        found.extend(node.get(None, ()))
+        for c in key[key.index(" ") + 1 :]:
+            node = node.get(c)
+            if node is None:
+                break
+            found.extend(node.get(None, ()))
+        if len(found) == len(self):
+            return self
+        found.sort()
+        return [self[i] for i in found]
+
+    def match(self, key):
+        """
+        Returns the first route matching `key`, or None
+        """
+        for route in self.candidates(key):
+            if route[0].match(key):
+                return route
+        return None
+
+
 def _params_default(app=None):
     """Returns a new copy of default parameters"""
     p = Storage()
@@ -91,9 +186,9 @@ def _params_default(app=None):
     p.default_application = app or "init"
     p.default_controller = "default"
     p.default_function = "index"
-    p.routes_app = []
-    p.routes_in = []
-    p.routes_out = []
+    p.routes_app = RouteTable()
+    p.routes_in = RouteTable()
+    p.routes_out = RouteTable()
     p.routes_onerror = []
     p.routes_apps_raw = []
     p.error_handler = None
@@ -112,6 +207,8 @@ params_apps = dict()
 params = _params_default(app=None)  # regex rewrite parameters
 THREAD_LOCAL.routes = params  # default to base regex rewrite parameters
 routers = None
+url_out_cache = dict()  # memoized map_url_out results, cleared by load
+URL_OUT_CACHE_SIZE = 10000
 
 
 def log_rewrite(string):
@@ -351,6 +448,7 @@ def load(routes="routes.py", app=None, data=None, rdict=None):
     """
     global params
     global routers
+    url_out_cache.clear()
     if app is None:
         # reinitialize
         global params_apps
@@ -573,6 +671,13 @@ def load_routers(all_apps):
         # compile URL validation patterns
         router._acfe_match = re.compile(router.acfe_match)
         router._file_match = re.compile(router.file_match)
+        # names that keep the function in outgoing urls as their first arg
+        if isinstance(router.controllers, str):
+            router._out_names = None  # any
+        else:
+            router._out_names = set(routers.BASE.applications).union(
+                router.controllers, *router.functions.values()
+            )
         if router.args_match:
             router._args_match = re.compile(router.args_match)
         # convert path_prefix to a list of path elements
@@ -622,12 +727,13 @@ def regex_uri(e, regexes, tag, default=None):
         e.get("REQUEST_METHOD", "get").lower(),
         path,
     )
-    for regex, value, custom_env in regexes:
-        if regex.match(key):
-            e.update(custom_env)
-            rewritten = regex.sub(value, key)
-            log_rewrite("%s: [%s] [%s] -> %s" % (tag, key, value, rewritten))
-            return rewritten
+    route = regexes.match(key)
+    if route:
+        regex, value, custom_env = route
+        e.update(custom_env)
+        rewritten = regex.sub(value, key)
+        log_rewrite("%s: [%s] [%s] -> %s" % (tag, key, value, rewritten))
+        return rewritten
     log_rewrite("%s: [%s] -> %s (not rewritten)" % (tag, key, default))
     return default
 
@@ -774,11 +880,12 @@ def regex_filter_out(url, e=None):
             )
         else:
             items[0] = ":http://localhost:get %s" % items[0]
-        for regex, value, tmp in routes.routes_out:
-            if regex.match(items[0]):
-                rewritten = "?".join([regex.sub(value, items[0])] + items[1:])
-                log_rewrite("routes_out: [%s] -> %s" % (url, rewritten))
-                return rewritten
+        route = routes.routes_out.match(items[0])
+        if route:
+            regex, value, tmp = route
+            rewritten = "?".join([regex.sub(value, items[0])] + items[1:])
+            log_rewrite("routes_out: [%s] -> %s" % (url, rewritten))
+            return rewritten
     log_rewrite("routes_out: [%s] not rewritten" % url)
     return url
 
@@ -1555,7 +1662,36 @@ def map_url_out(
     We use [applications] and [controllers] and {functions} to suppress ambiguous omissions.
 
     We assume that language names do not collide with a/c/f names.
+
+    The result depends on args only through their presence and the first
+    one, and only when it is an application, controller or function name,
+    so it is memoized in url_out_cache for the other calls.
     """
+    if request:
+        domain = (request.env.domain_application, request.env.domain_controller)
+        language = language or request.uri_language
+    else:
+        domain = None
+    arg0 = args[0] if args else None
+    router = routers[application] if application in routers else routers.BASE
+    names = router._out_names
+    if not isinstance(arg0, str) or (
+        names is not None and arg0 not in names and not (domain and arg0 == domain[0])
+    ):
+        arg0 = None
+    key = (
+        application,
+        controller,
+        function,
+        bool(args),
+        arg0,
+        language,
+        domain,
+        not host,
+    )
+    acf = url_out_cache.get(key)
+    if acf is not None:
+        return acf
     map = MapUrlOut(
         request,
         env,
@@ -1569,7 +1705,11 @@ def map_url_out(
         port,
         language,
     )
-    return map.acf()
+    acf = map.acf()
+    if len(url_out_cache) >= URL_OUT_CACHE_SIZE:
+        url_out_cache.clear()
+    url_out_cache[key] = acf
+    return acf
 
 
 def get_effective_router(appname):
@@ -11,11 +11,23 @@ Facilities to handle file streaming
 """
 
 import errno
+import gzip
 import os
 import re
 import stat
 import time
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from gluon.cfs import CodeCache
 from gluon.contenttype import contenttype
 from gluon.http import HTTP
 from gluon.utils import unlocalised_http_header_date
@@ -26,6 +38,66 @@ regex_suffix_range = re.compile(r"^bytes=-(\d+)$")
 
 DEFAULT_CHUNK_SIZE = 64 * 1024
 
+# extensions of the precompressed variants of a static file, by encoding
+PRECOMPRESSED = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+
+def compressors():
+    """
+    Returns the functions compressing bytes for each encoding whose module
+    is installed (gzip always is)
+    """
+    functions = {"gzip": lambda data: gzip.compress(data, 9, mtime=0)}
+    if brotli:
+        functions["br"] = lambda data: brotli.compress(data, quality=11)
+    if zstandard:
+        functions["zstd"] = zstandard.ZstdCompressor(level=19).compress
+    return functions
+
+
+def precompress(filename, encodings=None):
+    """
+    Writes the precompressed variants of `filename` (e.g. `filename.br`)
+    for `encodings` (all those available by default) next to it, with its
+    timestamps so that they are served for it. Variants that would not be
+    smaller than the file are removed instead. Returns the bytes saved.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    stat_file = os.stat(filename)
+    saved = 0
+    for encoding, compress in compressors().items():
+        if encodings is not None and encoding not in encodings:
+            continue
+        variant = filename + PRECOMPRESSED[encoding]
+        compressed = compress(data)
+        if len(compressed) >= len(data):
+            if os.path.exists(variant):
+                os.unlink(variant)
+            continue
+        with open(variant, "wb") as f:
+            f.write(compressed)
+        os.utime(variant, (stat_file.st_atime, stat_file.st_mtime))
+        saved += len(data) - len(compressed)
+    return saved
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Returns the set of the encodings accepted by the Accept-Encoding header
+    """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        encoding, _, params = item.partition(";")
+        encoding = encoding.strip().lower()
+        try:
+            quality = float(params.strip().partition("q=")[2] or 1)
+        except ValueError:
+            quality = 1
+        if encoding and quality > 0:
+            accepted.add(encoding)
+    return accepted
+
 
 def streamer(stream, chunk_size=DEFAULT_CHUNK_SIZE, bytes=None, callback=None):
     try:
@@ -48,6 +120,76 @@ def streamer(stream, chunk_size=DEFAULT_CHUNK_SIZE, bytes=None, callback=None):
             callback()
 
 
+# metadata of the static files, checked again on disk after stat_interval
+# seconds (0 checks the modification time at every request)
+static_cache = CodeCache(max_bytes=None, max_entries=10000)
+
+
+def static_metadata(static_file):
+    """
+    Returns the cached metadata of `static_file` as a dict with its size,
+    mtime, Last-Modified and Content-Type headers, and its precompressed
+    variants by encoding, as `(filename, size)`. Raises OSError if the file
+    cannot be served (IsADirectoryError for a folder).
+
+    The metadata is rebuilt when the file or one of its variants changes.
+
+    The variant chosen for each Accept-Encoding header is cached under
+    `"choices"`.
+    """
+    now = time.time()
+    item = static_cache.get(static_file)
+    if item and static_cache.fresh(item, now):
+        return static_cache.hit(item, now)
+    stat_file = os.stat(static_file)
+    if stat.S_ISDIR(stat_file.st_mode):
+        raise IsADirectoryError(errno.EISDIR, "is a directory", static_file)
+    modified = stat_file[stat.ST_MTIME]
+    # variants created or rewritten after the file are part of its version
+    version = [stat_file.st_mtime, stat_file.st_size]
+    variants = {}
+    for encoding, extension in PRECOMPRESSED.items():
+        try:
+            stat_variant = os.stat(static_file + extension)
+        except OSError:
+            continue
+        if stat_variant.st_mtime >= modified:
+            version += [encoding, stat_variant.st_mtime, stat_variant.st_size]
+            variants[encoding] = (static_file + extension, stat_variant.st_size)
+    version = tuple(version)
+    if item and item[0] == version:
+        return static_cache.hit(item, now)
+    metadata = dict(
+        size=stat_file.st_size,
+        mtime=modified,
+        last_modified=unlocalised_http_header_date(time.gmtime(modified)),
+        content_type=contenttype(static_file),
+        variants=variants,
+        choices={},
+    )
+    return static_cache.set(static_file, version, metadata, now)
+
+
+def negotiate(metadata, accept_encoding):
+    """
+    Returns the encoding of the smallest variant in `metadata` accepted by
+    the `accept_encoding` header (None for the file itself)
+    """
+    choices = metadata["choices"]
+    if accept_encoding in choices:
+        return choices[accept_encoding]
+    accepted = accepted_encodings(accept_encoding)
+    best, size = None, metadata["size"]
+    for encoding, variant in metadata["variants"].items():
+        if encoding in accepted and variant[1] < size:
+            best, size = encoding, variant[1]
+    if len(choices) > 100:
+        # a few distinct headers are expected, do not grow with odd ones
+        choices.clear()
+    choices[accept_encoding] = best
+    return best
+
+
 def stream_file_or_304_or_206(
     static_file,
     chunk_size=DEFAULT_CHUNK_SIZE,
@@ -60,25 +202,22 @@ def stream_file_or_304_or_206(
     # if error_message is None:
     #     error_message = rewrite.THREAD_LOCAL.routes.error_message % 'invalid request'
     try:
-        fp = open(static_file, "rb")
-    except IOError as e:
+        metadata = static_metadata(static_file)
+    except OSError as e:
         if e.errno == errno.EISDIR:
             raise HTTP(403, error_message, web2py_error="file is a directory")
         elif e.errno == errno.EACCES:
             raise HTTP(403, error_message, web2py_error="inaccessible file")
         else:
             raise HTTP(404, error_message, web2py_error="invalid file")
-    else:
-        fp.close()
-    stat_file = os.stat(static_file)
-    fsize = stat_file[stat.ST_SIZE]
-    modified = stat_file[stat.ST_MTIME]
-    mtime = unlocalised_http_header_date(time.gmtime(modified))
-    headers.setdefault("Content-Type", contenttype(static_file))
+    fsize = metadata["size"]
+    mtime = metadata["last_modified"]
+    headers.setdefault("Content-Type", metadata["content_type"])
     headers.setdefault("Last-Modified", mtime)
     headers.setdefault("Pragma", "cache")
     headers.setdefault("Cache-Control", "private")
 
+    part = None
     # if this is a normal response and not a respnse to an error page
     if status == 200:
         if request and request.env.http_if_modified_since == mtime:
@@ -101,28 +240,26 @@ def stream_file_or_304_or_206(
             if part[0] > part[1]:
                 headers["Content-Range"] = "bytes */%i" % fsize
                 raise HTTP(416, **headers)
-            bytes = part[1] - part[0] + 1
-            try:
-                stream = open(static_file, "rb")
-            except IOError as e:
-                if e.errno in (errno.EISDIR, errno.EACCES):
-                    raise HTTP(403)
-                else:
-                    raise HTTP(404)
-            stream.seek(part[0])
             headers["Content-Range"] = "bytes %i-%i/%i" % part
-            headers["Content-Length"] = "%i" % bytes
             status = 206
     # in all the other cases (not 304, not 206, but 200 or error page)
-    if status != 206:
+    stream = None
+    if status != 206 and metadata["variants"] and not "Content-Encoding" in headers:
+        headers["Vary"] = "Accept-Encoding"
         enc = request.env.http_accept_encoding
-        if enc and "gzip" in enc and not "Content-Encoding" in headers:
-            gzipped = static_file + ".gz"
-            if os.path.isfile(gzipped) and os.path.getmtime(gzipped) >= modified:
-                static_file = gzipped
-                fsize = os.path.getsize(gzipped)
-                headers["Content-Encoding"] = "gzip"
-                headers["Vary"] = "Accept-Encoding"
+        encoding = enc and negotiate(metadata, enc)
+        if encoding:
+            variant = metadata["variants"][encoding]
+            try:
+                stream = open(variant[0], "rb")
+            except IOError:
+                # deleted since it was found, serve the file itself
+                pass
+            else:
+                # the variant may have been rewritten within stat_interval
+                fsize = os.fstat(stream.fileno()).st_size
+                headers["Content-Encoding"] = encoding
+    if stream is None:
         try:
             stream = open(static_file, "rb")
         except IOError as e:
@@ -131,8 +268,12 @@ def stream_file_or_304_or_206(
                 raise HTTP(403)
             else:
                 raise HTTP(404)
-        headers["Content-Length"] = str(fsize)
+    if part:
+        bytes = part[1] - part[0] + 1
+        stream.seek(part[0])
+    else:
         bytes = None
+    headers["Content-Length"] = "%i" % (bytes or fsize)
     # only hand a bare file object to the wsgi file wrapper for full-content
     # responses (bytes is None). On a 206 the wrapper streams the seeked file to
     # EOF, ignoring the range length, so the body would exceed the advertised
@@ -1 +1 @@
-from yatl.template import parse_template, render
+from yatl.template import file_reader, parse_template, render
@@ -2,6 +2,7 @@ import os
 from .test_appadmin import *
 from .test_authapi import *
 from .test_cache import *
+from .test_cfs import *
 from .test_compileapp import *
 from .test_contenttype import *
 from .test_contribs import *
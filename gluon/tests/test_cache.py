@@ -4,12 +4,17 @@
 """
     Unit tests for gluon.cache
 """
+import datetime
 import os
+import threading
+import time
 import unittest
 
 from gluon import recfile
-from gluon.cache import Cache, CacheInRam, CacheOnDisk
+from gluon.cache import Cache, CacheInRam, CacheOnDisk, CacheOnSQLite, CacheTiered
 from gluon.dal import DAL, Field
+from gluon.globals import current
+from gluon.http import HTTP
 from gluon.storage import Storage
 
 oldcwd = None
@@ -114,8 +119,407 @@ class TestCache(unittest.TestCase):
 
             self.assertEqual(cache("a", lambda: 2, 0), 2)
 
+    def test_single_flight_CacheInRam(self):
+        cache = CacheInRam(Storage(application="single_flight"))
+        calls = []
+
+        def f():
+            calls.append(1)
+            time.sleep(0.1)
+            return len(calls)
+
+        threads = [
+            threading.Thread(target=lambda: results.append(cache("a", f, 100)))
+            for i in range(5)
+        ]
+        results = []
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1] * 5)
+        # a thread does not wait forever for a stuck one
+        event = threading.Event()
+        cache.flights[(cache.app, "b")] = event
+        cache.flight_timeout = 0.01
+        try:
+            self.assertEqual(cache("b", lambda: 2, 100), 2)
+        finally:
+            del cache.flight_timeout
+            del cache.flights[(cache.app, "b")]
+        self.assertEqual(len(calls), 1)
+        # a forced refresh is not shared
+        self.assertEqual(cache("a", f, 0), 2)
+
+    def test_bounded_CacheInRam(self):
+        cache = CacheInRam(Storage(application="bounded"))
+        cache.max_entries = 3
+        for key in "abc":
+            cache(key, lambda: key, 100)
+        # a becomes the most recently used
+        self.assertEqual(cache("a", lambda: "x", 100), "a")
+        cache("d", lambda: "d", 100)
+        self.assertEqual(list(cache.storage), ["c", "a", "d"])
+        self.assertEqual(cache.stats["bounded"]["evictions"], 1)
+        cache.max_entries = None
+        cache.max_bytes = 3000
+        cache("e", lambda: "x" * 2000, 100)
+        cache("f", lambda: "x" * 2000, 100)
+        self.assertEqual(list(cache.storage), ["f"])
+        self.assertLess(cache.stats["bounded"]["bytes"], 3000)
+        cache.clear()
+        self.assertEqual(cache.stats["bounded"]["bytes"], 0)
+
+    def test_reap_CacheInRam(self):
+        cache = CacheInRam(Storage(application="reap"))
+        # time_expire=0 forces a new value, later calls may still reuse it
+        cache("a", lambda: 1, 0)
+        self.assertEqual(CacheInRam.reap(time.time() + 50), 0)
+        self.assertEqual(cache("a", lambda: 2, 100), 1)
+        CacheInRam.max_age = 30
+        try:
+            cache("b", lambda: 2, 10)
+            cache.initialized = False
+            cache.initialize()
+            self.assertIsNotNone(CacheInRam.reaper)
+            self.assertEqual(CacheInRam.reaper_pid, os.getpid())
+            cache.storage["a"] = (time.time() - 60, 1)
+            self.assertEqual(CacheInRam.reap(), 1)
+            self.assertEqual(list(cache.storage), ["b"])
+            self.assertEqual(cache.stats["reap"]["expired"], 1)
+            CacheInRam.reap(time.time() + 50)
+            self.assertEqual(list(cache.storage), [])
+            self.assertEqual(cache.stats["reap"]["expired"], 2)
+            self.assertEqual(cache.stats["reap"]["bytes"], 0)
+        finally:
+            CacheInRam.max_age = None
+
+    def test_stale_CacheInRam(self):
+        cache = CacheInRam(Storage(application="stale"))
+        cache.stale_while_revalidate = 60
+        self.assertEqual(cache("a", lambda: 1, 100), 1)
+        cache.storage["a"] = (time.time() - 120, 1)
+        started, done = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            done.wait(5)
+            return 2
+
+        thread = threading.Thread(target=lambda: cache("a", slow, 100))
+        thread.start()
+        started.wait(5)
+        self.assertEqual(cache("a", lambda: 3, 100), 1)
+        done.set()
+        thread.join()
+        self.assertEqual(cache("a", lambda: 3, 100), 2)
+        # too old to be served while being refreshed
+        cache.stale_while_revalidate = 10
+        cache.storage["a"] = (time.time() - 120, 2)
+        self.assertEqual(cache("a", lambda: 3, 100), 3)
+
+    def test_stale_CacheOnDisk(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "admin", "folder": tmpdirname})
+            cache = CacheOnDisk(s)
+            cache.stale_while_revalidate = 60
+            self.assertEqual(cache("a", lambda: 1, 100), 1)
+            cache.storage["a"] = (time.time() - 120, 1)
+            # another process computing the value holds its lock
+            flight = cache.storage.acquire_flight("a")
+            self.assertEqual(cache("a", lambda: 2, 100), 1)
+            cache.storage.release_flight(flight)
+            self.assertEqual(cache("a", lambda: 2, 100), 2)
+            self.assertNotIn("locks", "".join(cache.storage))
+            # released lock files are deleted
+            for dirpath, dirnames, filenames in os.walk(
+                os.path.join(cache.storage.folder, "locks")
+            ):
+                self.assertEqual(filenames, [])
+            cache.clear()
+            self.assertEqual(cache("a", lambda: 3, 100), 3)
+
+    def test_stats_CacheOnDisk(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "admin", "folder": tmpdirname})
+            cache = CacheOnDisk(s)
+            self.assertEqual(cache("a", lambda: 1, 100), 1)
+            self.assertEqual(cache("a", lambda: 2, 100), 1)
+            stats_name = "web2py_cache_statistics"
+            self.assertNotIn(stats_name, list(cache.storage))
+            cache.flush_stats()
+            self.assertEqual(
+                cache.storage[stats_name][1], {"hit_total": 2, "misses": 1}
+            )
+            cache.stats_interval = 0
+            self.assertEqual(cache("b", lambda: 2, 100), 2)
+            self.assertEqual(
+                cache.storage[stats_name][1], {"hit_total": 3, "misses": 2}
+            )
+
+    def test_CacheOnSQLite(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "admin", "folder": tmpdirname})
+            cache = CacheOnSQLite(s)
+            self.assertEqual(cache("a", lambda: 1, 0), 1)
+            self.assertEqual(cache("a", lambda: 2, 100), 1)
+            cache.clear("b")
+            self.assertEqual(cache("a", lambda: 2, 100), 1)
+            cache.clear("a")
+            self.assertEqual(cache("a", lambda: 2, 100), 2)
+            cache.clear()
+            self.assertEqual(cache("a", lambda: 3, 100), 3)
+            cache("a", None)
+            self.assertEqual(cache("a", lambda: 5, 100), 5)
+            self.assertEqual(cache.increment("a"), 6)
+            self.assertEqual(cache("a", lambda: 1, 100), 6)
+            self.assertEqual(cache.increment("b"), 1)
+            # one file, shared by the instances
+            cache = CacheOnSQLite(s)
+            cache.initialize()
+            self.assertEqual(sorted(cache.storage), ["a", "b"])
+            self.assertEqual(
+                os.listdir(os.path.join(tmpdirname, "cache", "sqlite"))[:1],
+                ["cache.db"],
+            )
+            # the default cache.disk ignores it
+            disk = CacheOnDisk(s)
+            disk.initialize()
+            self.assertEqual(list(disk.storage), [])
+
+    def test_CacheOnSQLite_eviction(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "admin", "folder": tmpdirname})
+            cache = CacheOnSQLite(s, max_bytes=5000)
+            cache.initialize()
+            cache.storage.touch_interval = 0
+            for key in "abcd":
+                cache(key, lambda: "x" * 1000, 100)
+                time.sleep(0.01)
+            # a becomes the most recently used
+            self.assertEqual(cache("a", lambda: "y", 100), "x" * 1000)
+            cache("e", lambda: "x" * 1500, 100)
+            self.assertEqual(sorted(cache.storage), ["a", "c", "d", "e"])
+            # expired entries go first
+            cache("f", lambda: "x" * 10, -1)
+            cache("g", lambda: "x" * 1000, 100)
+            self.assertEqual(sorted(cache.storage), ["a", "d", "e", "g"])
+
+    def test_CacheOnSQLite_flight(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "admin", "folder": tmpdirname})
+            cache = CacheOnSQLite(s)
+            cache.stale_while_revalidate = 60
+            self.assertEqual(cache("a", lambda: 1, 100), 1)
+            cache.storage["a"] = (time.time() - 120, 1)
+            lease = cache.storage.acquire_flight("a")
+            self.assertIsNone(cache.storage.acquire_flight("a", blocking=False))
+            self.assertEqual(cache("a", lambda: 2, 100), 1)
+            cache.storage.release_flight(lease)
+            self.assertEqual(cache("a", lambda: 2, 100), 2)
+
+    def test_CacheTiered(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "admin", "folder": tmpdirname})
+            l2 = CacheOnDisk(s)
+            # two processes, each with its own ram
+            p1 = CacheTiered(Storage(application="p1"), l2)
+            p2 = CacheTiered(Storage(application="p2"), l2)
+            p1.sync_interval = p2.sync_interval = 0
+            self.assertEqual(p1("a", lambda: 1, 100), 1)
+            self.assertEqual(p2("a", lambda: 2, 100), 1)
+            # served by the ram while the shared value changes
+            l2("a", lambda: 3, 0)
+            self.assertEqual(p1("a", lambda: 4, 100), 1)
+            self.assertEqual(p2("a", lambda: 4, 100), 1)
+            # until it expires from the ram
+            self.assertEqual(p1("a", lambda: 4, 0), 4)
+            self.assertEqual(l2("a", lambda: 5, 100), 4)
+            # clearing in a process clears the ram of the others
+            p1.clear("a")
+            self.assertEqual(p2("a", lambda: 6, 100), 6)
+            p2("a", None)
+            self.assertEqual(p1("a", lambda: 7, 100), 7)
+            self.assertEqual(p2.increment("b"), 1)
+            self.assertEqual(p1("b", lambda: 0, 100), 1)
+
+    def test_sync_CacheTiered(self):
+        l2 = CacheInRam(Storage(application="sync_l2"))
+        p1 = CacheTiered(Storage(application="sync_p1"), l2)
+        p2 = CacheTiered(Storage(application="sync_p2"), l2)
+        p1.sync_interval = p2.sync_interval = 0
+        p1.sync()
+        self.assertEqual(p1("a", lambda: 1, 100), 1)
+        self.assertEqual(p1("b", lambda: 1, 100), 1)
+        p2.clear("^a$")
+        self.assertEqual(p1("a", lambda: 2, 100), 2)
+        self.assertEqual(p1("b", lambda: 2, 100), 1)
+        # a missing regex clears everything, without being stored
+        l2("b", lambda: 3, 0)
+        generation = l2.increment(p2.generation_key)
+        key = "%s:%s" % (p2.generation_key, generation)
+        self.assertEqual(p1("b", lambda: 4, 100), 3)
+        self.assertNotIn(key, l2.storage)
+
+    def test_negative_CacheTiered(self):
+        l2 = CacheInRam(Storage(application="negative_l2"))
+        cache = CacheTiered(Storage(application="negative"), l2)
+        cache.negative_expire = 0
+        self.assertIsNone(cache("a", lambda: None, 100))
+        self.assertEqual(cache("b", lambda: 1, 100), 1)
+        l2("a", lambda: 2, 0)
+        l2("b", lambda: 2, 0)
+        self.assertEqual(cache("a", lambda: 3, 100), 2)
+        self.assertEqual(cache("b", lambda: 3, 100), 1)
+
+    def test_tags(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "tags", "folder": tmpdirname})
+            for cache in (CacheInRam(s), CacheOnDisk(s), CacheOnSQLite(s)):
+                cache("a", lambda: 1, 100)
+                cache("b", lambda: 2, 100)
+                cache("c", lambda: 3, 100)
+                cache.tag("a", "t1")
+                cache.tag("b", "t1", "t2")
+                self.assertEqual(sorted(cache.invalidate("t1")), ["a", "b"])
+                self.assertEqual(cache("a", lambda: 4, 100), 4)
+                self.assertEqual(cache("b", lambda: 5, 100), 5)
+                self.assertEqual(cache("c", lambda: 6, 100), 3)
+                cache.tag("b", "t2")
+                # the tags were emptied
+                self.assertEqual(cache.invalidate("t1"), [])
+                self.assertEqual(cache("a", lambda: 7, 100), 4)
+                self.assertEqual(cache.invalidate("t2"), ["b"])
+                self.assertEqual(cache("b", lambda: 8, 100), 8)
+
+    def test_tags_pruned(self):
+        cache = CacheInRam(Storage(application="tags_pruned"))
+        for key in ("a", "b", "c", "d"):
+            cache(key, lambda: 1, 100)
+            cache.tag(key, "t1", "t2")
+        cache("a", None)
+        cache.clear("b")
+        cache.storage["c"] = (time.time() - 60, 1)
+        CacheInRam.max_age = 30
+        try:
+            CacheInRam.reap()
+        finally:
+            CacheInRam.max_age = None
+        self.assertEqual(cache.tags, {"t1": {"d"}, "t2": {"d"}})
+        cache("d", lambda: 2, 0)
+        self.assertEqual(cache.tags, {"t1": {"d"}, "t2": {"d"}})
+        cache("d", None)
+        self.assertEqual(cache.tags, {})
+        self.assertEqual(cache.key_tags, {})
+        # keys deleted before being tagged are not tagged
+        cache.tag("e", "t1")
+        self.assertEqual(cache.tags, {})
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "tags_pruned", "folder": tmpdirname})
+            cache = CacheOnDisk(s)
+            cache("a", lambda: 1, 100)
+            cache.tag("a", "t1")
+            cache("a", None)
+            cache("b", lambda: 1, 100)
+            cache.tag("b", "t1")
+            self.assertEqual(cache.storage[cache.tag_prefix + "t1"][1], {"b"})
+            cache = CacheOnSQLite(s)
+            cache("a", lambda: 1, 100)
+            cache.tag("a", "t1")
+            cache("a", None)
+            db = cache.storage.db
+            self.assertEqual(db.execute("SELECT * FROM cache_tags").fetchall(), [])
+
+    def test_with_tags(self):
+        with TemporaryDirectory() as tmpdirname:
+            s = Storage({"application": "with_tags", "folder": tmpdirname})
+            cache = Cache(s)
+            cache.tiered = CacheTiered(s, cache.disk)
+            for cache_model in (cache.ram, cache.disk, cache.tiered):
+                tagged = cache.with_tags(cache_model, "person")
+                self.assertEqual(tagged("a", lambda: 1, 100), 1)
+                self.assertEqual(tagged("a", lambda: 2, 100), 1)
+                self.assertEqual(cache_model("b", lambda: 3, 100), 3)
+            cache.invalidate("person")
+            for cache_model in (cache.ram, cache.disk, cache.tiered):
+                self.assertEqual(cache_model("a", lambda: 4, 100), 4)
+                self.assertEqual(cache_model("b", lambda: 5, 100), 3)
+
+    def test_invalidate_on_write(self):
+        s = Storage({"application": "admin", "folder": "applications/admin"})
+        cache = Cache(s)
+        db = DAL("sqlite:memory", check_reserved=["all"])
+        db.define_table("t_b", Field("f_b"))
+        cache.invalidate_on_write(db.t_b)
+        model = cache.with_tags(cache.ram, "t_b")
+        db.t_b.insert(f_b="a")
+        a = db(db.t_b).select(cache=(model, 60), cacheable=True)
+        self.assertEqual(len(a), 1)
+        db.t_b.insert(f_b="b")
+        b = db(db.t_b).select(cache=(model, 60), cacheable=True)
+        self.assertEqual(len(b), 2)
+        db(db.t_b.f_b == "a").delete()
+        c = db(db.t_b).select(cache=(model, 60), cacheable=True)
+        self.assertEqual(len(c), 1)
+        db.t_b.drop()
+        db.close()
+
     # TODO: def test_CacheAction(self):
 
+    def test_CacheAction_etag(self):
+        calls = []
+
+        def index():
+            calls.append(1)
+            return "hello"
+
+        current.request = Storage(
+            application="etag",
+            folder="applications/admin",
+            env=Storage(
+                request_method="GET", path_info="/etag/default/index", query_string=""
+            ),
+            utcnow=datetime.datetime.utcnow(),
+        )
+        current.response = Storage(view="default/index.html", headers={}, status=200)
+        current.T = Storage(accepted_language="en")
+        try:
+            cache = Cache(current.request)
+            action = cache.action(100, cache.ram)(index)
+            self.assertEqual(action(), "hello")
+            etag = current.response.headers["ETag"]
+            current.request.env.http_if_none_match = 'W/"other", %s' % etag
+            with self.assertRaises(HTTP) as e:
+                action()
+            self.assertEqual(e.exception.status, 304)
+            self.assertEqual(e.exception.body, "")
+            self.assertEqual(e.exception.headers["ETag"], etag)
+            # revalidated from the cache without calling the action
+            self.assertEqual(len(calls), 1)
+            # dicts rendered by the view only get an ETag if asked to
+            current.request.env.http_if_none_match = None
+            current.response.headers = {}
+            action = cache.action(100)(lambda: dict(a=1))
+            action()
+            self.assertNotIn("ETag", current.response.headers)
+            action = cache.action(100, etag=True)(lambda: dict(a=1))
+            action()
+            self.assertIn("ETag", current.response.headers)
+            # the flash and, with session=True, the session are in the tag
+            etag = current.response.headers["ETag"]
+            current.response.flash = "saved"
+            action()
+            self.assertNotEqual(current.response.headers["ETag"], etag)
+            action = cache.action(100, session=True, etag=True)(lambda: dict(a=1))
+            etags = set()
+            for session_id in ("1", "2"):
+                current.response.session_id = session_id
+                action()
+                etags.add(current.response.headers["ETag"])
+            self.assertEqual(len(etags), 2)
+        finally:
+            current.request = current.response = current.T = None
+
     # TODO: def test_Cache(self):
 
     # TODO: def test_lazy_cache(self):
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Unit tests for cfs.py """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gluon import cfs
+from gluon.cfs import CodeCache, getcfs, getcfs_files
+
+
+class TestCodeCache(unittest.TestCase):
+    def setUp(self):
+        self.original = cfs.cfs
+        cfs.cfs = CodeCache()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        cfs.cfs = self.original
+        shutil.rmtree(self.folder)
+
+    def write(self, name, text, mtime):
+        filename = os.path.join(self.folder, name)
+        with open(filename, "w") as f:
+            f.write(text)
+        os.utime(filename, (mtime, mtime))
+        return filename
+
+    def test_getcfs(self):
+        filename = self.write("a.py", "a", 1000)
+        self.assertEqual(getcfs("a", filename, lambda: "A"), "A")
+        self.assertEqual(getcfs("a", filename, lambda: "B"), "A")
+        self.write("a.py", "b", 2000)
+        self.assertEqual(getcfs("a", filename, lambda: "B"), "B")
+        self.assertEqual(getcfs("a", filename), "B")
+        stats = cfs.cfs.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual(getcfs("missing", filename + "x", lambda: "C"), "C")
+        self.assertNotIn("missing", cfs.cfs)
+
+    def test_getcfs_files(self):
+        filename = self.write("a.html", "a", 1000)
+
+        def parse(text):
+            mtimes = [(filename, os.stat(filename).st_mtime)]
+            # the file is modified while it is being parsed
+            self.write("a.html", "b", 2000)
+            return text, mtimes
+
+        self.assertEqual(getcfs_files("a", lambda: parse("A")), "A")
+        self.assertEqual(getcfs_files("a", lambda: ("B", [])), "B")
+        self.assertEqual(getcfs_files("a", lambda: ("C", None)), "B")
+        self.assertEqual(getcfs_files("b", lambda: ("C", None)), "C")
+        self.assertNotIn("b", cfs.cfs)
+
+    def test_lru_eviction(self):
+        cfs.cfs.max_bytes = 10
+        files = [self.write("%s.py" % n, n, 1000) for n in "abc"]
+        getcfs("a", files[0], lambda: "a" * 4)
+        getcfs("b", files[1], lambda: "b" * 4)
+        getcfs("a", files[0], lambda: "a" * 4)
+        getcfs("c", files[2], lambda: "c" * 4)
+        self.assertIn("a", cfs.cfs)
+        self.assertNotIn("b", cfs.cfs)
+        self.assertEqual(cfs.cfs.stats()["evictions"], 1)
+        self.assertEqual(cfs.cfs.stats()["bytes"], 8)
+        cfs.cfs.max_entries = 1
+        getcfs("b", files[1], lambda: "b")
+        self.assertEqual(len(cfs.cfs), 1)
+
+    def test_stat_interval(self):
+        cfs.cfs.stat_interval = 3600
+        filename = self.write("a.py", "a", 1000)
+        self.assertEqual(getcfs("a", filename, lambda: "A"), "A")
+        self.write("a.py", "b", 2000)
+        self.assertEqual(getcfs("a", filename, lambda: "B"), "A")
+        cfs.cfs.stat_interval = 0
+        self.assertEqual(getcfs("a", filename, lambda: "B"), "B")
@@ -6,10 +6,13 @@ import os
 import shutil
 from io import BytesIO
 import tempfile
+import threading
 import unittest
 import zipfile
 from unittest.mock import patch
 
+from pydal.base import BaseAdapter
+
 from gluon.admin import (
     app_cleanup,
     app_compile,
@@ -19,10 +22,18 @@ from gluon.admin import (
     plugin_install,
     safe_deposit_path,
 )
-from gluon.compileapp import TEST_CODE, compile_application, remove_compiled_application
+from gluon.compileapp import (
+    TEST_CODE,
+    compile_application,
+    remove_compiled_application,
+    run_models_in,
+    run_view_in,
+)
+from gluon.dal import DAL, Field
 from gluon.fileutils import create_app, w2p_pack, w2p_unpack
-from gluon.globals import Request
+from gluon.globals import Request, Response, current
 from gluon.main import global_settings
+from gluon.template import parse_template
 
 test_app_name = "_test_compileapp"
 test_app2_name = "_test_compileapp_admin"
@@ -100,6 +111,157 @@ class TestAdminPaths(unittest.TestCase):
         self.assertFalse(os.path.exists(deposit_path))
 
 
+class TestViewCache(unittest.TestCase):
+    """Tests the caching of non compiled views"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.folder, "views", "default"))
+        self.write("layout.html", "<b>{{include}}</b>")
+        self.write("default/index.html", "{{extend 'layout.html'}}{{=x}}")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, view, text, mtime=None):
+        filename = os.path.join(self.folder, "views", view)
+        with open(filename, "w") as f:
+            f.write(text)
+        if mtime:
+            os.utime(filename, (mtime, mtime))
+
+    def render(self, view="default/index.html", **vars):
+        request = Request(env={})
+        request.folder = self.folder
+        request.controller, request.function, request.extension = (
+            "default",
+            "index",
+            "html",
+        )
+        response = Response()
+        response.view = view
+        current.request, current.response = request, response
+        environment = dict(request=request, response=response, **vars)
+        return run_view_in(environment)
+
+    def test_cached_until_chain_changes(self):
+        with patch("gluon.compileapp.parse_template", wraps=parse_template) as p:
+            self.assertEqual(self.render(x=1), "<b>1</b>")
+            self.assertEqual(self.render(x=2), "<b>2</b>")
+            self.assertEqual(p.call_count, 1)
+            # touching a file in the extend chain invalidates the entry
+            self.write("layout.html", "<i>{{include}}</i>", mtime=1)
+            self.assertEqual(self.render(x=3), "<i>3</i>")
+            self.assertEqual(p.call_count, 2)
+
+    def test_dynamic_include_not_cached(self):
+        self.write("other.html", "{{include layout_name}}")
+        with patch("gluon.compileapp.parse_template", wraps=parse_template) as p:
+            self.render("other.html", layout_name="default/index.html", x=1)
+            self.render("other.html", layout_name="default/index.html", x=1)
+            self.assertEqual(p.call_count, 2)
+
+
+class TestModelManifest(unittest.TestCase):
+    """Tests the selection of the models to run"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for model in ("db.py", "menu.py", "default/a.py", "default/index/b.py"):
+            self.write(model)
+        self.write("other/c.py")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, model, code=None):
+        filename = os.path.join(self.folder, "models", model)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, "w") as f:
+            f.write(code or "ran.append(%r)\n" % model)
+
+    def run_models(self, controller="default", function="index"):
+        request = Request(env={})
+        request.folder = self.folder
+        request.controller, request.function = controller, function
+        response = Response()
+        response.models_to_run = [
+            r"^\w+\.py$",
+            r"^%s/\w+\.py$" % controller,
+            r"^%s/%s/\w+\.py$" % (controller, function),
+        ]
+        current.request, current.response = request, response
+        environment = dict(
+            request=request, response=response, DAL=DAL, Field=Field, ran=[]
+        )
+        environment["current"] = current
+        run_models_in(environment)
+        self.environment = environment
+        return environment["ran"]
+
+    def test_conditional_models(self):
+        models = ["db.py", "menu.py", "default/a.py", "default/index/b.py"]
+        self.assertEqual(self.run_models(), models)
+        self.assertEqual(self.run_models(), models)
+        self.assertEqual(self.run_models("other"), ["db.py", "menu.py", "other/c.py"])
+        self.assertEqual(len(self.run_models("appadmin")), 5)
+
+    def test_new_model_invalidates_manifest(self):
+        self.assertEqual(
+            self.run_models("default", "other"), ["db.py", "menu.py", "default/a.py"]
+        )
+        self.write("default/z.py")
+        self.assertEqual(
+            self.run_models("default", "other"),
+            ["db.py", "menu.py", "default/a.py", "default/z.py"],
+        )
+
+    def test_warm_models(self):
+        self.write("db.py", "ran.append('db.py')\nsettings = dict(n=len(ran))")
+        self.write("0.py", "response.warm_models = [r'^db\\.py$']")
+        models = ["db.py", "menu.py", "default/a.py", "default/index/b.py"]
+        self.assertEqual(self.run_models(), models)
+        self.assertEqual(self.run_models(), models[1:])
+        self.assertEqual(self.environment["settings"], dict(n=1))
+        # snapshots are refreshed when the model changes
+        self.write("db.py", "ran.append('db.py')\nsettings = dict(n=2)")
+        os.utime(os.path.join(self.folder, "models", "db.py"), (1, 1))
+        self.assertEqual(self.run_models(), models)
+        self.assertEqual(self.environment["settings"], dict(n=2))
+
+    def test_warm_models_database(self):
+        code = (
+            "db = DAL('sqlite://storage.sqlite', folder=%r)\n"
+            "db.define_table('thing', Field('name'))\n"
+            "current.db = db\n" % self.folder
+        )
+        self.write("db.py", code)
+        self.write("0.py", "response.warm_models = [r'^db\\.py$']")
+        self.run_models()
+        db = self.environment["db"]
+        db.thing.insert(name="a")
+        BaseAdapter.close_all_instances("commit")
+        results = []
+
+        def run():
+            self.run_models()
+            results.append(self.environment["db"] is db and current.db is db)
+            db.thing.insert(name="b")
+            BaseAdapter.close_all_instances("commit")
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [True])
+        self.assertEqual(db(db.thing).count(), 2)
+        BaseAdapter.close_all_instances("commit")
+
+    def test_models_to_run_changed_by_model(self):
+        self.write("db.py", "ran.append('db.py')\nresponse.models_to_run = ['^other/']")
+        self.assertEqual(self.run_models(), ["db.py", "other/c.py"])
+
+
 class TestPack(unittest.TestCase):
     """Tests the compileapp.py module"""
 
@@ -8,7 +8,14 @@ import tarfile
 import tempfile
 import unittest
 
-from gluon.fileutils import fix_newlines, get_session, parse_version, set_session, untar
+from gluon.fileutils import (
+    ApplicationRegistry,
+    fix_newlines,
+    get_session,
+    parse_version,
+    set_session,
+    untar,
+)
 from gluon.storage import Storage, load_storage, save_storage
 
 
@@ -227,3 +234,23 @@ class TestFileUtils(unittest.TestCase):
             loaded = load_storage(session_file)
             self.assertTrue(loaded.authorized)
             self.assertEqual(loaded.last_time, 99999.0)
+
+    def test_application_registry(self):
+        registry = ApplicationRegistry(ttl=3600)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            folder = os.path.join(tmpdir, "app")
+            self.assertFalse(registry.get(folder).exists)
+            # missing applications are not cached
+            self.assertEqual(registry.apps, {})
+            os.mkdir(folder)
+            self.assertTrue(registry.get(folder).exists)
+            os.rmdir(folder)
+            # the state is trusted until the ttl expires or it is invalidated
+            self.assertTrue(registry.get(folder).exists)
+            os.mkdir(folder)
+            registry.invalidate(folder)
+            self.assertTrue(registry.get(folder).exists)
+            self.assertFalse(registry.get(folder).disabled)
+            open(os.path.join(folder, "DISABLED"), "w").close()
+            registry.ttl = 0
+            self.assertTrue(registry.get(folder).disabled)
@@ -6,22 +6,34 @@
 """
 
 
+import datetime
 import re
 import os
+import pickle
 import shutil
 import tempfile
 import unittest
+import zlib
 from http.cookies import SimpleCookie
 from io import BytesIO
+from unittest import mock
 
 from pydal import DAL
+from pydal.objects import Row
 
+from gluon.cache import CacheInRam
 from gluon.html import XML, URL
 from gluon.globals import Request, Response, Session
 from gluon.settings import global_settings
+from gluon.storage import Storage
 from gluon.http import HTTP
 from gluon.rewrite import regex_url_in
-from gluon.streamer import stream_file_or_304_or_206
+from gluon.streamer import (
+    precompress,
+    static_cache,
+    static_metadata,
+    stream_file_or_304_or_206,
+)
 
 
 def setup_clean_session():
@@ -694,6 +706,125 @@ class testResponse(unittest.TestCase):
             if os.path.exists(path):
                 os.remove(path)
 
+    def test_stream_file_metadata(self):
+        class FileWrapper(object):
+            def __init__(self, filelike, blksize=8192):
+                self.iterator = iter(lambda: filelike.read(blksize), b"")
+                self.filelike = filelike
+
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                try:
+                    return next(self.iterator)
+                except StopIteration:
+                    self.filelike.close()
+                    raise
+
+            def close(self):
+                self.filelike.close()
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "a.js")
+        with open(path, "wb") as f:
+            f.write(b"0123456789")
+        request = Request(env={})
+        request.env.http_accept_encoding = "gzip"
+        request.env.web2py_use_wsgi_file_wrapper = True
+        request.env.wsgi_file_wrapper = FileWrapper
+
+        def serve():
+            with self.assertRaises(HTTP) as ctx:
+                stream_file_or_304_or_206(path, request=request, headers={})
+            # like a WSGI server, close the body even if it is not exhausted
+            self.addCleanup(ctx.exception.body.close)
+            return ctx.exception
+
+        hits = static_cache.hits
+        e = serve()
+        self.assertIsInstance(e.body, FileWrapper)
+        self.assertEqual(b"".join(e.body), b"0123456789")
+        self.assertEqual(e.headers["Content-Type"], "application/javascript")
+        self.assertNotIn("Content-Encoding", e.headers)
+        b"".join(serve().body)
+        self.assertEqual(static_cache.hits, hits + 1)
+
+        # a new precompressed variant is found while the file is unchanged
+        with open(path + ".gz", "wb") as f:
+            f.write(b"gz")
+        e = serve()
+        self.assertEqual(e.headers["Content-Encoding"], "gzip")
+        self.assertEqual(e.headers["Content-Length"], "2")
+        self.assertEqual(b"".join(e.body), b"gz")
+
+        # and so is a rewritten one, even when its metadata is trusted
+        with open(path + ".gz", "wb") as f:
+            f.write(b"gzip!")
+        e = serve()
+        self.assertEqual(e.headers["Content-Length"], "5")
+        self.assertEqual(b"".join(e.body), b"gzip!")
+        with open(path + ".gz", "wb") as f:
+            f.write(b"gzip")
+        stat_interval = static_cache.stat_interval
+        static_cache.stat_interval = 3600
+        self.addCleanup(setattr, static_cache, "stat_interval", stat_interval)
+        e = serve()
+        self.assertEqual(e.headers["Content-Length"], "4")
+        self.assertEqual(b"".join(e.body), b"gzip")
+
+        # ranges are bounded by the streamer, not sent by the file wrapper
+        request.env.http_range = "bytes=2-4"
+        e = serve()
+        self.assertEqual(e.status, 206)
+        self.assertNotIsInstance(e.body, FileWrapper)
+        self.assertEqual(e.headers["Content-Length"], "3")
+        self.assertEqual(b"".join(e.body), b"234")
+
+        # the file wrapper is opt-in
+        request.env.http_range = None
+        request.env.web2py_use_wsgi_file_wrapper = None
+        e = serve()
+        self.assertNotIsInstance(e.body, FileWrapper)
+        b"".join(e.body)
+
+        with self.assertRaises(HTTP) as ctx:
+            stream_file_or_304_or_206(tmpdir, request=request, headers={})
+        self.assertEqual(ctx.exception.status, 403)
+
+    def test_stream_file_negotiation(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "a.css")
+        with open(path, "wb") as f:
+            f.write(b"body { color: red; }" * 100)
+        self.assertGreater(precompress(path), 0)
+        self.assertTrue(os.path.exists(path + ".gz"))
+        # as if written by brotli and zstandard
+        for extension, data in ((".br", b"br"), (".zst", b"zstd!")):
+            with open(path + extension, "wb") as f:
+                f.write(data)
+        request = Request(env={})
+        request.env.web2py_use_wsgi_file_wrapper = False
+
+        def serve(accept_encoding):
+            request.env.http_accept_encoding = accept_encoding
+            with self.assertRaises(HTTP) as ctx:
+                stream_file_or_304_or_206(path, request=request, headers={})
+            e = ctx.exception
+            self.assertEqual(e.headers["Vary"], "Accept-Encoding")
+            b"".join(e.body)
+            return e.headers.get("Content-Encoding")
+
+        self.assertEqual(serve("gzip, deflate, br, zstd"), "br")
+        self.assertEqual(serve("gzip, zstd"), "zstd")
+        self.assertEqual(serve("gzip, br;q=0"), "gzip")
+        self.assertIsNone(serve("deflate"))
+        self.assertIsNone(serve(""))
+        choices = static_metadata(path)["choices"]
+        self.assertEqual(choices["gzip, zstd"], "zstd")
+
     def test_include_meta(self):
         response = Response()
         response.meta["web2py"] = "web2py"
@@ -722,10 +853,31 @@ class testResponse(unittest.TestCase):
         )
 
 
-class testSessionCheckClient(unittest.TestCase):
-    """check_client=True must reject a session replayed from another client."""
+class SessionTestCase(unittest.TestCase):
+    """
+    Connects sessions of the application "a" in a temporary folder, and
+    closes the session files they leave open
+    """
+
+    lazy = False
 
-    def _request(self, client):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmpdir, "applications", "a")
+        os.makedirs(os.path.join(self.folder, "sessions"))
+        # connect() registers db-backed apps here; a leftover entry would make
+        # the file-based tests take the db branch
+        global_settings.db_sessions.discard("a")
+        self.connected = []
+
+    def tearDown(self):
+        for session, response in self.connected:
+            session._close(response)
+        # Windows can't unlink an open/locked session file; ignore cleanup errors.
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        global_settings.db_sessions.discard("a")
+
+    def _request(self, client="127.0.0.1", session_id=None):
         request = Request(env={})
         request.application = "a"
         request.controller = "c"
@@ -733,36 +885,38 @@ class testSessionCheckClient(unittest.TestCase):
         request.folder = self.folder
         request.client = client
         request.is_local = False
+        if session_id:
+            request.cookies = SimpleCookie()
+            request.cookies["session_id_a"] = session_id
         return request
 
-    def _connect(self, client, session_id=None, db=None):
+    def _connect(self, session_id=None, client="127.0.0.1", **kwargs):
         from gluon.globals import current
 
-        request = self._request(client)
-        if session_id:
-            cookie = SimpleCookie()
-            cookie["session_id_a"] = session_id
-            request.cookies = cookie
+        request = self._request(client, session_id)
         response = Response()
         session = Session()
-        current.request = request
-        current.response = response
+        current.request, current.response = request, response
         current.session = session
-        session.connect(request, response, db=db, check_client=True)
+        kwargs.setdefault("lazy", self.lazy)
+        session.connect(request, response, **kwargs)
+        self.connected.append((session, response))
         return request, response, session
 
-    def setUp(self):
-        self.tmpdir = tempfile.mkdtemp()
-        self.folder = os.path.join(self.tmpdir, "applications", "a")
-        os.makedirs(os.path.join(self.folder, "sessions"))
-        # connect() registers db-backed apps here; a leftover entry would make
-        # the file-based tests take the db branch
-        global_settings.db_sessions.discard("a")
+    def _store(self, **kwargs):
+        request, response, session = self._connect()
+        session.update(kwargs)
+        session._try_store_in_cookie_or_file(request, response)
+        return response.session_id
 
-    def tearDown(self):
-        # Windows can't unlink an open/locked session file; ignore cleanup errors.
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
-        global_settings.db_sessions.discard("a")
+
+class testSessionCheckClient(SessionTestCase):
+    """check_client=True must reject a session replayed from another client."""
+
+    def _connect(self, client, session_id=None, db=None):
+        return SessionTestCase._connect(
+            self, session_id, client, db=db, check_client=True
+        )
 
     def test_file_session_from_other_client_is_not_loaded(self):
         request, response, session = self._connect("1.1.1.1")
@@ -807,6 +961,424 @@ class testSessionCheckClient(unittest.TestCase):
         self.assertEqual(session2.get("auth"), "victim")
 
 
+class testLazySession(SessionTestCase):
+    """file and db sessions are loaded only when accessed"""
+
+    lazy = True
+
+    def test_untouched_session_is_not_loaded(self):
+        session_id = self._store(user="x")
+        request, response, session = self._connect(session_id)
+        self.assertFalse(response.session_file)
+        session.forget()
+        self.assertFalse(response.session_file)
+        self.assertFalse(session._try_store_in_cookie_or_file(request, response))
+        session._fixup_before_save()
+        self.assertNotIn("session_id_a", response.cookies)
+
+    def test_session_loaded_on_access(self):
+        session_id = self._store(user="x")
+        request, response, session = self._connect(session_id)
+        self.assertEqual(session.user, "x")
+        self.assertTrue(response.session_locked)
+        self.assertFalse(response.session_new)
+        session.user = "y"
+        self.assertTrue(session._try_store_in_cookie_or_file(request, response))
+        _, _, session = self._connect(session_id)
+        self.assertEqual(dict(session), {"user": "y"})
+
+    def test_flash_moved_to_response(self):
+        session_id = self._store(flash="hello")
+        _, response, session = self._connect(session_id)
+        self.assertEqual(response.flash, "hello")
+        self.assertIsNone(session.flash)
+
+    def test_missing_session_file(self):
+        request, response, session = self._connect("127.0.0.1-missing")
+        self.assertEqual(response.session_id, "127.0.0.1-missing")
+        self.assertIsNone(session.user)
+        self.assertTrue(response.session_new)
+        self.assertNotEqual(response.session_id, "127.0.0.1-missing")
+
+    def test_not_lazy(self):
+        session_id = self._store(user="x")
+        _, response, session = self._connect(session_id, lazy=False)
+        self.assertTrue(response.session_locked)
+        session._unlock(response)
+        # lazy loading is opt-in
+        request = self._request(session_id=session_id)
+        response, session = Response(), Session()
+        session.connect(request, response)
+        self.connected.append((session, response))
+        self.assertTrue(response.session_locked)
+        self.assertEqual(dict.get(session, "user"), "x")
+        session._unlock(response)
+
+    def test_lazy_bookkeeping_is_not_in_response(self):
+        session_id = self._store(flash="hello")
+        _, response, session = self._connect(session_id)
+        self.assertNotIn("_lazy_session", response)
+        self.assertEqual(response.flash, "hello")
+        self.assertNotIn("_lazy_session", response.__dict__)
+        session._unlock(response)
+
+    def test_lazy_db_session(self):
+        db = DAL("sqlite:memory")
+        request, response, session = self._connect(db=db)
+        session.user = "x"
+        session._try_store_in_db(request, response)
+        session_id = response.session_id
+        _, response, session = self._connect(session_id, db=db)
+        self.assertIsNone(response.session_db_record_id)
+        self.assertEqual(session.user, "x")
+        self.assertTrue(response.session_db_record_id)
+
+
+class testSessionChanges(SessionTestCase):
+    """sessions are pickled only if they may have changed"""
+
+    def _unchanged(self, session_id, action):
+        request, response, session = self._connect(session_id)
+        action(session)
+        unchanged = session._unchanged(response)
+        session._unlock(response)
+        return unchanged, response
+
+    def test_scalar_reads_are_not_pickled(self):
+        session_id = self._store(user="x", counter=1)
+        unchanged, response = self._unchanged(session_id, lambda s: s.user)
+        self.assertTrue(unchanged)
+        self.assertIsNone(response.session_pickled)
+
+    def test_assignment_is_a_change(self):
+        session_id = self._store(user="x")
+        unchanged, response = self._unchanged(session_id, lambda s: s.update(user="x"))
+        self.assertFalse(unchanged)
+
+    def test_in_place_change(self):
+        session_id = self._store(auth=Storage(user=Storage(id=1)))
+        unchanged, response = self._unchanged(
+            session_id, lambda s: s.auth.user.update(id=2)
+        )
+        self.assertFalse(unchanged)
+        # detected by the snapshot of session.auth, without pickling
+        self.assertIsNone(response.session_pickled)
+
+    def test_mutable_read_without_change(self):
+        session_id = self._store(auth=Storage(user=Storage(id=1)))
+        unchanged, response = self._unchanged(session_id, lambda s: s.auth.user.id)
+        self.assertTrue(unchanged)
+        self.assertIsNone(response.session_pickled)
+
+    def test_logged_in_request_is_not_pickled(self):
+        from gluon.authapi import AuthAPI
+
+        user = Row(id=1, first_name="x", email="x@example.com")
+        session_id = self._store(
+            auth=Storage(
+                user=user,
+                last_visit=datetime.datetime.now(),
+                expiration=3600,
+                hmac_key="k",
+                remember_me=False,
+                user_groups={1: "user_1"},
+            )
+        )
+
+        def request(session):
+            from gluon.globals import current
+
+            current.T = lambda message: message
+            auth = AuthAPI(DAL("sqlite:memory"))
+            self.assertEqual(auth.user.first_name, "x")
+            return auth
+
+        unchanged, response = self._unchanged(session_id, request)
+        self.assertTrue(unchanged)
+        self.assertIsNone(response.session_pickled)
+        # changes made through auth.user are detected
+        unchanged, response = self._unchanged(
+            session_id, lambda s: request(s).user.update(first_name="y")
+        )
+        self.assertFalse(unchanged)
+
+    def test_unknown_objects_are_pickled(self):
+        session_id = self._store(cart=[Storage(id=1)], blob=bytearray(b"x"))
+        unchanged, response = self._unchanged(session_id, lambda s: s.cart)
+        self.assertTrue(unchanged)
+        self.assertIsNone(response.session_pickled)
+        unchanged, response = self._unchanged(session_id, lambda s: s.blob)
+        self.assertTrue(unchanged)
+        self.assertTrue(response.session_pickled)
+        unchanged, response = self._unchanged(session_id, lambda s: list(s.items()))
+        self.assertTrue(response.session_pickled)
+
+    def test_flags_unchanged(self):
+        session_id = self._store(user="x", _secure=True)
+        request, response, session = self._connect(session_id)
+        session.secure()
+        self.assertEqual(session.user, "x")
+        session.secure()
+        self.assertTrue(session._unchanged(response))
+        session._unlock(response)
+
+    def test_flag_set_before_loading(self):
+        session_id = self._store(user="x")
+        request, response, session = self._connect(session_id)
+        session.samesite("Strict")
+        self.assertEqual(session.user, "x")
+        self.assertFalse(session._unchanged(response))
+        session._unlock(response)
+
+
+class testSharedLockSession(SessionTestCase):
+    """file sessions locked only while read and written"""
+
+    def test_not_locked_after_loading(self):
+        session_id = self._store(user="x")
+        _, response, session = self._connect(session_id, shared_lock=True)
+        self.assertEqual(session.user, "x")
+        self.assertFalse(response.session_file)
+        self.assertFalse(response.session_locked)
+
+    def test_concurrent_changes_are_merged(self):
+        session_id = self._store(user="x", a=1, b=1, c=1)
+        request1, response1, session1 = self._connect(session_id, shared_lock=True)
+        request2, response2, session2 = self._connect(session_id, shared_lock=True)
+        session1.a, session2.b = 2, 2
+        del session2.c
+        self.assertTrue(session2._try_store_in_cookie_or_file(request2, response2))
+        self.assertTrue(session1._try_store_in_cookie_or_file(request1, response1))
+        self.assertEqual(dict(session1), dict(user="x", a=2, b=2))
+        _, response, session = self._connect(session_id)
+        self.assertEqual(dict(session), dict(user="x", a=2, b=2))
+        session._unlock(response)
+
+    def test_new_session(self):
+        request, response, session = self._connect(shared_lock=True)
+        session.user = "x"
+        self.assertTrue(session._try_store_in_cookie_or_file(request, response))
+        _, _, session = self._connect(response.session_id, shared_lock=True)
+        self.assertEqual(session.user, "x")
+
+
+class testShardedDbSession(SessionTestCase):
+    """db sessions partitioned across tables, with an expiry timestamp"""
+
+    lazy = True
+
+    def setUp(self):
+        SessionTestCase.setUp(self)
+        self.db = DAL("sqlite:memory")
+
+    def _store(self, **kwargs):
+        request, response, session = self._connect(db=self.db, shards=4)
+        session.update(kwargs)
+        session._try_store_in_db(request, response)
+        return response.session_id
+
+    def test_sessions_are_sharded(self):
+        session_ids = [self._store(n=n) for n in range(20)]
+        tables = [name for name in self.db.tables if name.startswith("web2py_session_a")]
+        self.assertEqual(len(tables), 4)
+        counts = [self.db(self.db["web2py_session_a_%s" % i]).count() for i in range(4)]
+        self.assertEqual(sum(counts), 20)
+        self.assertGreater(min(counts), 0)
+        for n, session_id in enumerate(session_ids):
+            _, response, session = self._connect(session_id, db=self.db, shards=4)
+            self.assertEqual(session.n, n)
+            self.assertFalse(response.session_new)
+
+    def test_expired_session_is_not_loaded(self):
+        session_id = self._store(user="x")
+        request, response, session = self._connect(session_id, db=self.db, shards=4)
+        request.now += datetime.timedelta(days=2)
+        self.assertIsNone(session.user)
+        self.assertTrue(response.session_new)
+
+    def test_unchanged_session_expiry_is_postponed(self):
+        session_id = self._store(user="x")
+        request, response, session = self._connect(session_id, db=self.db, shards=4)
+        self.assertEqual(session.user, "x")
+        expires = response.session_db_expires
+        request.now += datetime.timedelta(hours=20)
+        self.assertFalse(session._try_store_in_db(request, response))
+        row = response.session_db_table(response.session_db_record_id)
+        self.assertGreater(row.expires_datetime, expires)
+
+    def test_renew(self):
+        session_id = self._store(user="x")
+        request, response, session = self._connect(session_id, db=self.db, shards=4)
+        session.renew()
+        session._try_store_in_db(request, response)
+        self.assertNotEqual(response.session_id, session_id)
+        _, _, session = self._connect(response.session_id, db=self.db, shards=4)
+        self.assertEqual(session.user, "x")
+        _, _, session = self._connect(session_id, db=self.db, shards=4)
+        self.assertIsNone(session.user)
+
+    def test_expiry_index_created_with_the_table(self):
+        from gluon import globals as gluon_globals
+
+        folder = os.path.join(self.tmpdir, "databases")
+        os.mkdir(folder)
+        uri = "sqlite://storage.sqlite"
+        indexes = "SELECT name FROM sqlite_master WHERE type = 'index'"
+        db = DAL(uri, folder=folder)
+        self._connect(db=db, shards=2)
+        names = [row[0] for row in db.executesql(indexes)]
+        self.assertIn("web2py_session_a_0_expires", names)
+        self.assertIn("web2py_session_a_1_expires", names)
+        db.close()
+        # another process: the tables exist, the schema is not touched
+        for filename in os.listdir(folder):
+            os.utime(os.path.join(folder, filename), (1000, 1000))
+        gluon_globals.SESSION_INDEXES.clear()
+        db = DAL(uri, folder=folder)
+        with mock.patch("pydal.objects.Table.create_index") as create_index:
+            self._connect(db=db, shards=2)
+        self.assertFalse(create_index.called)
+        db.close()
+
+    def test_trash_expired(self):
+        for n in range(7):
+            self._store(n=n)
+        _, response, session = self._connect(db=self.db, shards=4)
+        now = datetime.datetime.now() + datetime.timedelta(days=2)
+        self.assertEqual(session.trash_expired(response, batch_size=2), 0)
+        self.assertEqual(session.trash_expired(response, batch_size=2, now=now), 7)
+        self.assertEqual(session.trash_expired(response, now=now), 0)
+
+
+class FakeRedis(object):
+    """the subset of a redis connection used by the sessions"""
+
+    def __init__(self):
+        self.data, self.expires, self.calls = {}, {}, []
+
+    def get(self, key):
+        self.calls.append("get")
+        return self.data.get(key)
+
+    def ttl(self, key):
+        self.calls.append("ttl")
+        if key not in self.data:
+            return -2
+        return self.expires.get(key, -1)
+
+    def set(self, key, value, ex=None):
+        self.calls.append("set")
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ex:
+            self.expires[key] = ex
+        return True
+
+    def expire(self, key, seconds):
+        self.calls.append("expire")
+        self.expires[key] = seconds
+        return key in self.data
+
+    def delete(self, key):
+        self.calls.append("delete")
+        self.expires.pop(key, None)
+        return int(self.data.pop(key, None) is not None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+    def __init__(self, redis):
+        self.redis, self.commands = redis, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        self.redis.calls.append("execute")
+        results = [getattr(self.redis, n)(*a, **k) for n, a, k in self.commands]
+        self.commands = []
+        return results
+
+
+class testRedisSession(SessionTestCase):
+    """sessions stored in redis"""
+
+    lazy = True
+
+    def setUp(self):
+        SessionTestCase.setUp(self)
+        self.redis = FakeRedis()
+
+    def _store(self, **kwargs):
+        request, response, session = self._connect(redis_conn=self.redis, **kwargs)
+        session.update(user="x")
+        self.assertTrue(session._try_store_in_db(request, response))
+        return response.session_id
+
+    def test_store_and_load(self):
+        session_id = self._store()
+        key = "w2p:session:a:%s" % session_id
+        self.assertEqual(self.redis.expires[key], 86400)
+        self.redis.calls = []
+        request, response, session = self._connect(session_id, redis_conn=self.redis)
+        self.assertEqual(self.redis.calls, [])
+        self.assertEqual(session.user, "x")
+        self.assertEqual(self.redis.calls, ["execute", "get", "ttl"])
+        self.assertFalse(session._try_store_in_db(request, response))
+        self.assertEqual(self.redis.calls, ["execute", "get", "ttl"])
+        session.user = "y"
+        self.assertTrue(session._try_store_in_db(request, response))
+        self.assertEqual(response.cookies["session_id_a"].value, session_id)
+        _, _, session = self._connect(session_id, redis_conn=self.redis)
+        self.assertEqual(session.user, "y")
+
+    def test_compression(self):
+        session_id = self._store(compression_level=9)
+        data = self.redis.data["w2p:session:a:%s" % session_id]
+        self.assertEqual(pickle.loads(zlib.decompress(data)), dict(user="x"))
+        _, _, session = self._connect(
+            session_id, redis_conn=self.redis, compression_level=9
+        )
+        self.assertEqual(session.user, "x")
+
+    def test_expiry_postponed(self):
+        session_id = self._store(expiration=100)
+        key = "w2p:session:a:%s" % session_id
+        self.redis.expires[key] = 30
+        request, response, session = self._connect(
+            session_id, redis_conn=self.redis, expiration=100
+        )
+        self.assertEqual(session.user, "x")
+        self.assertFalse(session._try_store_in_db(request, response))
+        self.assertEqual(self.redis.expires[key], 100)
+
+    def test_missing_session(self):
+        _, response, session = self._connect("127.0.0.1-missing", redis_conn=self.redis)
+        self.assertIsNone(session.user)
+        self.assertTrue(response.session_new)
+        self.assertNotEqual(response.session_id, "127.0.0.1-missing")
+
+    def test_renew_and_clear(self):
+        session_id = self._store()
+        request, response, session = self._connect(session_id, redis_conn=self.redis)
+        session.renew()
+        self.assertNotEqual(response.session_id, session_id)
+        self.assertTrue(session._try_store_in_db(request, response))
+        self.assertEqual(
+            list(self.redis.data), ["w2p:session:a:%s" % response.session_id]
+        )
+        session.clear()
+        self.assertEqual(self.redis.data, {})
+
+
 class testFileUpload(unittest.TestCase):
     BOUNDARY = b"testboundary"
 
@@ -863,6 +1435,48 @@ class testFileUpload(unittest.TestCase):
         self.assertEqual(r.post_vars["description"], "my description")
         self.assertEqual(r.post_vars["upload"].filename, "report.pdf")
 
+    def test_large_file_upload_is_not_copied(self):
+        content = b"x" * (2**17)
+        body = self._build_multipart(
+            fields={"description": "big"}, files={"upload": ("big.bin", content)}
+        )
+        r = self._make_request(body)
+        upload = r.post_vars["upload"]
+        self.addCleanup(upload.file.close)
+        # spooled to a temporary file by the parser, not read into memory
+        self.assertNotIsInstance(upload.file, BytesIO)
+        self.assertEqual(upload.file.read(), content)
+
+    def test_stream_uploads(self):
+        content = b"x" * (2**17)
+        body = self._build_multipart(
+            fields={"description": "big"}, files={"upload": ("big.bin", content)}
+        )
+        r = self._make_request(body)
+        r.stream_uploads = True
+        self.assertEqual(r.post_vars["description"], "big")
+        upload = r.post_vars["upload"]
+        self.addCleanup(upload.file.close)
+        self.assertEqual(upload.file.read(), content)
+        # the input was parsed without being copied to request.body
+        self.assertEqual(r.env["wsgi.input"].read(), b"")
+        self.assertEqual(r.body.read(), b"")
+
+    def test_stream_uploads_progress(self):
+        body = self._build_multipart(files={"upload": ("a.txt", b"hello")})
+        r = self._make_request(body)
+        r.application = "progress"
+        r.env.query_string = "X-Progress-ID=p1"
+        r.stream_uploads = True
+        with mock.patch.object(CacheInRam, "increment") as increment:
+            upload = r.post_vars["upload"]
+        self.addCleanup(upload.file.close)
+        self.assertEqual(upload.file.read(), b"hello")
+        self.assertEqual(sum(c.args[1] for c in increment.call_args_list), len(body))
+        cache = CacheInRam(r)
+        # the progress is deleted once the whole input is read
+        self.assertEqual(cache("X-Progress-ID:p1:length", lambda: 0, None), 0)
+
     def test_duplicate_field_names_become_list(self):
         boundary = self.BOUNDARY
         body = (
@@ -19,9 +19,10 @@ from gluon.html import (ASSIGNJS, BEAUTIFY, BODY, BR, BUTTON, CAT, CENTER,
                         SPAN, STRONG, STYLE, TABLE, TAG, TBODY, TD, TEXTAREA,
                         TFOOT, TH, THEAD, TITLE, TR, TT, UL, URL, XHTML, XML,
                         A, B, I, P, SAFEJSON, SafeString, TAG_pickler, TAG_unpickler, XML_pickle,
-                        XML_unpickle, truncate_string, verifyURL,
-                        web2pyHTMLParser, xmlescape)
+                        XML_unpickle, truncate_string, url_signature,
+                        verifyURL, web2pyHTMLParser, xmlescape)
 from gluon.storage import Storage
+from gluon.validators import simple_hash
 from gluon.globals import current, Request, Response
 
 
@@ -257,10 +258,36 @@ class TestBareHelpers(unittest.TestCase):
         # emulate user signature
         from gluon.globals import current
 
+        from gluon.html import url_signers
+
         current.session = Storage(auth=Storage(hmac_key="key"))
         r.get_vars["_signature"] = "a32530f0d0caa80964bb92aad2bedf8a4486a31f"
+        url_signers.clear()
         rtn = verifyURL(r, user_signature=True)
         self.assertEqual(rtn, True)
+        # per-user keys are not cached
+        self.assertEqual(url_signers, {})
+
+    def test_url_signature(self):
+        message = "/a/c/f.html/x/y/z?p=1&p=3&q=2"
+        self.assertEqual(
+            url_signature(message, "key"), "a32530f0d0caa80964bb92aad2bedf8a4486a31f"
+        )
+        for key, salt in (("key", ""), ("key", "salt"), ("other", "salt")):
+            for i in range(2):
+                self.assertEqual(
+                    url_signature(message, key, salt),
+                    simple_hash(message, key, salt, digest_alg="sha1"),
+                )
+        # per-user keys are not kept
+        from gluon.html import url_signers
+
+        url_signers.clear()
+        self.assertEqual(
+            url_signature(message, "user key", cache=False),
+            simple_hash(message, "user key", digest_alg="sha1"),
+        )
+        self.assertEqual(url_signers, {})
 
     # TODO: def test_XmlComponent(self):
 
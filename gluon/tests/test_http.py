@@ -6,7 +6,14 @@
 import unittest
 
 from gluon.globals import current
-from gluon.http import HTTP, content_disposition_header, defined_status, redirect
+from gluon.http import (
+    HTTP,
+    content_disposition_header,
+    defined_status,
+    etag,
+    etag_matches,
+    redirect,
+)
 from gluon.storage import Storage
 
 
@@ -40,6 +47,35 @@ class TestHTTP(unittest.TestCase):
         # test wrong call detection
 
 
+class TestETag(unittest.TestCase):
+    """Tests ETag helpers and HTTP.revalidate"""
+
+    def test_etag_matches(self):
+        tag = etag("hello")
+        self.assertEqual(tag, etag(b"hello"))
+        self.assertTrue(tag.startswith('"') and tag.endswith('"'))
+        self.assertNotEqual(tag, etag("hello!"))
+        self.assertTrue(etag_matches(tag, tag))
+        self.assertTrue(etag_matches('"a", W/%s' % tag, tag))
+        self.assertTrue(etag_matches("*", tag))
+        self.assertFalse(etag_matches('"a"', tag))
+        self.assertFalse(etag_matches(None, tag))
+
+    def test_revalidate(self):
+        http = HTTP(200, "hello").revalidate(None)
+        self.assertEqual(http.status, 200)
+        tag = http.headers["ETag"]
+        http = HTTP(200, "hello").revalidate(tag)
+        self.assertEqual((http.status, http.body), (304, ""))
+        self.assertEqual(http.headers["ETag"], tag)
+        # only string bodies of 200 responses
+        self.assertNotIn("ETag", HTTP(404, "hello").revalidate(tag).headers)
+        self.assertNotIn("ETag", HTTP(200, iter([b"a"])).revalidate(tag).headers)
+        # an ETag set by the action is kept
+        http = HTTP(200, "hello", ETag='"v1"').revalidate('"v1"')
+        self.assertEqual(http.status, 304)
+
+
 class TestContentDisposition(unittest.TestCase):
     """Tests http.content_disposition_header"""
 
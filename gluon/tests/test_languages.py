@@ -275,6 +275,138 @@ def index():
             self.assertTrue(key in pt_dict)
 
 
+class TestMessageTemplate(unittest.TestCase):
+    def test_parse_placeholder(self):
+        parse = languages.parse_placeholder
+        self.assertEqual(parse("{shop}"), ("tuple", "shop", None, "", None, None))
+        self.assertEqual(parse("{shop[1]}"), ("tuple", "shop", 1, "", None, None))
+        self.assertEqual(
+            parse("{!!!is(key)}"), ("dict", "is", "key", "!", str.upper, None)
+        )
+        self.assertEqual(
+            parse("{?one?other?zero(2)}"),
+            ("dict", "?one?other?zero", 2, "?", None, ("one", "other", "zero")),
+        )
+        self.assertEqual(parse("{a(b}"), None)
+
+    def setUp(self):
+        self.langpath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.langpath)
+
+    def test_substitute(self):
+        T = languages.TranslatorFactory(self.langpath, "en")
+        template = languages.MessageTemplate("%s %%{shop} %%{?one?%s} 100%%")
+        self.assertEqual(template.text, "%s %%{shop} %%{?one?%s} 100%%")
+        self.assertEqual(template.substitute(T, (1, 1)), "1 shop one 100%")
+        self.assertEqual(template.substitute(T, (2, 5)), "2 shops 5 100%")
+        self.assertEqual(
+            sorted(template.placeholders), ["{?one?1}", "{?one?5}", "{shop}"]
+        )
+        # translated messages are compiled once
+        self.assertEqual(str(T("%s %%{shop}", 3)), "3 shops")
+        self.assertIsInstance(T.cache[0]["%s %%{shop}"], languages.MessageTemplate)
+
+    def test_params_substitution_override(self):
+        class Translator(languages.TranslatorFactory):
+            def params_substitution(self, message, symbols):
+                return "<%s>" % (message % symbols)
+
+        T = Translator(self.langpath, "en")
+        self.assertEqual(str(T("%s %%{shop}", 3)), "<3 %{shop}>")
+        self.assertEqual(T("%s apples", 3, lazy=False), "<3 apples>")
+
+
+class TestLanguageWriter(unittest.TestCase):
+    def setUp(self):
+        self.langpath = tempfile.mkdtemp()
+        self.filename = os.path.join(self.langpath, "it.py")
+        languages.write_dict(self.filename, {"Hello World": "Salve Mondo"})
+
+    def tearDown(self):
+        languages.language_writer.enabled = True
+        shutil.rmtree(self.langpath)
+
+    def test_merge(self):
+        writer = languages.LanguageWriter(interval=3600)
+        writer.add(self.filename, "a", "a")
+        writer.add(self.filename, "b", "b")
+        # written by another process in the meantime
+        languages.write_dict(self.filename, {"Hello World": "Ciao Mondo", "b": "bi"})
+        self.assertEqual(
+            languages.read_dict_aux(self.filename)["Hello World"], "Ciao Mondo"
+        )
+        writer.flush()
+        self.assertEqual(writer.pending, {})
+        self.assertEqual(
+            languages.read_dict_aux(self.filename),
+            {"Hello World": "Ciao Mondo", "a": "a", "b": "bi"},
+        )
+        writer.enabled = False
+        writer.add(self.filename, "c", "c")
+        self.assertEqual(writer.pending, {})
+
+    def test_background(self):
+        writer = languages.LanguageWriter(interval=0.01)
+        writer.add(self.filename, "a", "a")
+        writer.thread.join(5)
+        self.assertIsNone(writer.thread)
+        self.assertIn("a", languages.read_dict_aux(self.filename))
+
+    def test_get_t(self):
+        T = languages.TranslatorFactory(self.langpath, "it")
+        self.assertEqual(str(T("Hello World")), "Salve Mondo")
+        self.assertEqual(str(T("new message")), "new message")
+        self.assertNotIn("new message", languages.read_dict_aux(self.filename))
+        languages.language_writer.flush()
+        self.assertIn("new message", languages.read_dict_aux(self.filename))
+        # production
+        languages.language_writer.enabled = False
+        self.assertEqual(str(T("other message")), "other message")
+        languages.language_writer.flush()
+        self.assertNotIn("other message", languages.read_dict_aux(self.filename))
+
+
+class TestLanguageCatalog(unittest.TestCase):
+    def setUp(self):
+        self.langpath = tempfile.mkdtemp()
+        for lang in ("it", "pt-br"):
+            languages.write_dict(
+                os.path.join(self.langpath, lang + ".py"), {"!langcode!": lang}
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.langpath)
+
+    def test_negotiate(self):
+        for accept_language, accepted in (
+            ("it-IT,it;q=0.9,en;q=0.8", "it"),
+            ("pt-PT,it;q=0.5", "pt-br"),
+            ("en", "en"),
+            ("de", "en"),
+            ("", "en"),
+        ):
+            T = languages.TranslatorFactory(self.langpath, accept_language)
+            self.assertEqual(T.accepted_language, accepted)
+            T = languages.TranslatorFactory(self.langpath, accept_language)
+            self.assertEqual(T.accepted_language, accepted)
+        catalog = languages.get_catalog(self.langpath)
+        self.assertIn(("pt-PT,it;q=0.5", ("en",)), catalog.accepted)
+        self.assertEqual(catalog.plural("it")[2:4], ("it", 2))
+        self.assertEqual(catalog.plural("xx")[2:4], ("default", 1))
+        T.force("it")
+        self.assertEqual(T.accepted_language, "it")
+        self.assertEqual(T.requested_languages, ("it",))
+        T.force(None)
+        self.assertEqual(T.accepted_language, "en")
+        # a new language file gives a new catalog
+        languages.write_dict(os.path.join(self.langpath, "de.py"), {})
+        self.assertIsNot(languages.get_catalog(self.langpath), catalog)
+        T = languages.TranslatorFactory(self.langpath, "de")
+        self.assertEqual(T.accepted_language, "de")
+
+
 class TestMessages(unittest.TestCase):
     def setUp(self):
         if os.path.isdir("gluon"):
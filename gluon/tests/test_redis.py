@@ -129,3 +129,16 @@ class TestRedis(unittest.TestCase):
 
         empty_sessions = db(table.id > 0).select()
         self.assertEqual(empty_sessions, [], "no sessions left")
+
+    def test_2_redis_cache_tags(self):
+        """Redis cache invalidation by tag"""
+        cache = RedisCache(redis_conn=RConn(host="localhost"), application="tags")
+        self.assertEqual(cache("a", lambda: 1, 100), 1)
+        self.assertEqual(cache("b", lambda: 2, 100), 2)
+        cache.tag("a", "t")
+        self.assertEqual(cache.invalidate("t"), ["a"])
+        self.assertEqual(cache("a", lambda: 3, 100), 3)
+        self.assertEqual(cache("b", lambda: 4, 100), 2)
+        self.assertEqual(cache.invalidate("t"), [])
+        cache("a", None)
+        cache("b", None)
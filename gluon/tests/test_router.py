@@ -10,8 +10,9 @@ import unittest
 
 from gluon.html import URL
 from gluon.http import HTTP
-from gluon.rewrite import (filter_err, filter_url, get_effective_router, load,
-                           map_url_out)
+from gluon.rewrite import (MapUrlOut, filter_err, filter_url,
+                           get_effective_router, load, map_url_out,
+                           url_out_cache)
 from gluon.settings import global_settings
 from gluon.storage import Storage
 
@@ -2328,3 +2329,78 @@ class TestRouter(unittest.TestCase):
             ),
             "/welcome/admin",
         )
+
+    def test_router_out_cache(self):
+        """
+        Test that memoized outgoing a/c/f match the uncached ones
+        """
+        router_cache = dict(
+            BASE=dict(
+                applications=["init", "app", "app2"],
+                default_application="app",
+                domains={"app2.com": "app2"},
+            ),
+            app=dict(
+                controllers=["default", "ctr"],
+                functions=dict(
+                    default=["index", "user", "help"],
+                    ctr=["ctrf1", "ctrf2", "ctrf3"],
+                ),
+                default_function=dict(default="index", ctr="ctrf1"),
+                languages=["en", "it"],
+                default_language="en",
+            ),
+            app2=dict(controllers=["default"]),
+            init=dict(),
+        )
+        load(rdict=router_cache)
+        requests = [
+            None,
+            Storage(env=Storage(), uri_language="it"),
+            Storage(env=Storage(domain_application="app2"), uri_language=None),
+        ]
+        args_list = [
+            None,
+            [],
+            [""],
+            ["1"],
+            [1],
+            ["user"],
+            ["ctr"],
+            ["app2"],
+            ["index", "x"],
+        ]
+        for request in requests:
+            for a, c, f in [
+                ("app", "default", "index"),
+                ("app", "default", "user"),
+                ("app", "ctr", "ctrf1"),
+                ("app2", "default", "index"),
+                ("init", "default", "f"),
+            ]:
+                for args in args_list:
+                    for language in (None, "it"):
+                        expected = MapUrlOut(
+                            request, None, a, c, f, args, "", None, None, None, language
+                        ).acf()
+                        for i in range(2):
+                            self.assertEqual(
+                                map_url_out(
+                                    request,
+                                    None,
+                                    a,
+                                    c,
+                                    f,
+                                    args,
+                                    "",
+                                    None,
+                                    None,
+                                    None,
+                                    language,
+                                ),
+                                expected,
+                                (request, a, c, f, args, language),
+                            )
+        self.assertTrue(url_out_cache)
+        load(rdict=router_cache)
+        self.assertFalse(url_out_cache)
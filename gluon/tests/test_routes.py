@@ -3,6 +3,7 @@
 """Unit tests for rewrite.py regex routing option"""
 
 import os
+import re
 import shutil
 import tempfile
 import unittest
@@ -10,10 +11,13 @@ import unittest
 from gluon.html import URL
 from gluon.http import HTTP
 from gluon.rewrite import (
+    RouteTable,
+    compile_regex,
     filter_err,
     filter_url,
     load,
     regex_filter_out,
+    route_prefix,
     try_redirect_on_error,
 )
 from gluon.settings import global_settings
@@ -551,3 +555,76 @@ routes_out = [
             )
         finally:
             shutil.rmtree(sibling)
+
+    def test_route_prefix(self):
+        def prefix(k):
+            return route_prefix(compile_regex(k, "/x")[0])
+
+        self.assertEqual(prefix("/welcome/$anything"), "/welcome/")
+        self.assertEqual(prefix(r"/abc/(?P<x>\w+)"), "/abc/")
+        self.assertEqual(prefix("/ab*"), "/a")
+        self.assertEqual(prefix(r".*:/x\.y"), "/x.y")
+        self.assertEqual(prefix(r"^.*?:https?://[^:/]+:[a-z]+ /x/y$"), "/x/y")
+        self.assertEqual(prefix("/"), "/")
+        self.assertEqual(prefix("/a|/b"), None)
+        regex = compile_regex("/abc", "/x")[0]
+        self.assertEqual(route_prefix(re.compile(regex.pattern, re.I)), None)
+
+    def test_route_table(self):
+        """RouteTable.match returns the same route as a linear scan"""
+        patterns = [
+            "/favicon.ico",
+            "/robots.txt",
+            "/a|/b",
+            "/(abc|ABC)/$anything",
+            "/app/static/$anything",
+            "/app/$c/$f",
+            "/app/default/$anything",
+            "/app",
+            "/$c/$f",
+            r".*:https://[^:/]+:[a-z]+ /secure/$anything",
+            r"127\.0\.0\.1:https?://[^:/]+:post /app/$anything",
+            "/a b/$anything",
+            "/$anything",
+        ]
+        routes = [compile_regex(k, "/%s" % i) for i, k in enumerate(patterns)]
+        table = RouteTable(routes)
+        paths = [
+            "/",
+            "/a",
+            "/b",
+            "/abc/x",
+            "/ABC/x",
+            "/app",
+            "/app/",
+            "/app/static/js/x.js",
+            "/app/default/index",
+            "/app/default/index/1",
+            "/app/x/y",
+            "/favicon.ico",
+            "/robots.txt",
+            "/robotsXtxt",
+            "/secure/x",
+            "/a b/c",
+            "/x/y",
+            "",
+        ]
+        hosts = [
+            "127.0.0.1:http://domain.com:get",
+            "127.0.0.1:https://domain.com:post",
+            "10.0.0.1:https://domain.com:get",
+        ]
+        for host in hosts:
+            for path in paths:
+                key = "%s %s" % (host, path)
+                linear = None
+                for route in routes:
+                    if route[0].match(key):
+                        linear = route
+                        break
+                self.assertIs(table.match(key), linear, key)
+        # appending invalidates the trie
+        table = RouteTable()
+        self.assertEqual(table.match("127.0.0.1:http://domain.com:get /app"), None)
+        table.append(compile_regex("/app", "/x"))
+        self.assertEqual(table.match("127.0.0.1:http://domain.com:get /app")[1], "/x")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+## launch with python scripts/benchmark_routes.py [number of routes]
+## times the lookup of regex routes through the prefix trie of
+## gluon.rewrite.RouteTable against trying every route in turn
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gluon.rewrite import RouteTable, compile_regex
+
+
+def linear_match(routes, key):
+    for route in routes:
+        if route[0].match(key):
+            return route
+    return None
+
+
+def benchmark(n=300, number=2000):
+    routes = []
+    for i in range(n):
+        routes.append(compile_regex("/app%s/$c/$f" % i, "/app/%s/\\1" % i))
+        routes.append(compile_regex("/static%s/$anything" % i, "/app/static/%s" % i))
+    routes.append(compile_regex("/$anything", "/app/default/index"))
+    table = RouteTable(routes)
+    host = "127.0.0.1:http://domain.com:get"
+    keys = [
+        "%s /app0/default/index" % host,
+        "%s /app%s/default/index" % (host, n // 2),
+        "%s /static%s/js/x.js" % (host, n - 1),
+        "%s /nowhere" % host,
+    ]
+    for key in keys:
+        assert table.match(key) is linear_match(routes, key)
+    print("%s routes" % len(routes))
+    for key in keys:
+        linear = timeit.timeit(lambda: linear_match(routes, key), number=number)
+        trie = timeit.timeit(lambda: table.match(key), number=number)
+        print(
+            "%-50s linear %8.2f us  trie %8.2f us"
+            % (
+                key.split(" ", 1)[1],
+                linear * 1e6 / number,
+                trie * 1e6 / number,
+            )
+        )
+
+
+if __name__ == "__main__":
+    benchmark(*[int(arg) for arg in sys.argv[1:2]])
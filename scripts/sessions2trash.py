@@ -34,6 +34,10 @@ NOTE: They should be preceeded by web2py command line option "-A" to be passed t
 -s, --sleep : Number of seconds to sleep between executions. Default 300.
 -v, --verbose : print verbose output, a second -v increases verbosity
 -x, --expiration : Expiration value for sessions without expiration (in seconds)
+
+Sessions stored in db with session.connect(..., shards=N) carry their own
+expiry timestamp: they are deleted in batches and the -f and -x options do not
+apply to them.
 """
 
 from __future__ import with_statement
@@ -107,6 +111,15 @@ class SessionSetDb(SessionSet):
     def __init__(self, expiration, force, verbose):
         SessionSet.__init__(self, expiration, force, verbose)
 
+    def trash(self):
+        """Trash expired sessions, in batches if sessions are sharded."""
+        if current.response.session_db_tables:
+            deleted = current.session.trash_expired()
+            if self.verbose > 0:
+                print("%s expired sessions trashed" % deleted)
+        else:
+            SessionSet.trash(self)
+
     def get(self):
         """Return list of SessionDb instances for existing sessions."""
         table = current.response.session_db_table
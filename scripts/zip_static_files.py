@@ -2,14 +2,18 @@
 # -*- coding: utf-8 -*-
 
 ## launch with python web2py.py -S myapp -R scripts/zip_static_files.py
+## writes .gz variants, plus .br and .zst ones if brotli and zstandard are
+## installed, which are served to the clients that accept them
 
 
 import os
-import gzip
+
+from gluon.streamer import PRECOMPRESSED, compressors, precompress
 
 
 def zip_static(filelist=[]):
     tsave = 0
+    encodings = sorted(compressors())
     for fi in filelist:
         extension = os.path.splitext(fi)
         extension = len(extension) > 1 and extension[1] or None
@@ -18,31 +22,29 @@ def zip_static(filelist=[]):
             continue
         fstats = os.stat(fi)
         atime, mtime = fstats.st_atime, fstats.st_mtime
-        gfi = fi + ".gz"
-        if os.path.isfile(gfi):
-            zstats = os.stat(gfi)
-            zatime, zmtime = zstats.st_atime, zstats.st_mtime
-            if zatime == atime and zmtime == mtime:
-                print(
-                    "skipping %s, already gzipped to the latest version"
-                    % os.path.basename(fi)
-                )
-                continue
-        print("gzipping %s to %s" % (os.path.basename(fi), os.path.basename(gfi)))
-        f_in = open(fi, "rb")
-        f_out = gzip.open(gfi, "wb")
-        f_out.writelines(f_in)
-        f_out.close()
-        f_in.close()
-        os.utime(gfi, (atime, mtime))
-        saved = fstats.st_size - os.stat(gfi).st_size
-        tsave += saved
+        todo = []
+        for encoding in encodings:
+            zfi = fi + PRECOMPRESSED[encoding]
+            if os.path.isfile(zfi):
+                zstats = os.stat(zfi)
+                zatime, zmtime = zstats.st_atime, zstats.st_mtime
+                if zatime == atime and zmtime == mtime:
+                    continue
+            todo.append(encoding)
+        if not todo:
+            print(
+                "skipping %s, already compressed to the latest version"
+                % os.path.basename(fi)
+            )
+            continue
+        print("compressing %s (%s)" % (os.path.basename(fi), ", ".join(todo)))
+        tsave += precompress(fi, todo)
 
     print("saved %s KB" % (int(tsave) / 1000.0))
 
 
 if __name__ == "__main__":
-    ALLOWED_EXTS = [".css", ".js"]
+    ALLOWED_EXTS = [".css", ".js", ".svg", ".html", ".json", ".map"]
     static_path = os.path.abspath(os.path.join(request.folder, "static"))
     filelist = []
     for root, dir, files in os.walk(static_path):